@@ -1,25 +1,44 @@
 import sys
 
 sys.dont_write_bytecode = True
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
 from src.config.constants import APIConfig
-from src.routes.api_routes import router
+from src.routes.api_routes import metrics_router, router
+from src.routes.middleware import timing_middleware
+from src.services.container import ServiceContainer
+from src.utils.logger import flush_logging
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared agent, store and services once per process
+    app.state.container = ServiceContainer()
+    await app.state.container.start()
+    try:
+        yield
+    finally:
+        await app.state.container.close()
+        flush_logging()
+
 # Initialize FastAPI app
 app = FastAPI(
     title=APIConfig.API_TITLE,
     description=APIConfig.API_DESCRIPTION,
-    version=APIConfig.API_VERSION
+    version=APIConfig.API_VERSION,
+    lifespan=lifespan
 )
 
 # Include routes
 app.include_router(router, prefix=APIConfig.API_PREFIX)
+app.include_router(metrics_router)
+app.middleware("http")(timing_middleware)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
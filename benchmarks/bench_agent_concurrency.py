@@ -0,0 +1,97 @@
+"""
+Benchmark concurrent image generation through AzureOpenAIChat.
+
+Runs the agent against the local stub server and reports throughput and the
+worst event-loop stall for several in-flight limits. With a non-blocking
+client, throughput scales with the limit and the loop stays responsive.
+
+Usage:
+    python -m benchmarks.bench_agent_concurrency --requests 32 --latency 0.25
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+
+def configure_environment(endpoint: str) -> None:
+    """
+    Point the Azure configuration at the stub server.
+
+    Semantic Kernel's Azure connectors refuse plain-http endpoints; the kernel
+    is only built on first use and none of the measured calls touch it.
+    """
+    os.environ.update({
+        "AZURE_OPENAI_API_KEY": "stub-key",
+        "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+        "AZURE_OPENAI_GPT4_DEPLOYMENT": "gpt-4",
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "embedding",
+        "AZURE_OPENAI_DALLE_DEPLOYMENT": "dall-e-3",
+    })
+
+
+async def _watch_loop_lag(interval: float, stop: asyncio.Event) -> float:
+    """Return the worst observed delay of a periodic timer on the loop."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run_case(concurrency: int, requests: int, output_dir: str) -> dict:
+    """Generate `requests` images with at most `concurrency` calls in flight."""
+    from src.utils.agent import AzureOpenAIChat
+
+    agent = AzureOpenAIChat(max_concurrency=concurrency)
+    prompt = "A serene mountain lake at sunset surrounded by pine trees"
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop_lag(0.01, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        agent.generate_image(prompt, save_path=os.path.join(output_dir, f"{concurrency}_{i}.png"))
+        for i in range(requests)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    max_lag = await watcher
+    await agent.close()
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "max_loop_lag_ms": round(max_lag * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.25)
+    parser.add_argument("--image-size", default="256x256")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    with StubAzureOpenAIServer(latency=args.latency, image_size=args.image_size) as server:
+        configure_environment(server.endpoint)
+        with tempfile.TemporaryDirectory() as output_dir:
+            print(f"{'concurrency':>11} {'elapsed_s':>10} {'rps':>8} {'max_lag_ms':>11}")
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_case(concurrency, args.requests, output_dir))
+                print(f"{result['concurrency']:>11} {result['elapsed_s']:>10} "
+                      f"{result['throughput_rps']:>8} {result['max_loop_lag_ms']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark of the FastAPI app against the local stub server.
+
+Every flow drives the real routes, services and store the way a reviewer
+does: POST /generate-prompts for a topic, then /generate-image and
+/approve-image for each new prompt. Flows run at a configurable concurrency
+while the stub injects latency, jitter and 429s. The report covers
+throughput, p50/p95/p99 latency per endpoint, retries and peak RSS, and can
+be saved as a baseline or compared against one to catch regressions.
+
+Usage:
+    python -m benchmarks.bench_app --flows 24 --concurrency 8
+    python -m benchmarks.bench_app --save-baseline
+    python -m benchmarks.bench_app --compare --fail-on-regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_agent_concurrency import configure_environment
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "baseline.json")
+ENDPOINTS = ("generate-prompts", "generate-image", "approve-image")
+
+
+async def _timed(client, samples: Dict[str, List[Tuple[float, int]]], endpoint: str, payload: Dict):
+    started = time.perf_counter()
+    response = await client.post(f"/api/v1/{endpoint}", json=payload)
+    samples[endpoint].append((time.perf_counter() - started, response.status_code))
+    return response
+
+
+async def _run_flow(client, samples, flow: int, prompts_per_flow: int) -> None:
+    """Generate prompts for one topic, then generate and approve an image for each."""
+    response = await _timed(client, samples, "generate-prompts",
+                            {"topic": f"benchmark topic {flow}", "num_prompts": prompts_per_flow})
+    if response.status_code != 200:
+        return
+    for prompt_id, info in response.json()["prompts"].items():
+        response = await _timed(client, samples, "generate-image",
+                                {"prompt_id": prompt_id, "prompt": info["prompt"]})
+        if response.status_code == 200:
+            await _timed(client, samples, "approve-image", {"prompt_id": prompt_id, "approved": True})
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "app": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+async def run_benchmark(flows: int, concurrency: int, prompts_per_flow: int, data_dir: str) -> Dict:
+    """Run `flows` reviewer flows against the app with at most `concurrency` at once."""
+    import httpx
+
+    from app import app
+    from src.services.container import ServiceContainer
+    from src.utils.metrics import API_RETRIES
+    from src.utils.path_manager import PathManager
+
+    container = ServiceContainer(path_manager=PathManager(data_dir))
+    await container.start()
+    app.state.container = container
+
+    samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    retries_before = API_RETRIES.total()
+
+    async def flow(index: int) -> None:
+        async with semaphore:
+            await _run_flow(client, samples, index, prompts_per_flow)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(index) for index in range(flows)))
+        elapsed = time.perf_counter() - started
+    await container.close()
+
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        latencies = np.array([seconds for seconds, _ in samples[endpoint]]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+        endpoints[endpoint] = {
+            "count": len(latencies),
+            "errors": sum(status != 200 for _, status in samples[endpoint]),
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1),
+        }
+
+    total_requests = sum(len(values) for values in samples.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "flows_per_s": round(flows / elapsed, 3),
+        "requests_per_s": round(total_requests / elapsed, 2),
+        "retries": int(API_RETRIES.total() - retries_before),
+        "peak_rss_mb": _peak_rss_mb(),
+        "endpoints": endpoints,
+    }
+
+
+def find_regressions(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List the numbers that are worse than the baseline by more than the tolerance."""
+    regressions = []
+    if result["requests_per_s"] < baseline["requests_per_s"] * (1 - tolerance):
+        regressions.append(f"requests_per_s {baseline['requests_per_s']} -> {result['requests_per_s']}")
+    for endpoint, stats in result["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if not before:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if stats[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{endpoint} {key} {before[key]} -> {stats[key]}")
+        if stats["errors"] > before["errors"]:
+            regressions.append(f"{endpoint} errors {before['errors']} -> {stats['errors']}")
+    if result["peak_rss_mb"]["app"] > baseline["peak_rss_mb"]["app"] * (1 + tolerance):
+        regressions.append(f"peak_rss_mb {baseline['peak_rss_mb']['app']} -> {result['peak_rss_mb']['app']}")
+    return regressions
+
+
+def print_report(result: Dict, baseline: Dict = None) -> None:
+    print(f"{result['flows_per_s']} flows/s, {result['requests_per_s']} requests/s in {result['elapsed_s']}s, "
+          f"{result['retries']} retries, peak RSS {result['peak_rss_mb']['app']} MB "
+          f"(workers {result['peak_rss_mb']['workers']} MB)")
+    print(f"{'endpoint':>17} {'count':>6} {'errors':>6} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:>17} {stats['count']:>6} {stats['errors']:>6} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+        before = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if before:
+            print(f"{'baseline':>17} {before['count']:>6} {before['errors']:>6} "
+                  f"{before['p50_ms']:>9} {before['p95_ms']:>9} {before['p99_ms']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--prompts-per-flow", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random seconds per model call")
+    parser.add_argument("--throttle-rate", type=float, default=0.05, help="Fraction of model calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--image-size", default="1024x1024")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare this run with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    config = {
+        "flows": args.flows,
+        "concurrency": args.concurrency,
+        "prompts_per_flow": args.prompts_per_flow,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "throttle_rate": args.throttle_rate,
+        "retry_after": args.retry_after,
+        "image_size": args.image_size,
+        "seed": args.seed,
+    }
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with StubAzureOpenAIServer(latency=args.latency, image_size=args.image_size, latency_jitter=args.jitter,
+                               throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+                               seed=args.seed) as server:
+        configure_environment(server.endpoint)
+        with tempfile.TemporaryDirectory() as data_dir:
+            result = asyncio.run(run_benchmark(args.flows, args.concurrency, args.prompts_per_flow, data_dir))
+        result["stub"] = {"requests": server.requests, "throttled": server.throttled}
+
+    baseline = None
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"Warning: baseline was recorded with a different configuration: {baseline['config']}")
+    print_report(result, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+                "config": config,
+                **result,
+            }, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+
+    if baseline:
+        regressions = find_regressions(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
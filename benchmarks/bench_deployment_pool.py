@@ -0,0 +1,85 @@
+"""
+Benchmark image generation across a pool of DALL-E deployments.
+
+Every deployment is a stub server held to the same requests-per-minute quota,
+so one deployment caps throughput at that quota and each added deployment
+raises the cap. The last case adds a deployment that answers every call with
+a 429, which the pool must route around without losing throughput.
+
+Usage:
+    python -m benchmarks.bench_deployment_pool --requests 40 --rpm 600
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_agent_concurrency import configure_environment
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+
+async def run_case(servers, throttled_servers, rpm: float, requests: int, output_dir: str) -> dict:
+    """Generate `requests` images through a pool of one images deployment per server."""
+    from src.utils.agent import AzureOpenAIChat
+    from src.utils.deployment_pool import Deployment, load_deployments
+
+    deployments = load_deployments()
+    deployments["images"] = [
+        Deployment("images", "dall-e-3", server.endpoint, "stub-key", name=f"region-{i}/dall-e-3", rpm=rpm)
+        for i, server in enumerate(throttled_servers + servers)
+    ]
+    agent = AzureOpenAIChat(max_concurrency=64, deployments=deployments)
+    prompt = "A serene mountain lake at sunset surrounded by pine trees"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        agent.generate_image(prompt, save_path=os.path.join(output_dir, f"{len(servers)}_{i}.png"))
+        for i in range(requests)
+    ))
+    elapsed = time.perf_counter() - started
+    stats = agent.resilience_stats()["images"]
+    await agent.close()
+
+    return {
+        "deployments": f"{len(servers)}+{len(throttled_servers)} throttled" if throttled_servers else str(len(servers)),
+        "elapsed_s": round(elapsed, 3),
+        "images_per_min": round(requests / elapsed * 60, 1),
+        "failovers": stats["failovers"],
+        "calls": " ".join(str(d["successes"]) for d in stats["deployments"]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--rpm", type=float, default=600, help="Quota of each deployment")
+    parser.add_argument("--latency", type=float, default=0.25)
+    parser.add_argument("--image-size", default="256x256")
+    parser.add_argument("--deployments", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with ExitStack() as stack, tempfile.TemporaryDirectory() as output_dir:
+        servers = [
+            stack.enter_context(StubAzureOpenAIServer(latency=args.latency, image_size=args.image_size))
+            for _ in range(max(args.deployments))
+        ]
+        throttled = stack.enter_context(StubAzureOpenAIServer(throttle_rate=1.0, retry_after=5))
+        configure_environment(servers[0].endpoint)
+
+        cases = [(servers[:n], []) for n in args.deployments]
+        cases.append((servers[:max(args.deployments)], [throttled]))
+        print(f"{'deployments':>16} {'elapsed_s':>10} {'images/min':>11} {'failovers':>10}  successes")
+        for pool, throttled_pool in cases:
+            result = asyncio.run(run_case(pool, throttled_pool, args.rpm, args.requests, output_dir))
+            print(f"{result['deployments']:>16} {result['elapsed_s']:>10} {result['images_per_min']:>11} "
+                  f"{result['failovers']:>10}  {result['calls']}")
+
+
+if __name__ == "__main__":
+    main()
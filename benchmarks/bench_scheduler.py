@@ -0,0 +1,94 @@
+"""
+Benchmark interactive latency while a bulk backfill saturates the agent.
+
+Interactive prompt generations arrive at a steady rate, alone and then next
+to a backlog of bulk image generations far larger than the agent's in-flight
+limit. With the scheduler the backlog waits behind the interactive calls and
+leaves their reserved slots free, so interactive p95 stays close to the idle
+case. The "fifo" case puts both in one class and flow, so calls are
+admitted in arrival order as with a plain semaphore.
+
+Usage:
+    python -m benchmarks.bench_scheduler --bulk 200 --interactive 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_agent_concurrency import configure_environment
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_case(name: str, bulk: int, interactive: int, interval: float, concurrency: int,
+                   output_dir: str) -> dict:
+    """Time `interactive` prompt generations, one every `interval` seconds, next to `bulk` image generations."""
+    from src.utils.agent import AzureOpenAIChat
+    from src.utils.scheduler import BULK, INTERACTIVE, scheduling
+
+    agent = AzureOpenAIChat(max_concurrency=concurrency)
+    bulk_class, bulk_flow = (INTERACTIVE, "topic:review") if name == "fifo" else (BULK, "topic:backfill")
+    # The whole backlog queues at once, beyond what admission control allows a client
+    agent.scheduler.max_queued = {}
+
+    async def backfill(i: int) -> None:
+        with scheduling(bulk_class, bulk_flow):
+            await agent.generate_image("A lighthouse in a storm", save_path=os.path.join(output_dir, f"{name}_{i}.png"))
+
+    async def interactive_call() -> float:
+        started = time.perf_counter()
+        with scheduling(INTERACTIVE, "topic:review"):
+            await agent.generate_prompts("mountain lakes", 3)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    backlog = [asyncio.create_task(backfill(i)) for i in range(bulk if name != "idle" else 0)]
+    await asyncio.sleep(interval)
+    calls = []
+    for _ in range(interactive):
+        calls.append(asyncio.create_task(interactive_call()))
+        await asyncio.sleep(interval)
+    latencies = await asyncio.gather(*calls)
+    await asyncio.gather(*backlog)
+    elapsed = time.perf_counter() - started
+    await agent.close()
+
+    return {
+        "case": name,
+        "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        "bulk_per_s": round(len(backlog) / elapsed, 1) if backlog else "-",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk", type=int, default=200)
+    parser.add_argument("--interactive", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between interactive calls")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with StubAzureOpenAIServer(latency=args.latency, image_size="256x256") as server, \
+            tempfile.TemporaryDirectory() as output_dir:
+        configure_environment(server.endpoint)
+        print(f"{'case':>6} {'p50_ms':>8} {'p95_ms':>8} {'bulk/s':>7}")
+        for name in ("idle", "fair", "fifo"):
+            result = asyncio.run(run_case(name, args.bulk, args.interactive, args.interval, args.concurrency,
+                                          output_dir))
+            print(f"{result['case']:>6} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['bulk_per_s']:>7}")
+
+
+if __name__ == "__main__":
+    main()
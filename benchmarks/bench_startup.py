@@ -0,0 +1,136 @@
+"""
+Benchmark cold start: import time, app startup and first-request latency.
+
+Each run starts a fresh interpreter against the local stub server and
+measures, in order:
+  - import_s: `import app`
+  - startup_s: the lifespan hook that builds the service container
+  - first_read_s: the first GET /prompts
+  - first_model_call_s: the first POST /generate-prompts, which creates the
+    Azure OpenAI client on first use
+
+The median of several runs is reported and can be saved as a baseline or
+compared against one.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --save-baseline
+    python -m benchmarks.bench_startup --compare --fail-on-regression
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "results", "startup_baseline.json")
+STAGES = ("import_s", "startup_s", "first_read_s", "first_model_call_s")
+
+# Runs in a fresh interpreter; the data directory is redirected before any
+# module captures the default paths
+CHILD = """
+import json, os, sys, time
+from src.config.constants import DirectoryConfig
+DirectoryConfig.SRC = os.environ["BENCH_DATA_DIR"]
+DirectoryConfig.PROMPTS_FILE = os.path.join(DirectoryConfig.SRC, "prompts", "prompts.json")
+
+started = time.perf_counter()
+import app
+timings = {"import_s": time.perf_counter() - started}
+
+from fastapi.testclient import TestClient
+started = time.perf_counter()
+with TestClient(app.app) as client:
+    timings["startup_s"] = time.perf_counter() - started
+    started = time.perf_counter()
+    assert client.get("/api/v1/prompts").status_code == 200
+    timings["first_read_s"] = time.perf_counter() - started
+    started = time.perf_counter()
+    assert client.post("/api/v1/generate-prompts", json={"topic": "cold starts", "num_prompts": 2}).status_code == 200
+    timings["first_model_call_s"] = time.perf_counter() - started
+print("RESULT " + json.dumps(timings))
+"""
+
+
+def run_once(endpoint: str) -> dict:
+    """Measure one cold start in a new interpreter."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(
+            os.environ,
+            BENCH_DATA_DIR=data_dir,
+            LOG_LEVEL="WARNING",
+            AZURE_OPENAI_API_KEY="stub-key",
+            AZURE_OPENAI_API_VERSION="2024-02-15-preview",
+            AZURE_OPENAI_GPT4_DEPLOYMENT="gpt-4",
+            AZURE_OPENAI_ENDPOINT=endpoint,
+            AZURE_OPENAI_EMBEDDING_DEPLOYMENT="embedding",
+            AZURE_OPENAI_DALLE_DEPLOYMENT="dall-e-3",
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per model call of the stub")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare this run with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    with StubAzureOpenAIServer(latency=args.latency) as server:
+        runs = [run_once(server.endpoint) for _ in range(args.runs)]
+    result = {stage: round(statistics.median(run[stage] for run in runs), 4) for stage in STAGES}
+
+    baseline = None
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    print(f"{'stage':>19} {'median_s':>9} {'min_s':>9}" + (f" {'baseline_s':>11}" if baseline else ""))
+    for stage in STAGES:
+        line = f"{stage:>19} {result[stage]:>9} {round(min(run[stage] for run in runs), 4):>9}"
+        if baseline:
+            line += f" {baseline['median'][stage]:>11}"
+        print(line)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "runs": args.runs,
+                "median": result,
+            }, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+
+    if baseline:
+        regressions = [
+            f"{stage} {baseline['median'][stage]} -> {result[stage]}"
+            for stage in STAGES if result[stage] > baseline["median"][stage] * (1 + args.tolerance)
+        ]
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
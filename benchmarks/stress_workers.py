@@ -0,0 +1,201 @@
+"""
+Stress test of the app served by several worker processes on one host.
+
+The app runs under uvicorn (or gunicorn with uvicorn workers) with every
+worker sharing one data directory, and many client processes hammer it at
+the same time:
+  - create: each client generates prompts for its own topics
+  - update: each client approves or rejects its own share of every client's
+    prompts, so writers of different processes touch neighbouring records
+  - contend: every client approves the same prompts at once; each request
+    must either succeed or be refused with a 409
+
+Afterwards the store is checked for lost updates: every allocated ID is
+unique, every created prompt is stored with its own text, and every prompt
+ends in the status its last successful update set. The exit code is 1 if
+anything was lost.
+
+Usage:
+    python -m benchmarks.stress_workers --workers 4 --clients 8
+    python -m benchmarks.stress_workers --backend json --server gunicorn
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import StubAzureOpenAIServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server: str, workers: int, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    """Start the app in its own worker processes and wait until it answers."""
+    if server == "gunicorn":
+        command = ["gunicorn", "app:app", "-k", "uvicorn.workers.UvicornWorker",
+                   "-w", str(workers), "-b", f"127.0.0.1:{port}"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--workers", str(workers),
+                   "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with code {process.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/api/v1/health", timeout=1).status_code == 200:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{server} did not start within 60s")
+
+
+def create(args: Tuple[str, int, int, int]) -> Dict[str, str]:
+    """Generate prompts for a client's topics and return their text by ID."""
+    base_url, client, topics, num_prompts = args
+    created = {}
+    with requests.Session() as session:
+        for topic in range(topics):
+            response = session.post(f"{base_url}/generate-prompts",
+                                    json={"topic": f"stress {client}-{topic}", "num_prompts": num_prompts})
+            response.raise_for_status()
+            for prompt_id, info in response.json()["prompts"].items():
+                created[prompt_id] = info["prompt"]
+    return created
+
+
+def update(args: Tuple[str, List[str]]) -> Dict[str, Tuple[str, int]]:
+    """Approve or reject prompts, returning the expected status and response code by ID."""
+    base_url, prompt_ids = args
+    results = {}
+    with requests.Session() as session:
+        for prompt_id in prompt_ids:
+            approved = int(prompt_id) % 2 == 0
+            response = session.post(f"{base_url}/approve-image", json={"prompt_id": prompt_id, "approved": approved})
+            results[prompt_id] = ("approved" if approved else "rejected", response.status_code)
+    return results
+
+
+def contend(args: Tuple[str, List[str]]) -> List[int]:
+    """Approve prompts every other client is approving too, returning the response codes."""
+    base_url, prompt_ids = args
+    with requests.Session() as session:
+        return [
+            session.post(f"{base_url}/approve-image", json={"prompt_id": prompt_id, "approved": True}).status_code
+            for prompt_id in prompt_ids
+        ]
+
+
+def fetch_all(base_url: str) -> Dict[str, Dict]:
+    """Read every stored prompt through the paginated listing."""
+    prompts, cursor = {}, None
+    while True:
+        params = {"limit": 500}
+        if cursor:
+            params["cursor"] = cursor
+        page = requests.get(f"{base_url}/prompts", params=params).json()
+        prompts.update({item["prompt_id"]: item for item in page["items"]})
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return prompts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=4, help="Server worker processes")
+    parser.add_argument("--clients", type=int, default=8, help="Client processes")
+    parser.add_argument("--topics", type=int, default=4, help="Topics generated by each client")
+    parser.add_argument("--prompts-per-topic", type=int, default=5)
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds per model call of the stub")
+    args = parser.parse_args()
+
+    with StubAzureOpenAIServer(latency=args.latency) as stub, tempfile.TemporaryDirectory() as data_dir:
+        port = _free_port()
+        env = dict(
+            os.environ,
+            APP_DATA_DIR=data_dir,
+            PROMPT_STORE_BACKEND=args.backend,
+            LOG_LEVEL="WARNING",
+            AZURE_OPENAI_API_KEY="stub-key",
+            AZURE_OPENAI_API_VERSION="2024-02-15-preview",
+            AZURE_OPENAI_GPT4_DEPLOYMENT="gpt-4",
+            AZURE_OPENAI_ENDPOINT=stub.endpoint,
+            AZURE_OPENAI_EMBEDDING_DEPLOYMENT="embedding",
+            AZURE_OPENAI_DALLE_DEPLOYMENT="dall-e-3",
+        )
+        server = start_server(args.server, args.workers, port, env)
+        base_url = f"http://127.0.0.1:{port}/api/v1"
+        try:
+            with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+                started = time.perf_counter()
+                batches = pool.map(create, [(base_url, client, args.topics, args.prompts_per_topic)
+                                            for client in range(args.clients)])
+                created_s = time.perf_counter() - started
+
+                allocated = Counter(prompt_id for batch in batches for prompt_id in batch)
+                created = {prompt_id: text for batch in batches for prompt_id, text in batch.items()}
+                ids = sorted(created, key=int)
+
+                # Deal the IDs out round-robin so every client writes next to every other one
+                started = time.perf_counter()
+                shares = [ids[client::args.clients] for client in range(args.clients)]
+                updates = {}
+                for result in pool.map(update, [(base_url, share) for share in shares]):
+                    updates.update(result)
+
+                contended = ids[:args.prompts_per_topic]
+                codes = Counter(code for result in pool.map(contend, [(base_url, contended)] * args.clients)
+                                for code in result)
+                updated_s = time.perf_counter() - started
+            stored = fetch_all(base_url)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    expected = {prompt_id: status for prompt_id, (status, _) in updates.items()}
+    expected.update({prompt_id: "approved" for prompt_id in contended})
+    problems = [f"ID {prompt_id} was handed out {count} times" for prompt_id, count in allocated.items() if count > 1]
+    problems += [f"Prompt {prompt_id} is missing" for prompt_id in created if prompt_id not in stored]
+    problems += [f"Prompt {prompt_id} holds another prompt's text" for prompt_id, text in created.items()
+                 if prompt_id in stored and stored[prompt_id]["prompt"] != text]
+    problems += [f"Approval of {prompt_id} failed with {code}" for prompt_id, (_, code) in updates.items() if code != 200]
+    problems += [f"Prompt {prompt_id} is {stored[prompt_id]['status']}, expected {status}"
+                 for prompt_id, status in expected.items()
+                 if prompt_id in stored and stored[prompt_id]["status"] != status]
+    problems += [f"{count} contended approvals answered {code}" for code, count in codes.items()
+                 if code not in (200, 409)]
+
+    print(f"server: {args.server} x{args.workers}, backend: {args.backend}, clients: {args.clients}")
+    print(f"created {len(created)} prompts in {created_s:.2f}s, {len(stored)} stored")
+    print(f"applied {len(updates)} updates and {sum(codes.values())} contended approvals in {updated_s:.2f}s "
+          f"({codes.get(409, 0)} refused with 409)")
+    for problem in problems[:20]:
+        print(f"LOST: {problem}")
+    if problems:
+        print(f"{len(problems)} lost updates")
+        sys.exit(1)
+    print("No lost updates")
+
+
+if __name__ == "__main__":
+    main()
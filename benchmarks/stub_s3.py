@@ -0,0 +1,149 @@
+"""
+Local stand-in for an S3-compatible object store such as MinIO.
+
+Serves path-style PUT, GET (with single byte ranges), HEAD and DELETE on
+objects of one bucket, keeps them in memory and rejects requests whose
+Signature Version 4 does not match the configured credentials, so the
+S3 image store can be tested without a live service.
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+from src.utils.image_store import signature_v4
+
+AUTHORIZATION = re.compile(
+    r"AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<scope>[^,]+), "
+    r"SignedHeaders=(?P<signed_headers>[^,]+), Signature=(?P<signature>[0-9a-f]+)"
+)
+
+
+class StubS3Server:
+    """Fake S3 server running in a background thread."""
+
+    def __init__(self, bucket: str = "images", access_key: str = "stub-access", secret_key: str = "stub-secret",
+                 region: str = "us-east-1", host: str = "127.0.0.1", port: int = 0):
+        """
+        Initialize the stub server.
+
+        Args:
+            bucket (str): The only bucket served
+            access_key (str): Access key ID requests must be signed with
+            secret_key (str): Secret access key requests must be signed with
+            region (str): Region requests must be signed for
+            host (str): Interface to bind to
+            port (int): Port to bind to, 0 picks a free one
+        """
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.host = host
+        self.port = port
+        self.objects: Dict[str, Tuple[bytes, str, float]] = {}
+        self.requests = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{bucket}/{key:.+}", self._object)
+        return app
+
+    def _authorized(self, request: web.Request) -> bool:
+        """Recompute the request's signature from the headers it claims to have signed."""
+        match = AUTHORIZATION.fullmatch(request.headers.get("Authorization", ""))
+        if match is None or match["access_key"] != self.access_key:
+            return False
+        headers = {name: request.headers.get(name, "") for name in match["signed_headers"].split(";")}
+        expected = signature_v4(self.secret_key, self.region, request.method, request.raw_path.split("?")[0],
+                                request.query_string, headers, request.headers.get("x-amz-content-sha256", ""))
+        return expected == match["signature"]
+
+    async def _object(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if not self._authorized(request):
+            return web.Response(status=403, text="SignatureDoesNotMatch")
+        if request.match_info["bucket"] != self.bucket:
+            return web.Response(status=404, text="NoSuchBucket")
+        key = request.match_info["key"]
+
+        if request.method == "PUT":
+            body = await request.read()
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            self.objects[key] = (body, request.headers.get("Content-Type", "binary/octet-stream"), time.time())
+            return web.Response(status=200, headers={"ETag": etag})
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return web.Response(status=204)
+        if key not in self.objects:
+            return web.Response(status=404, text="NoSuchKey")
+
+        body, content_type, modified = self.objects[key]
+        headers = {
+            "ETag": f'"{hashlib.md5(body).hexdigest()}"',
+            "Last-Modified": formatdate(modified, usegmt=True),
+            "Content-Type": content_type,
+            "Accept-Ranges": "bytes",
+        }
+        status = 200
+        byte_range = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("Range", ""))
+        if byte_range and (byte_range[1] or byte_range[2]):
+            if byte_range[1]:
+                start = int(byte_range[1])
+                end = min(int(byte_range[2]) + 1, len(body)) if byte_range[2] else len(body)
+            else:
+                start, end = max(0, len(body) - int(byte_range[2])), len(body)
+            if start >= len(body):
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{len(body)}"})
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(body)}"
+            body, status = body[start:end], 206
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return web.Response(status=status, headers=headers)
+        return web.Response(status=status, body=body, headers=headers)
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> "StubS3Server":
+        """Start serving in a daemon thread and wait until the port is bound."""
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server and join its thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubS3Server":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,211 @@
+"""
+Local stand-in for the Azure OpenAI endpoints used by the agent.
+
+Serves chat completions, embeddings, DALL-E image generations and the image
+URLs they return, with configurable latency, throttling (429) rate and image
+size, so benchmarks can run without a live deployment. The server runs on its own thread and event loop so that a
+blocked client loop can never stall it.
+"""
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from typing import Optional
+
+from aiohttp import web
+from PIL import Image
+
+
+class StubAzureOpenAIServer:
+    """Fake Azure OpenAI server running in a background thread."""
+
+    def __init__(self, latency: float = 0.5, image_size: str = "1024x1024",
+                 host: str = "127.0.0.1", port: int = 0, token_latency: float = 0.0,
+                 latency_jitter: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.5,
+                 seed: Optional[int] = None):
+        """
+        Initialize the stub server.
+
+        Args:
+            latency (float): Seconds to sleep before answering a model call
+            image_size (str): Size of the PNG served for generated images
+            host (str): Interface to bind to
+            port (int): Port to bind to, 0 picks a free one
+            token_latency (float): Seconds the model spends on each chat completion token
+            latency_jitter (float): Up to this many seconds are added to each model call at random
+            throttle_rate (float): Fraction of model calls answered with a 429
+            retry_after (float): Seconds advertised in the Retry-After header of a 429
+            seed (Optional[int]): Seed of the random jitter and throttling
+        """
+        self.latency = latency
+        self.token_latency = token_latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self.image_size = image_size
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._image_bytes = self._render_png(image_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @staticmethod
+    def _render_png(size: str) -> bytes:
+        """Render a small gradient PNG of the requested size."""
+        width, height = (int(v) for v in size.split("x"))
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/deployments/{deployment}/images/generations", self._images)
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self._chat)
+        app.router.add_post("/openai/deployments/{deployment}/embeddings", self._embeddings)
+        app.router.add_get("/files/{name}", self._file)
+        return app
+
+    async def _model_call(self) -> Optional[web.Response]:
+        """Count a model call and wait out its latency; returns a 429 response if it is throttled."""
+        self.requests += 1
+        if self._random.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+                status=429,
+                headers={"retry-after-ms": str(int(self.retry_after * 1000)), "retry-after": str(self.retry_after)}
+            )
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.latency_jitter))
+        return None
+
+    async def _images(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        throttled = await self._model_call()
+        if throttled:
+            return throttled
+        data = [
+            {"url": f"{self.endpoint}/files/{uuid.uuid4().hex}.png",
+             "revised_prompt": body.get("prompt")}
+            for _ in range(body.get("n", 1))
+        ]
+        return web.json_response({"created": int(time.time()), "data": data})
+
+    async def _chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        throttled = await self._model_call()
+        if throttled:
+            return throttled
+        # A fresh scene name per call keeps prompts, and so cached images, distinct
+        scene = uuid.uuid4().hex[:8]
+        content = "\n".join(
+            f"A detailed stub prompt number {i} describing scene {scene}" for i in range(1, 21)
+        )
+        # Roughly one token per word, each word keeping its trailing separator
+        tokens = content.replace(" ", " \0").replace("\n", "\n\0").split("\0")
+        if body.get("stream"):
+            return await self._stream_chat(request, tokens)
+        await asyncio.sleep(self.token_latency * len(tokens))
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.match_info["deployment"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 200, "total_tokens": 210},
+        })
+
+    async def _stream_chat(self, request: web.Request, tokens) -> web.StreamResponse:
+        """Send a chat completion as server-sent chunks, one token at a time."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for token in tokens + [None]:
+            await asyncio.sleep(self.token_latency)
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.match_info["deployment"],
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": token} if token is not None else {},
+                    "finish_reason": None if token is not None else "stop",
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        throttled = await self._model_call()
+        if throttled:
+            return throttled
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for index, text in enumerate(texts):
+            vector = [0.0] * 64
+            for word in str(text).lower().split():
+                vector[zlib.crc32(word.encode()) % 64] += 1.0
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": request.match_info["deployment"],
+            "usage": {"prompt_tokens": 10, "total_tokens": 10},
+        })
+
+    async def _file(self, request: web.Request) -> web.Response:
+        return web.Response(body=self._image_bytes, content_type="image/png")
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> "StubAzureOpenAIServer":
+        """Start serving in a daemon thread and wait until the port is bound."""
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server and join its thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubAzureOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -6,8 +6,9 @@ load_dotenv()
 
 class DirectoryConfig:
     """Directory Configuration"""
-    # Use /tmp as the base directory for Vercel compatibility
-    BASE = '/tmp'
+    # Use /tmp as the base directory for Vercel compatibility; every worker
+    # process on a host must share the same directory
+    BASE = os.environ.get("APP_DATA_DIR", '/tmp')
     SRC = os.path.join(BASE, 'src')
     CONFIG = 'config'
     UTILS = 'utils'
@@ -22,9 +23,31 @@ class DirectoryConfig:
     IMAGE_INGEST = 'ingest'
     IMAGE_PROCESS = 'process'
     IMAGE_APPROVED = 'approved'
+    IMAGE_CACHE = 'cache'
+    IMAGE_STORE = 'store'
     
     # File paths
     PROMPTS_FILE = os.path.join(SRC, PROMPTS, 'prompts.json')
+    PROMPTS_DB = 'prompts.db'
+    JOBS_DB = 'jobs.db'
+    PROMPT_EMBEDDINGS = 'embeddings'
+
+class LogConfig:
+    """Logging Configuration"""
+    LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+    # Records written per batch by the background log writer
+    BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "256"))
+    # The log file rolls over at this size or age, whichever comes first (0 disables)
+    MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    MAX_AGE_SECONDS = int(os.environ.get("LOG_MAX_AGE_SECONDS", str(24 * 3600)))
+    BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+    # Fraction of debug records that are kept
+    DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+
+class MetricsConfig:
+    """Metrics Configuration"""
+    # Add a Server-Timing header with per-stage durations to every API response
+    TIMING_HEADERS = os.environ.get("METRICS_TIMING_HEADERS", "false").lower() == "true"
 
 class AzureConfig:
     """Azure OpenAI Configuration"""
@@ -34,12 +57,188 @@ class AzureConfig:
     ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT")
     EMBEDDING_DEPLOYMENT = os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
     DALL_E_DEPLOYMENT = os.environ.get("AZURE_OPENAI_DALLE_DEPLOYMENT")
+    # JSON list of deployments, possibly in several regions, to balance calls across
+    # (see src/utils/deployment_pool.py); when unset the single deployments above are used
+    DEPLOYMENTS = os.environ.get("AZURE_OPENAI_DEPLOYMENTS")
+    # How a call picks a deployment of its pool: "least_outstanding" or "remaining_quota"
+    ROUTING = os.environ.get("AZURE_OPENAI_ROUTING", "least_outstanding")
     
 class ImageConfig:
     """Image Generation Configuration"""
     IMAGE_SIZE = os.environ.get("IMAGE_SIZE", "1024x1024")
     IMAGE_QUALITY = os.environ.get("IMAGE_QUALITY", "standard")
     IMAGE_STYLE = os.environ.get("IMAGE_STYLE", "natural")
+    # Candidate images generated per prompt, and how many one API call may return
+    # (DALL-E 3 deployments only accept n=1, so candidates are fanned out)
+    NUM_CANDIDATES = int(os.environ.get("IMAGE_NUM_CANDIDATES", "1"))
+    MAX_CANDIDATES = 10
+    MAX_IMAGES_PER_CALL = int(os.environ.get("IMAGE_MAX_PER_CALL", "1"))
+
+class DownloadConfig:
+    """Image Download Configuration"""
+    CHUNK_SIZE = int(os.environ.get("IMAGE_DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+    # Largest accepted image and the most bytes read while looking for its header
+    MAX_IMAGE_BYTES = int(os.environ.get("IMAGE_DOWNLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    MAX_HEADER_BYTES = 64 * 1024
+    MIN_DIMENSION = 256
+
+class CacheConfig:
+    """Generated Image Cache Configuration"""
+    ENABLED = os.environ.get("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+    # Least recently used images are evicted above this size
+    MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+class PromptCacheConfig:
+    """Generated Prompt Cache Configuration"""
+    # Seconds the same batch is returned again for a repeated topic and size, 0 disables the cache
+    TTL_SECONDS = float(os.environ.get("PROMPT_CACHE_TTL_SECONDS", "600"))
+    MAX_ENTRIES = int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", "1024"))
+    # Fill a new batch with the topic's still unused pending prompts before calling the model
+    TOP_UP = os.environ.get("PROMPT_CACHE_TOP_UP", "false").lower() == "true"
+
+class ProcessingConfig:
+    """Image Post-Processing Configuration"""
+    ENABLED = os.environ.get("IMAGE_PROCESSING_ENABLED", "true").lower() == "true"
+    # Worker processes for CPU-bound PIL work
+    WORKERS = int(os.environ.get("IMAGE_PROCESSING_WORKERS", str(min(2, os.cpu_count() or 1))))
+    THUMBNAIL_SIZE = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", "256"))
+    # Full-size variants to produce besides the thumbnail
+    FORMATS = [f.strip() for f in os.environ.get("IMAGE_VARIANT_FORMATS", "webp,avif").split(",") if f.strip()]
+    WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))
+    AVIF_QUALITY = int(os.environ.get("IMAGE_AVIF_QUALITY", "60"))
+    # Longest an approval waits for processing that runs in a job worker process
+    WAIT_TIMEOUT = float(os.environ.get("IMAGE_PROCESSING_WAIT_SECONDS", "30"))
+
+class QualityConfig:
+    """Generated Image Quality Gate Configuration"""
+    # Score new images in the processing workers before they are stored
+    ENABLED = os.environ.get("IMAGE_QUALITY_GATE_ENABLED", "true").lower() == "true"
+    # Variance of the Laplacian of the luminance below which an image is blurry or near-blank
+    MIN_SHARPNESS = float(os.environ.get("IMAGE_QUALITY_MIN_SHARPNESS", "20"))
+    # Entropy in bits of the luminance histogram (0 to 8) below which an image is blank or banded
+    MIN_ENTROPY = float(os.environ.get("IMAGE_QUALITY_MIN_ENTROPY", "4"))
+    # Perceptual hashes this many bits or fewer apart from an approved image's mark a near-duplicate
+    DUPLICATE_DISTANCE = int(os.environ.get("IMAGE_QUALITY_DUPLICATE_DISTANCE", "6"))
+    # New images requested when every candidate fails the gate; 0 only records the scores
+    MAX_REGENERATIONS = int(os.environ.get("IMAGE_QUALITY_MAX_REGENERATIONS", "0"))
+    # Seconds after which the approved images' hashes are read again, to see approvals made by other processes
+    HASH_REFRESH_SECONDS = float(os.environ.get("IMAGE_QUALITY_HASH_REFRESH_SECONDS", "60"))
+
+class StorageConfig:
+    """Image Storage Configuration"""
+    # "local" (sharded directory tree) or "s3" (any S3-compatible service)
+    BACKEND = os.environ.get("IMAGE_STORE_BACKEND", "local")
+    # Directory levels of 256 shards each between the store root and an image
+    SHARD_LEVELS = int(os.environ.get("IMAGE_STORE_SHARD_LEVELS", "2"))
+    # Bytes read per chunk when an image is streamed
+    CHUNK_SIZE = 256 * 1024
+    S3_ENDPOINT = os.environ.get("IMAGE_STORE_S3_ENDPOINT", "http://localhost:9000")
+    S3_BUCKET = os.environ.get("IMAGE_STORE_S3_BUCKET", "images")
+    S3_ACCESS_KEY = os.environ.get("IMAGE_STORE_S3_ACCESS_KEY", "")
+    S3_SECRET_KEY = os.environ.get("IMAGE_STORE_S3_SECRET_KEY", "")
+    S3_REGION = os.environ.get("IMAGE_STORE_S3_REGION", "us-east-1")
+    # Prefix in front of every object key, to share a bucket
+    S3_PREFIX = os.environ.get("IMAGE_STORE_S3_PREFIX", "")
+    S3_TIMEOUT = float(os.environ.get("IMAGE_STORE_S3_TIMEOUT", "30"))
+
+class ConcurrencyConfig:
+    """Concurrency Configuration"""
+    # Maximum number of Azure OpenAI calls in flight per agent
+    MAX_IN_FLIGHT_REQUESTS = int(os.environ.get("AZURE_OPENAI_MAX_IN_FLIGHT", "8"))
+
+class SchedulerConfig:
+    """Priority and Fair Queuing Configuration"""
+    # Slots of AZURE_OPENAI_MAX_IN_FLIGHT that only interactive calls may take
+    INTERACTIVE_RESERVED = int(os.environ.get("SCHEDULER_INTERACTIVE_RESERVED", "2"))
+    # Calls of each class waiting for a slot beyond which new ones are rejected with a 429
+    MAX_QUEUED_INTERACTIVE = int(os.environ.get("SCHEDULER_MAX_QUEUED_INTERACTIVE", "64"))
+    MAX_QUEUED_BULK = int(os.environ.get("SCHEDULER_MAX_QUEUED_BULK", "1024"))
+    # JSON object of the relative share of each flow, e.g. {"topic:ocean": 2}; flows not listed weigh 1
+    FLOW_WEIGHTS = os.environ.get("SCHEDULER_FLOW_WEIGHTS", "{}")
+    # Job worker slots that only interactive image tasks may take
+    WORKER_RESERVED = int(os.environ.get("SCHEDULER_WORKER_RESERVED", "4"))
+    # Queued image tasks of each class beyond which new requests are rejected with a 429
+    MAX_QUEUED_IMAGE_TASKS = int(os.environ.get("SCHEDULER_MAX_QUEUED_IMAGE_TASKS", "32"))
+    MAX_QUEUED_BULK_TASKS = int(os.environ.get("SCHEDULER_MAX_QUEUED_BULK_TASKS", "10000"))
+    # Seconds a rejected client is told to wait before retrying a queued image request
+    RETRY_AFTER = int(os.environ.get("SCHEDULER_RETRY_AFTER", "10"))
+
+class SpeculativeConfig:
+    """Speculative Image Generation Configuration"""
+    # Generate images for new prompts in the background, below bulk work, before anyone asks for them
+    ENABLED = os.environ.get("SPECULATIVE_GENERATION_ENABLED", "false").lower() == "true"
+    # Prompts of one topic whose images are generated speculatively per day
+    DAILY_BUDGET = int(os.environ.get("SPECULATIVE_DAILY_BUDGET", "20"))
+    # JSON object of the daily budget of particular topics, e.g. {"ocean": 100}; other topics get DAILY_BUDGET
+    TOPIC_BUDGETS = os.environ.get("SPECULATIVE_TOPIC_BUDGETS", "{}")
+
+class HTTPConfig:
+    """Shared HTTP Connection Pool Configuration"""
+    MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+class ResilienceConfig:
+    """Retry, Rate Limit and Circuit Breaker Configuration"""
+    MAX_RETRIES = int(os.environ.get("AZURE_OPENAI_MAX_RETRIES", "3"))
+    # Full-jitter exponential backoff: sleep up to min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    BACKOFF_BASE = float(os.environ.get("AZURE_OPENAI_BACKOFF_BASE", "1"))
+    BACKOFF_MAX = float(os.environ.get("AZURE_OPENAI_BACKOFF_MAX", "30"))
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get("AZURE_OPENAI_BREAKER_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT = float(os.environ.get("AZURE_OPENAI_BREAKER_RESET_SECONDS", "30"))
+    # Deployment quotas, 0 disables the limit
+    GPT4_RPM = float(os.environ.get("AZURE_OPENAI_GPT4_RPM", "0"))
+    GPT4_TPM = float(os.environ.get("AZURE_OPENAI_GPT4_TPM", "0"))
+    DALLE_RPM = float(os.environ.get("AZURE_OPENAI_DALLE_RPM", "0"))
+    EMBEDDING_RPM = float(os.environ.get("AZURE_OPENAI_EMBEDDING_RPM", "0"))
+    EMBEDDING_TPM = float(os.environ.get("AZURE_OPENAI_EMBEDDING_TPM", "0"))
+
+class JobConfig:
+    """Batch Job Configuration"""
+    # Maximum number of images generated concurrently per batch job
+    MAX_CONCURRENCY = int(os.environ.get("IMAGE_JOB_MAX_CONCURRENCY", "4"))
+    # Number of finished jobs kept in the queue for progress queries
+    MAX_FINISHED_JOBS = int(os.environ.get("IMAGE_JOB_HISTORY", "1000"))
+    # Tasks run at once by this process's worker; 0 only enqueues, leaving the
+    # work to `python -m src.services.job_worker` processes
+    WORKER_CONCURRENCY = int(os.environ.get("IMAGE_JOB_WORKER_CONCURRENCY", "16"))
+    # A running task whose worker stops renewing its lease is resumed by another worker
+    LEASE_SECONDS = float(os.environ.get("IMAGE_JOB_LEASE_SECONDS", "60"))
+    # A task is failed once it has been started this many times without finishing
+    MAX_ATTEMPTS = int(os.environ.get("IMAGE_JOB_MAX_ATTEMPTS", "3"))
+    # Seconds between queue polls of an idle worker
+    POLL_INTERVAL = float(os.environ.get("IMAGE_JOB_POLL_INTERVAL", "0.5"))
+
+class ApprovalConfig:
+    """Batch Approval Configuration"""
+    # Most decisions accepted by one POST /approve-images
+    MAX_BATCH = int(os.environ.get("APPROVAL_MAX_BATCH", "1000"))
+    # Image store lookups run at once while a batch is checked
+    CONCURRENCY = int(os.environ.get("APPROVAL_CONCURRENCY", "16"))
+
+class StoreConfig:
+    """Prompt Store Configuration"""
+    # "sqlite" (indexed, transactional) or "json" (legacy whole-file store)
+    BACKEND = os.environ.get("PROMPT_STORE_BACKEND", "sqlite")
+    # Milliseconds to wait for a locked database before failing
+    BUSY_TIMEOUT_MS = int(os.environ.get("PROMPT_STORE_BUSY_TIMEOUT_MS", "5000"))
+    # Default and largest page size of prompt listings
+    PAGE_SIZE = int(os.environ.get("PROMPT_PAGE_SIZE", "50"))
+    MAX_PAGE_SIZE = 500
+
+class SimilarityConfig:
+    """Semantic Prompt Deduplication Configuration"""
+    ENABLED = os.environ.get("PROMPT_SIMILARITY_ENABLED", "true").lower() == "true"
+    # Prompts at least this similar to an existing one are duplicates
+    DUPLICATE_THRESHOLD = float(os.environ.get("PROMPT_DUPLICATE_THRESHOLD", "0.95"))
+    # "flag" keeps duplicates and marks them, "reject" drops them
+    DUPLICATE_ACTION = os.environ.get("PROMPT_DUPLICATE_ACTION", "flag")
+    # Reuse an existing image instead of calling DALL-E for near-identical prompts
+    REUSE_IMAGES = os.environ.get("IMAGE_REUSE_ENABLED", "false").lower() == "true"
+    IMAGE_REUSE_THRESHOLD = float(os.environ.get("IMAGE_REUSE_THRESHOLD", "0.97"))
+    # Number of nearest neighbours examined per lookup
+    TOP_K = int(os.environ.get("PROMPT_SIMILARITY_TOP_K", "5"))
+    EMBEDDING_BATCH_SIZE = 256
 
 class APIConfig:
     """API Configuration"""
@@ -0,0 +1,27 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.config.constants import ImageConfig
+
+
+class BatchImageRequest(BaseModel):
+    prompt_ids: Optional[List[str]] = None
+    topic: Optional[str] = None
+    num_candidates: Optional[int] = Field(None, ge=1, le=ImageConfig.MAX_CANDIDATES)
+
+class JobItem(BaseModel):
+    status: str
+    stage: Optional[str] = None
+    image_path: Optional[str] = None
+    error: Optional[str] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    created_at: str
+    finished_at: Optional[str] = None
+    total: int
+    completed: int
+    failed: int
+    items: Dict[str, JobItem]
@@ -1,6 +1,8 @@
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from src.config.constants import ApprovalConfig, ImageConfig
 
 
 class TopicRequest(BaseModel):
@@ -14,18 +16,45 @@ class PromptInfo(BaseModel):
     status: str
     created_at: str
     topic: str
+    duplicate_of: Optional[str] = None
+    similarity: Optional[float] = None
+    reused_from: Optional[str] = None
+    candidates: Optional[List[Dict]] = None
+    selected_candidate: Optional[int] = None
+    quality: Optional[Dict] = None
 
 class PromptResponse(BaseModel):
     prompts: Dict[str, PromptInfo]
 
+class PromptPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
 class ImageRequest(BaseModel):
     prompt_id: str
     prompt: str
+    num_candidates: Optional[int] = Field(None, ge=1, le=ImageConfig.MAX_CANDIDATES)
 
 class ImageResponse(BaseModel):
     image_path: str
     prompt_id: str
+    candidates: List[str] = []
 
 class ApprovalRequest(BaseModel):
     prompt_id: str
-    approved: bool 
\ No newline at end of file
+    approved: bool
+    candidate: Optional[int] = None 
+
+class BatchApprovalRequest(BaseModel):
+    decisions: List[ApprovalRequest] = Field(..., min_length=1, max_length=ApprovalConfig.MAX_BATCH)
+
+class ApprovalResult(BaseModel):
+    prompt_id: str
+    status: str
+    detail: Optional[str] = None
+
+class BatchApprovalResponse(BaseModel):
+    approved: int
+    rejected: int
+    failed: int
+    results: List[ApprovalResult]
@@ -1,37 +1,228 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
 
-from src.models.prompt_models import (ApprovalRequest, ImageRequest,
-                                      ImageResponse, PromptResponse,
-                                      TopicRequest)
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from src.config.constants import StoreConfig
+from src.models.job_models import BatchImageRequest, JobResponse
+from src.models.prompt_models import (ApprovalRequest, BatchApprovalRequest,
+                                      BatchApprovalResponse, ImageRequest,
+                                      ImageResponse, PromptPage,
+                                      PromptResponse, TopicRequest)
+from src.routes.dependencies import (get_container, get_image_service,
+                                     get_job_service, get_prompt_service)
+from src.routes.responses import image_response
+from src.services.container import ServiceContainer
 from src.services.image_service import ImageService
+from src.services.job_service import JobService
 from src.services.prompt_service import PromptService
+from src.utils.image_processing import VARIANT_MEDIA_TYPES
+from src.utils.job_queue import IdempotencyKeyReused
+from src.utils.logger import logger
+from src.utils.metrics import REGISTRY
+from src.utils.prompt_store import ConcurrentUpdateError
+from src.utils.resilience import CircuitOpenError
+from src.utils.scheduler import (INTERACTIVE, RequestDropped,
+                                 SchedulerOverloaded, flow_key, scheduling)
 
 router = APIRouter()
-prompt_service = PromptService()
-image_service = ImageService()
+metrics_router = APIRouter()
+
+# Logged for requests dropped because their client went away; nobody receives the response
+CLIENT_CLOSED_REQUEST = 499
+
+def _overloaded(e: SchedulerOverloaded) -> HTTPException:
+    """429 telling the client when to retry a request the scheduler turned away"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after + 0.5))})
 
 @router.post("/generate-prompts", response_model=PromptResponse)
-async def generate_prompts(request: TopicRequest):
+async def generate_prompts(request: TopicRequest, http_request: Request, x_api_key: Optional[str] = Header(None),
+                           prompt_service: PromptService = Depends(get_prompt_service)):
     try:
-        prompts_dict = await prompt_service.generate_prompts(request.topic, request.num_prompts)
+        with scheduling(INTERACTIVE, flow_key(x_api_key, request.topic), http_request.is_disconnected):
+            prompts_dict = await prompt_service.generate_prompts(request.topic, request.num_prompts)
         return PromptResponse(prompts=prompts_dict)
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except RequestDropped as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# A plain function, which FastAPI runs in its threadpool: a page read can wait on the store's write lock
+@router.get("/prompts", response_model=PromptPage)
+def list_prompts(topic: Optional[str] = None, status: Optional[str] = None,
+                 approved: Optional[bool] = None,
+                 created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                 cursor: Optional[str] = None,
+                 limit: int = Query(StoreConfig.PAGE_SIZE, ge=1, le=StoreConfig.MAX_PAGE_SIZE),
+                 fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+                 prompt_service: PromptService = Depends(get_prompt_service)):
+    try:
+        items, next_cursor = prompt_service.list_prompts(
+            limit=limit,
+            cursor=cursor,
+            fields=[field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+            topic=topic,
+            status=status,
+            approved=approved,
+            created_from=created_from.isoformat() if created_from else None,
+            created_to=created_to.isoformat() if created_to else None
+        )
+        return PromptPage(items=items, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _sse(event: str, data: Dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/generate-prompts/stream")
+async def stream_prompts(request: Request, topic: str, num_prompts: int = 10, generate_images: bool = False,
+                         x_api_key: Optional[str] = Header(None),
+                         prompt_service: PromptService = Depends(get_prompt_service),
+                         job_service: JobService = Depends(get_job_service)):
+    """Stream new prompts as server-sent events, each stored as soon as it is complete."""
+    async def events() -> AsyncIterator[str]:
+        count = 0
+        prompts = prompt_service.stream_prompts(topic, num_prompts)
+        try:
+            with scheduling(INTERACTIVE, flow_key(x_api_key, topic), request.is_disconnected):
+                async for prompt_id, record in prompts:
+                    count += 1
+                    data = {"prompt_id": prompt_id, **record}
+                    if generate_images:
+                        job = await job_service.submit(prompt_ids=[prompt_id], api_key=x_api_key)
+                        data["job_id"] = job["job_id"]
+                    yield _sse("prompt", data)
+                    if await request.is_disconnected():
+                        break
+                else:
+                    yield _sse("done", {"count": count})
+        except SchedulerOverloaded as e:
+            yield _sse("error", {"status_code": 429, "detail": str(e), "retry_after": e.retry_after})
+        except RequestDropped:
+            pass
+        except CircuitOpenError as e:
+            yield _sse("error", {"status_code": 503, "detail": str(e)})
+        except Exception as e:
+            logger.error(f"Error streaming prompts: {str(e)}")
+            yield _sse("error", {"status_code": 500, "detail": str(e)})
+        finally:
+            await prompts.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.post("/generate-image", response_model=ImageResponse)
-async def generate_image(request: ImageRequest):
+async def generate_image(request: ImageRequest, http_request: Request, idempotency_key: Optional[str] = Header(None),
+                         x_api_key: Optional[str] = Header(None), job_service: JobService = Depends(get_job_service)):
+    """
+    Generate a prompt's images as an interactive task on the job queue.
+
+    Once started the work finishes even if the client goes away; a task
+    still queued when the client goes away is withdrawn instead.
+    """
     try:
-        image_path = await image_service.generate_image(request.prompt_id, request.prompt)
-        return ImageResponse(image_path=image_path, prompt_id=request.prompt_id)
+        task = await job_service.generate_image(request.prompt_id, request.prompt, request.num_candidates,
+                                                idempotency_key, x_api_key, http_request.is_disconnected)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except RequestDropped as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if task["status"] == "failed":
+        status_code = {
+            CircuitOpenError.__name__: 503, SchedulerOverloaded.__name__: 429
+        }.get(task["error_type"], 500)
+        raise HTTPException(status_code=status_code, detail=task["error"])
+    image_paths = task["image_paths"]
+    return ImageResponse(image_path=image_paths[0], prompt_id=request.prompt_id, candidates=image_paths)
+
+@router.post("/generate-images", response_model=JobResponse, status_code=202)
+async def generate_images(request: BatchImageRequest, idempotency_key: Optional[str] = Header(None),
+                          x_api_key: Optional[str] = Header(None), job_service: JobService = Depends(get_job_service)):
+    try:
+        job = await job_service.submit(prompt_ids=request.prompt_ids, topic=request.topic,
+                                       num_candidates=request.num_candidates, idempotency_key=idempotency_key,
+                                       api_key=x_api_key)
+        return JobResponse(**job)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SchedulerOverloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, job_service: JobService = Depends(get_job_service)):
+    job = await job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job ID not found")
+    return JobResponse(**job)
 
 @router.post("/approve-image")
-async def approve_image(request: ApprovalRequest):
+async def approve_image(request: ApprovalRequest, image_service: ImageService = Depends(get_image_service)):
     try:
-        success = image_service.approve_image(request.prompt_id, request.approved)
+        success = await image_service.approve_image(request.prompt_id, request.approved, request.candidate)
         if not success:
             raise HTTPException(status_code=404, detail="Prompt ID not found")
         return {"status": "success", "message": f"Image {request.prompt_id} {'approved' if request.approved else 'rejected'}"}
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/approve-images", response_model=BatchApprovalResponse)
+async def approve_images(request: BatchApprovalRequest, image_service: ImageService = Depends(get_image_service)):
+    """Apply many approval decisions in one store transaction, reporting the outcome of each."""
+    try:
+        results = await image_service.approve_images(
+            [(decision.prompt_id, decision.approved, decision.candidate) for decision in request.decisions]
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    statuses = [result["status"] for result in results]
+    return BatchApprovalResponse(
+        approved=statuses.count("approved"),
+        rejected=statuses.count("rejected"),
+        failed=len(statuses) - statuses.count("approved") - statuses.count("rejected"),
+        results=results
+    )
+
+@router.get("/images/{prompt_id}")
+async def get_image(prompt_id: str, request: Request, variant: str = "original",
+                    image_service: ImageService = Depends(get_image_service)):
+    if variant not in VARIANT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown variant: {variant}")
+    image_file = await image_service.get_image_file(prompt_id, variant)
+    if image_file is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    key, image, media_type = image_file
+    return image_response(request, image_service.image_store, key, image, media_type)
+
+@router.get("/health")
+async def health(container: ServiceContainer = Depends(get_container)):
+    return {"status": "ok", "deployments": container.agent.resilience_stats()}
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Rendering counts the prompt store and job queue, whose reads can wait on a write lock
+    text = await asyncio.to_thread(REGISTRY.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
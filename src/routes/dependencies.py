@@ -0,0 +1,19 @@
+from fastapi import Request
+
+from src.services.container import ServiceContainer
+from src.services.image_service import ImageService
+from src.services.job_service import JobService
+from src.services.prompt_service import PromptService
+
+
+def get_container(request: Request) -> ServiceContainer:
+    return request.app.state.container
+
+def get_prompt_service(request: Request) -> PromptService:
+    return get_container(request).prompt_service
+
+def get_image_service(request: Request) -> ImageService:
+    return get_container(request).image_service
+
+def get_job_service(request: Request) -> JobService:
+    return get_container(request).job_service
@@ -0,0 +1,27 @@
+import time
+
+from fastapi import Request
+
+from src.config.constants import MetricsConfig
+from src.utils.metrics import (HTTP_REQUEST_SECONDS, record_request_timings,
+                               server_timing_header)
+
+
+async def timing_middleware(request: Request, call_next):
+    """Record request latency and optionally report per-stage timings in a Server-Timing header"""
+    started = time.perf_counter()
+    with record_request_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    # Label by route template rather than raw path to keep the series count bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code)
+    )
+    if MetricsConfig.TIMING_HEADERS:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
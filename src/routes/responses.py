@@ -0,0 +1,145 @@
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from starlette.concurrency import iterate_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from src.utils.image_store import ImageStore, StoredImage
+
+
+class StoredImageResponse(Response):
+    """
+    Streams all or part of an image from the image store.
+
+    Local files are handed to the server as a file descriptor when it offers
+    the ASGI zero-copy send extension, or as a path when it offers path send,
+    so the kernel copies them to the socket with sendfile. Otherwise, and for
+    remote stores, the image is read in chunks on a worker thread.
+    """
+
+    def __init__(self, image_store: ImageStore, key: str, media_type: str, start: int, end: int,
+                 status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.image_store = image_store
+        self.key = key
+        self.start = start
+        self.end = end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        path = self.image_store.path(self.key)
+        if path is not None and "http.response.zerocopysend" in extensions:
+            with open(path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": self.end - self.start,
+                    "more_body": False,
+                })
+            return
+        if path is not None and self.status_code == 200 and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": path})
+            return
+
+        async for chunk in iterate_in_threadpool(self.image_store.read(self.key, self.start, self.end)):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in (strip(tag) for tag in header.split(","))
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header.
+
+    Args:
+        header (str): Value of the Range header
+        size (int): Size of the image
+
+    Returns:
+        Optional[Tuple[int, int]]: Start and end offset of the range, or None to
+            serve the whole image (other units, several ranges, malformed values)
+
+    Raises:
+        ValueError: If the range lies outside the image
+    """
+    unit, _, spec = header.partition("=")
+    first, _, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not (first or last) or not all(
+            part.isdigit() for part in (first, last) if part):
+        return None
+
+    if not first:
+        # A suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= size or end <= start:
+        raise ValueError(f"Range {header} is outside the image")
+    return start, end
+
+
+def image_response(request: Request, image_store: ImageStore, key: str, image: StoredImage,
+                   media_type: str) -> Response:
+    """
+    Answer a request for a stored image with conditional and range support.
+
+    Args:
+        request (Request): The request, whose If-None-Match, Range and If-Range headers are honoured
+        image_store (ImageStore): Store holding the image
+        key (str): Key of the image
+        image (StoredImage): Size and ETag of the image
+        media_type (str): Content type of the image
+
+    Returns:
+        Response: 200, 206, 304 or 416
+    """
+    # The URL serves whichever image is current, which approvals and regeneration change,
+    # so clients keep a copy but revalidate it against the ETag on every use
+    headers = {
+        "ETag": image.etag,
+        "Last-Modified": formatdate(image.modified, usegmt=True),
+        "Cache-Control": "no-cache",
+        "Accept-Ranges": "bytes",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), image.etag):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, image.size, 200
+    range_header = request.headers.get("range")
+    # A Range is only honoured if the client's copy is still the current one
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == image.etag):
+        try:
+            byte_range = parse_range(range_header, image.size)
+        except ValueError:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{image.size}"}))
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{image.size}"
+
+    headers["Content-Length"] = str(end - start)
+    return StoredImageResponse(image_store, key, media_type, start, end, status_code, headers)
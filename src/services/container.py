@@ -0,0 +1,107 @@
+import asyncio
+from typing import Optional
+
+import httpx
+
+from src.config.constants import (CacheConfig, HTTPConfig, ProcessingConfig,
+                                  PromptCacheConfig, SimilarityConfig,
+                                  SpeculativeConfig)
+from src.services.image_service import ImageService
+from src.services.job_service import JobService
+from src.services.processing_service import ProcessingService
+from src.services.prompt_service import PromptService
+from src.services.similarity_service import SimilarityService
+from src.utils.agent import AzureOpenAIChat
+from src.utils.image_cache import ImageCache
+from src.utils.image_store import ImageStore, create_image_store
+from src.utils.logger import logger
+from src.utils.job_queue import JobQueue
+from src.utils.metrics import JOB_TASKS, PROMPT_STORE_SIZE
+from src.utils.path_manager import PathManager
+from src.utils.prompt_cache import PromptCache
+from src.utils.prompt_store import PromptStore, create_prompt_store
+
+
+class ServiceContainer:
+    """
+    Application-scoped services sharing one agent, store and HTTP pool.
+
+    Created once per process from the FastAPI lifespan hook and handed to the
+    routes through dependencies.
+    """
+
+    def __init__(self, agent: Optional[AzureOpenAIChat] = None, store: Optional[PromptStore] = None,
+                 path_manager: Optional[PathManager] = None, job_queue: Optional[JobQueue] = None,
+                 image_store: Optional[ImageStore] = None):
+        self.path_manager = path_manager or PathManager()
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTPConfig.MAX_CONNECTIONS,
+                max_keepalive_connections=HTTPConfig.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTPConfig.KEEPALIVE_EXPIRY
+            )
+        )
+        self.image_cache = (
+            ImageCache(self.path_manager.image_cache_dir, CacheConfig.MAX_BYTES) if CacheConfig.ENABLED else None
+        )
+        self.agent = agent or AzureOpenAIChat(
+            http_client=self.http_client,
+            path_manager=self.path_manager,
+            image_cache=self.image_cache
+        )
+        self.store = store or create_prompt_store(path_manager=self.path_manager)
+        PROMPT_STORE_SIZE.set_function(self.store.count)
+        self.image_store = image_store or create_image_store(path_manager=self.path_manager)
+        self.similarity_service = (
+            SimilarityService(self.agent, self.store, self.path_manager, image_store=self.image_store)
+            if SimilarityConfig.ENABLED else None
+        )
+        self.prompt_cache = (
+            PromptCache(PromptCacheConfig.TTL_SECONDS, PromptCacheConfig.MAX_ENTRIES)
+            if PromptCacheConfig.TTL_SECONDS > 0 else None
+        )
+        self.job_queue = job_queue or JobQueue(self.path_manager.jobs_db)
+        for status in ("queued", "running", "completed", "failed"):
+            JOB_TASKS.set_function(lambda status=status: self.job_queue.count(status), status=status)
+        self.prompt_service = PromptService(
+            self.agent, self.store, self.path_manager, self.similarity_service, self.prompt_cache,
+            job_queue=self.job_queue if SpeculativeConfig.ENABLED else None
+        )
+        self.processing_service = (
+            ProcessingService(self.store, self.path_manager, image_store=self.image_store)
+            if ProcessingConfig.ENABLED else None
+        )
+        self.image_service = ImageService(
+            self.agent, self.prompt_service, self.path_manager, self.similarity_service, self.processing_service,
+            self.image_store
+        )
+        self.job_service = JobService(self.image_service, self.prompt_service, queue=self.job_queue)
+        self._background_tasks = set()
+
+    async def start(self) -> None:
+        """Start the job worker and background maintenance work"""
+        await self.job_service.start()
+        if self.similarity_service:
+            task = asyncio.create_task(self._backfill_similarity_index())
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _backfill_similarity_index(self) -> None:
+        try:
+            await self.similarity_service.backfill()
+        except Exception as e:
+            logger.error(f"Error indexing stored prompts: {str(e)}")
+
+    async def close(self) -> None:
+        """Stop background work and release the shared clients"""
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.job_service.shutdown()
+        if self.processing_service:
+            await self.processing_service.close()
+        await self.agent.close()
+        await self.http_client.aclose()
+        self.job_queue.close()
+        self.store.close()
+        self.image_store.close()
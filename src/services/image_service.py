@@ -1,57 +1,438 @@
+import asyncio
 import os
-import shutil
+import time
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from src.config.constants import ImageConfig
+from src.config.constants import (ApprovalConfig, DownloadConfig, ImageConfig,
+                                  QualityConfig, SimilarityConfig)
+from src.services.processing_service import ProcessingService
 from src.services.prompt_service import PromptService
+from src.services.similarity_service import SimilarityService
 from src.utils.agent import AzureOpenAIChat
+from src.utils.image_header import has_image_trailer, parse_image_header
+from src.utils.image_processing import VARIANT_MEDIA_TYPES
+from src.utils.image_store import ImageStore, LocalImageStore, StoredImage
+from src.utils.job_queue import LeaseLostError, TaskCheckpoint
+from src.utils.logger import logger
+from src.utils.metrics import (IMAGE_REGENERATIONS, IN_FLIGHT, QUALITY_GATE,
+                               span)
 from src.utils.path_manager import PathManager
+from src.utils.prompt_store import CONFLICT, UPDATED
 
 
 class ImageService:
-    def __init__(self):
-        self.path_manager = PathManager()
-        self.agent = AzureOpenAIChat()
-        self.prompt_service = PromptService()
+    def __init__(self, agent: Optional[AzureOpenAIChat] = None, prompt_service: Optional[PromptService] = None,
+                 path_manager: Optional[PathManager] = None,
+                 similarity_service: Optional[SimilarityService] = None,
+                 processing_service: Optional[ProcessingService] = None,
+                 image_store: Optional[ImageStore] = None):
+        self.path_manager = path_manager or PathManager()
+        self.agent = agent or AzureOpenAIChat(path_manager=self.path_manager)
+        self.prompt_service = prompt_service or PromptService(self.agent, path_manager=self.path_manager)
+        self.similarity_service = similarity_service
+        self.processing_service = processing_service
+        self.image_store = image_store or LocalImageStore(self.path_manager.image_store_dir)
 
-    async def generate_image(self, prompt_id: str, prompt: str) -> str:
+    async def generate_image(self, prompt_id: str, prompt: str, num_candidates: Optional[int] = None) -> str:
         """Generate an image from a prompt"""
-        # Generate image and save to ingest folder
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        raw_image_path = os.path.join(self.path_manager.image_ingest_dir, f'image_{prompt_id}_{timestamp}.png')
+        return (await self.generate_candidates(prompt_id, prompt, num_candidates))[0]
+
+    async def generate_candidates(self, prompt_id: str, prompt: str, num_candidates: Optional[int] = None,
+                                  checkpoint: Optional[TaskCheckpoint] = None) -> List[str]:
+        """
+        Generate one or more candidate images for a prompt.
+        
+        The images are requested, downloaded into ingest/, validated, scored,
+        moved into the image store and recorded on the prompt in turn. Each stage is
+        saved to the checkpoint, and a task resumed from a checkpoint skips
+        the stages it already completed.
+        
+        Args:
+            prompt_id (str): ID of the prompt
+            prompt (str): The prompt to generate the images from
+            num_candidates (Optional[int]): Number of candidates, defaults to ImageConfig.NUM_CANDIDATES
+            checkpoint (Optional[TaskCheckpoint]): Progress of a queued task, None to run from scratch
+            
+        Returns:
+            List[str]: Image store keys of the generated images; the first is the prompt's image
+            
+        Raises:
+            ValueError: If num_candidates is out of range
+        """
+        num_candidates = num_candidates or ImageConfig.NUM_CANDIDATES
+        if not 1 <= num_candidates <= ImageConfig.MAX_CANDIDATES:
+            raise ValueError(f"Number of candidates must be between 1 and {ImageConfig.MAX_CANDIDATES}")
+        
+        with IN_FLIGHT.track_in_progress(kind="image_generations"), span("generate_image"):
+            return await self._generate_candidates(prompt_id, prompt, num_candidates, checkpoint or TaskCheckpoint())
+
+    async def _generate_candidates(self, prompt_id: str, prompt: str, num_candidates: int,
+                                   checkpoint: TaskCheckpoint) -> List[str]:
+        if checkpoint.reached("recorded"):
+            return checkpoint.data["image_paths"]
+        
+        started = time.perf_counter()
+        while True:
+            if not checkpoint.reached("downloaded"):
+                await self._create_images(prompt_id, prompt, num_candidates, checkpoint)
+            image_paths = checkpoint.data["image_paths"]
+            
+            if not checkpoint.reached("validated"):
+                with span("validate"):
+                    await asyncio.to_thread(self._validate_images, image_paths)
+                await checkpoint.save("validated")
+            
+            if checkpoint.reached("scored") or await self._score_images(prompt_id, prompt, image_paths, checkpoint):
+                break
+        image_paths = checkpoint.data["image_paths"]
+        scores = checkpoint.data.get("scores")
+        
+        logger.info("Images generated for prompt", extra={
+            "prompt_id": prompt_id,
+            "candidates": len(image_paths),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        
+        image_keys = [self.image_store.key_for(os.path.basename(path)) for path in image_paths]
+        with span("image_store_put"):
+            await asyncio.to_thread(self._store_images, image_paths, image_keys)
+        
+        # Record the status and every candidate in one write
+        fields = {"status": "generated", "image_path": image_keys[0]}
+        if checkpoint.data.get("reused_from"):
+            fields["reused_from"] = checkpoint.data["reused_from"]
+        if scores:
+            fields["quality"] = scores[0]
+        if len(image_keys) > 1:
+            fields["candidates"] = [
+                {"image_path": key, "quality": score} if scores else {"image_path": key}
+                for key, score in zip(image_keys, scores or image_keys)
+            ]
+        with span("store_write"):
+            await asyncio.to_thread(self.prompt_service.store.update, prompt_id, **fields)
+        
+        # Hand the images to the post-processing stage
+        if self.processing_service:
+            with span("processing_submit"):
+                await self.processing_service.submit(prompt_id, image_keys)
+        await checkpoint.save("recorded", image_paths=image_keys)
+        
+        return image_keys
+
+    async def _score_images(self, prompt_id: str, prompt: str, image_paths: List[str],
+                            checkpoint: TaskCheckpoint) -> bool:
+        """
+        Run the downloaded images through the quality gate before they are stored.
+        
+        Images that pass are moved to the front, so the prompt's image is the
+        first candidate that passed. When every image fails and regenerations
+        remain, the images are deleted, along with the image cached for the
+        prompt, and the task starts over; otherwise they are kept and their
+        scores recorded for review.
+        
+        Args:
+            prompt_id (str): ID of the prompt
+            prompt (str): Prompt text the images were generated from
+            image_paths (List[str]): Local paths of the validated images
+            checkpoint (TaskCheckpoint): Progress of the task
+            
+        Returns:
+            bool: False if the images were discarded and new ones must be generated
+        """
+        if not (self.processing_service and QualityConfig.ENABLED):
+            await checkpoint.save("scored")
+            return True
+        
+        scores = await self.processing_service.score(prompt_id, image_paths)
+        for score in scores:
+            QUALITY_GATE.inc(outcome="passed" if score["passed"] else "failed")
+        
+        # A reused image was picked on purpose, so it is never regenerated
+        regenerations = checkpoint.data.get("regenerations", 0)
+        if (not any(score["passed"] for score in scores) and regenerations < QualityConfig.MAX_REGENERATIONS
+                and not checkpoint.data.get("reused_from")):
+            logger.warning("Images failed the quality gate, generating new ones", extra={
+                "prompt_id": prompt_id,
+                "reasons": sorted({reason for score in scores for reason in score["reasons"]}),
+                "regeneration": regenerations + 1
+            })
+            IMAGE_REGENERATIONS.inc()
+            await asyncio.to_thread(self._discard_images, image_paths)
+            await self._discard_cached([prompt])
+            await checkpoint.reset()
+            await checkpoint.save("", regenerations=regenerations + 1)
+            return False
+        
+        order = sorted(range(len(scores)), key=lambda index: not scores[index]["passed"])
+        await checkpoint.save("scored", image_paths=[image_paths[index] for index in order],
+                              scores=[scores[index] for index in order])
+        return True
+
+    @staticmethod
+    def _discard_images(image_paths: List[str]) -> None:
+        for path in image_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _store_images(self, image_paths: List[str], image_keys: List[str]) -> None:
+        """Move downloaded images into the image store; a resumed task may have moved some already"""
+        for path, key in zip(image_paths, image_keys):
+            if os.path.exists(path):
+                self.image_store.put(path, key)
+            elif not self.image_store.exists(key):
+                raise FileNotFoundError(f"Image {path} is missing")
+
+    async def _create_images(self, prompt_id: str, prompt: str, num_candidates: int,
+                             checkpoint: TaskCheckpoint) -> None:
+        """Reuse or generate the images into ingest/, checkpointing their URLs as soon as they are paid for."""
+        save_paths = checkpoint.data.get("save_paths")
+        if save_paths is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            raw_image_path = os.path.join(self.path_manager.image_ingest_dir, f'image_{prompt_id}_{timestamp}.png')
+            save_paths = [raw_image_path] if num_candidates == 1 else [
+                f"{os.path.splitext(raw_image_path)[0]}_{index}.png" for index in range(num_candidates)
+            ]
+        image_urls = checkpoint.data.get("urls")
+        
+        # Reuse the image of a near-identical prompt instead of paying for a new one
+        match = None
+        if num_candidates == 1 and not image_urls and self.similarity_service and SimilarityConfig.REUSE_IMAGES:
+            with span("similarity_lookup"):
+                match = await self.similarity_service.find_reusable_image(prompt_id, prompt)
         
-        # Use image configuration from constants
-        image_path = await self.agent.generate_image(
-            prompt, 
-            save_path=str(raw_image_path),
-            size=ImageConfig.IMAGE_SIZE,
-            quality=ImageConfig.IMAGE_QUALITY,
-            style=ImageConfig.IMAGE_STYLE
-        )
+        if match:
+            match_id, match_record, score = match
+            with span("reuse_fetch"):
+                await asyncio.to_thread(self.image_store.fetch, match_record["image_path"], save_paths[0])
+            logger.info("Reused image of similar prompt", extra={
+                "prompt_id": prompt_id, "reused_from": match_id, "similarity": round(score, 3)
+            })
+            await checkpoint.save("downloaded", image_paths=save_paths, reused_from=match_id)
+            return
         
-        # Update prompt status
-        self.prompt_service.update_prompt_status(prompt_id, "generated", image_path)
+        async def requested(urls: Dict[str, str]) -> None:
+            urls = dict(checkpoint.data.get("urls", {}), **urls)
+            await checkpoint.save("requested", save_paths=save_paths, urls=urls)
         
-        return image_path
+        try:
+            # Use image configuration from constants
+            image_paths = await self.agent.generate_images(
+                prompt,
+                save_paths,
+                size=ImageConfig.IMAGE_SIZE,
+                quality=ImageConfig.IMAGE_QUALITY,
+                style=ImageConfig.IMAGE_STYLE,
+                image_urls=image_urls,
+                on_requested=requested
+            )
+        except LeaseLostError:
+            raise
+        except Exception:
+            # URLs saved by an earlier attempt may have expired; the next attempt starts over
+            if image_urls:
+                await checkpoint.reset()
+            raise
+        await checkpoint.save("downloaded", image_paths=image_paths)
+
+    @staticmethod
+    def _validate_images(image_paths: List[str]) -> None:
+        """Check that every image is on disk with a complete, recognised header and trailer"""
+        for path in image_paths:
+            with open(path, "rb") as f:
+                header = f.read(DownloadConfig.MAX_HEADER_BYTES)
+                f.seek(max(0, os.path.getsize(path) - 16))
+                tail = f.read()
+            try:
+                image_info = parse_image_header(header)
+            except ValueError as e:
+                raise ValueError(f"Invalid image file {path}: {str(e)}")
+            if image_info is None or not has_image_trailer(image_info[0], tail):
+                raise ValueError(f"Invalid image file {path}: incomplete image")
+
+    async def _discard_cached(self, prompts: List[str]) -> None:
+        """Drop the prompts' cached images, which would otherwise be handed back when they are generated again"""
+        def discard() -> None:
+            for prompt in prompts:
+                self.agent.discard_cached_image(prompt, ImageConfig.IMAGE_SIZE, ImageConfig.IMAGE_QUALITY,
+                                                ImageConfig.IMAGE_STYLE)
+
+        if prompts:
+            await asyncio.to_thread(discard)
 
-    def approve_image(self, prompt_id: str, approved: bool) -> bool:
-        """Approve or reject an image"""
-        prompts_dict = self.prompt_service.load_prompts()
+    async def approve_image(self, prompt_id: str, approved: bool, candidate: Optional[int] = None) -> bool:
+        """
+        Approve or reject an image.
         
-        if prompt_id not in prompts_dict:
+        Approval only changes the prompt's record: the images stay where
+        they are in the image store.
+        
+        Args:
+            prompt_id (str): ID of the prompt
+            approved (bool): Whether the image is approved
+            candidate (Optional[int]): Index of the candidate to approve, defaults to the first
+            
+        Returns:
+            bool: False if the prompt does not exist
+            
+        Raises:
+            ValueError: If the candidate index does not exist
+            ConcurrentUpdateError: If another request changed the prompt meanwhile
+        """
+        if self.processing_service:
+            with span("approve_wait_processing"):
+                await self.processing_service.wait(prompt_id)
+        versioned = await asyncio.to_thread(self.prompt_service.store.get_versioned, prompt_id)
+        
+        if versioned is None:
             return False
+        record, version = versioned
+        fields = self._approval_fields(prompt_id, record, approved, candidate)
+        
+        # Only write if nobody changed the record since it was read
+        with span("store_write"):
+            updated = await asyncio.to_thread(self.prompt_service.store.update, prompt_id,
+                                              expected_version=version, **fields)
+        if updated and self.processing_service:
+            self.processing_service.record_approvals({prompt_id: self._approved_hash(record, fields)})
+        if updated and not approved:
+            await self._discard_cached([record["prompt"]])
+        return updated
+
+    @staticmethod
+    def _approved_hash(record: Dict, fields: Dict) -> Optional[str]:
+        """Perceptual hash of the image a decision approves, None if it rejects"""
+        if not fields["approved"]:
+            return None
+        return fields.get("phash", record.get("phash"))
+
+    @staticmethod
+    def _approval_fields(prompt_id: str, record: Dict, approved: bool, candidate: Optional[int]) -> Dict:
+        """Return the fields that record a decision, raising ValueError if the candidate does not exist"""
+        fields = {
+            "approved": approved,
+            "status": "approved" if approved else "rejected"
+        }
         
-        # Update approval status
-        prompts_dict[prompt_id]["approved"] = approved
-        prompts_dict[prompt_id]["status"] = "approved" if approved else "rejected"
+        # If approved, make the chosen candidate the prompt's image
+        if approved and record["image_path"]:
+            candidates = record.get("candidates") or [record]
+            index = candidate or 0
+            if not 0 <= index < len(candidates):
+                raise ValueError(f"Prompt {prompt_id} has no candidate {index}")
+            if record.get("candidates"):
+                chosen = candidates[index]
+                fields.update(chosen, variants=chosen.get("variants", {}), selected_candidate=index)
+        return fields
+
+    async def approve_images(self, decisions: List[Tuple[str, bool, Optional[int]]]) -> List[Dict]:
+        """
+        Approve or reject many images at once.
+        
+        Every decision is checked first: the prompt and candidate must exist,
+        and an approved image must be in the image store, which is looked up
+        concurrently on worker threads. The decisions that pass are written in
+        one store transaction, each only if its prompt did not change since it
+        was read. A decision that fails any step leaves its prompt untouched,
+        so no prompt is ever approved for an image that is not stored.
+        
+        Args:
+            decisions (List[Tuple[str, bool, Optional[int]]]): (prompt_id, approved,
+                candidate) of each decision
+            
+        Returns:
+            List[Dict]: One result per decision, in order, with its prompt_id, its
+                status ("approved", "rejected", "not_found", "invalid", "missing_image",
+                "conflict" or "duplicate") and a detail for failures
+        """
+        results = [{"prompt_id": prompt_id, "status": None, "detail": None} for prompt_id, _, _ in decisions]
+        positions: Dict[str, int] = {}
+        for position, (prompt_id, _, _) in enumerate(decisions):
+            if prompt_id in positions:
+                results[position].update(status="duplicate", detail=f"Prompt {prompt_id} is decided earlier in the batch")
+            else:
+                positions[prompt_id] = position
+        
+        def fail(prompt_id: str, status: str, detail: str) -> None:
+            results[positions[prompt_id]].update(status=status, detail=detail)
+        
+        if self.processing_service:
+            with span("approve_wait_processing"):
+                await asyncio.gather(*(self.processing_service.wait(prompt_id) for prompt_id in positions))
+        versioned = await asyncio.to_thread(self.prompt_service.store.get_many_versioned, list(positions))
         
-        # If approved, move the image to approved folder
-        if approved and prompts_dict[prompt_id]["image_path"]:
-            current_path = prompts_dict[prompt_id]["image_path"]
-            filename = os.path.basename(current_path)
-            new_path = os.path.join(self.path_manager.image_approved_dir, filename)
-            shutil.move(current_path, new_path)
-            prompts_dict[prompt_id]["image_path"] = new_path
+        updates, versions, image_keys = {}, {}, {}
+        for prompt_id, position in positions.items():
+            _, approved, candidate = decisions[position]
+            if prompt_id not in versioned:
+                fail(prompt_id, "not_found", "Prompt ID not found")
+                continue
+            record, versions[prompt_id] = versioned[prompt_id]
+            try:
+                updates[prompt_id] = self._approval_fields(prompt_id, record, approved, candidate)
+            except ValueError as e:
+                fail(prompt_id, "invalid", str(e))
+                continue
+            image_key = updates[prompt_id].get("image_path", record["image_path"])
+            if approved and image_key:
+                image_keys[prompt_id] = image_key
+        
+        # Look the approved images up off the event loop, a bounded number at a time
+        semaphore = asyncio.Semaphore(ApprovalConfig.CONCURRENCY)
+        
+        async def stored(key: str) -> bool:
+            async with semaphore:
+                return await asyncio.to_thread(self.image_store.exists, key)
+        
+        with span("approve_check_images"):
+            found = await asyncio.gather(*(stored(key) for key in image_keys.values()), return_exceptions=True)
+        for (prompt_id, key), exists in zip(image_keys.items(), found):
+            if exists is not True:
+                detail = f"Image {key} is not stored" if exists is False else f"Image {key} could not be checked: {exists}"
+                fail(prompt_id, "missing_image", detail)
+                del updates[prompt_id]
+        
+        with span("store_write"):
+            outcomes = await asyncio.to_thread(self.prompt_service.store.update_many, updates, versions)
+        if self.processing_service:
+            self.processing_service.record_approvals({
+                prompt_id: self._approved_hash(versioned[prompt_id][0], updates[prompt_id])
+                for prompt_id, outcome in outcomes.items() if outcome == UPDATED
+            })
+        await self._discard_cached([
+            versioned[prompt_id][0]["prompt"] for prompt_id, outcome in outcomes.items()
+            if outcome == UPDATED and not updates[prompt_id]["approved"]
+        ])
+        for prompt_id, outcome in outcomes.items():
+            if outcome == UPDATED:
+                results[positions[prompt_id]]["status"] = updates[prompt_id]["status"]
+            elif outcome == CONFLICT:
+                fail(prompt_id, "conflict", f"Prompt {prompt_id} was changed by another request")
+            else:
+                fail(prompt_id, "not_found", "Prompt ID not found")
+        return results
+
+    async def get_image_file(self, prompt_id: str, variant: str = "original") -> Optional[Tuple[str, StoredImage, str]]:
+        """
+        Locate the stored file of an image variant.
         
-        self.prompt_service.save_prompts(prompts_dict)
-        return True 
\ No newline at end of file
+        Args:
+            prompt_id (str): ID of the prompt
+            variant (str): "original", "thumbnail", "webp" or "avif"
+            
+        Returns:
+            Optional[Tuple[str, StoredImage, str]]: (image store key, size and ETag, media type),
+                or None if unavailable
+        """
+        record = await asyncio.to_thread(self.prompt_service.get_prompt, prompt_id)
+        if record is None or not record["image_path"]:
+            return None
+        key = record["image_path"] if variant == "original" else record.get("variants", {}).get(variant)
+        if not key:
+            return None
+        image = await asyncio.to_thread(self.image_store.stat, key)
+        if image is None:
+            return None
+        return key, image, VARIANT_MEDIA_TYPES[variant]
@@ -0,0 +1,213 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.config.constants import JobConfig, SchedulerConfig
+from src.services.image_service import ImageService
+from src.services.job_worker import JobWorker
+from src.services.prompt_service import PromptService
+from src.utils.job_queue import JobQueue
+from src.utils.metrics import SPECULATIVE_IMAGES, add_request_timings
+from src.utils.path_manager import PathManager
+from src.utils.scheduler import (BULK, INTERACTIVE, RequestDropped,
+                                 SchedulerOverloaded, flow_key)
+
+
+class JobService:
+    """
+    Queues image generation in the durable job queue.
+
+    Jobs survive restarts: queued and interrupted tasks are picked up again by
+    the in-process worker or by separate `python -m src.services.job_worker`
+    processes sharing the queue.
+
+    Single images requested by a waiting client are interactive tasks and
+    batch jobs are bulk tasks; each task's flow is the caller's API key, or
+    the prompt's topic when no key is sent. New work is turned away with
+    SchedulerOverloaded while too many tasks of its class are queued.
+    A single image requested for a prompt whose speculative task is queued,
+    running or done adopts that task instead of paying for the images twice.
+    """
+
+    def __init__(self, image_service: ImageService, prompt_service: PromptService,
+                 max_concurrency: int = JobConfig.MAX_CONCURRENCY, queue: Optional[JobQueue] = None,
+                 worker_concurrency: int = JobConfig.WORKER_CONCURRENCY,
+                 poll_interval: float = JobConfig.POLL_INTERVAL):
+        self.image_service = image_service
+        self.prompt_service = prompt_service
+        self.max_concurrency = max_concurrency
+        self.queue = queue or JobQueue(PathManager().jobs_db)
+        self.poll_interval = poll_interval
+        self.worker = JobWorker(
+            self.queue, image_service, worker_concurrency, max_concurrency,
+            poll_interval=poll_interval, on_finished=self._notify
+        ) if worker_concurrency > 0 else None
+        self._finished: Dict[int, asyncio.Event] = {}
+
+    def _resolve_prompts(self, prompt_ids: Optional[List[str]], topic: Optional[str]) -> Dict[str, Dict]:
+        """Resolve the request into a mapping of prompt ID to prompt record."""
+        if bool(prompt_ids) == bool(topic):
+            raise ValueError("Provide either prompt_ids or topic")
+
+        store = self.prompt_service.store
+        if topic:
+            return store.find(topic=topic, status="pending")
+
+        prompt_ids = list(dict.fromkeys(prompt_ids))
+        prompts_dict = store.get_many(prompt_ids)
+
+        missing = [prompt_id for prompt_id in prompt_ids if prompt_id not in prompts_dict]
+        if missing:
+            raise KeyError(f"Prompt IDs not found: {', '.join(missing)}")
+        return {prompt_id: prompts_dict[prompt_id] for prompt_id in prompt_ids}
+
+    def _admit(self, priority: str, tasks: int, limit: int, idempotency_key: Optional[str] = None) -> None:
+        """
+        Raise SchedulerOverloaded if queuing `tasks` more tasks of a class would exceed its limit.
+
+        A replay of a request whose job exists already queues nothing, so it is always admitted.
+        """
+        if idempotency_key is not None and self.queue.find_job(idempotency_key) is not None:
+            return
+        queued = self.queue.count("queued", priority)
+        if limit and queued + tasks > limit:
+            raise SchedulerOverloaded(f"Too many {priority} image tasks queued ({queued})",
+                                      SchedulerConfig.RETRY_AFTER)
+
+    async def submit(self, prompt_ids: Optional[List[str]] = None, topic: Optional[str] = None,
+                     num_candidates: Optional[int] = None, idempotency_key: Optional[str] = None,
+                     api_key: Optional[str] = None) -> Dict:
+        """
+        Queue a bulk job for the given prompts.
+
+        Args:
+            prompt_ids (Optional[List[str]]): IDs of the prompts
+            topic (Optional[str]): Generate every pending prompt of a topic instead
+            num_candidates (Optional[int]): Candidate images per prompt
+            idempotency_key (Optional[str]): Key of the request; resubmitting it
+                returns the original job instead of paying for the images again
+            api_key (Optional[str]): API key of the caller, which names its fairness flow
+
+        Returns:
+            Dict: The job
+
+        Raises:
+            ValueError: If neither or both of prompt_ids and topic are given
+            KeyError: If a prompt ID does not exist
+            IdempotencyKeyReused: If the key was used for a different request
+            SchedulerOverloaded: If too many bulk tasks are queued already
+        """
+        job = await self.queue.call(self._submit, prompt_ids, topic, num_candidates, idempotency_key, api_key)
+        self._wake()
+        return job
+
+    def _submit(self, prompt_ids: Optional[List[str]], topic: Optional[str], num_candidates: Optional[int],
+                idempotency_key: Optional[str], api_key: Optional[str]) -> Dict:
+        records = self._resolve_prompts(prompt_ids, topic)
+        self._admit(BULK, len(records), SchedulerConfig.MAX_QUEUED_BULK_TASKS, idempotency_key)
+        job_id = self.queue.enqueue(
+            {prompt_id: record["prompt"] for prompt_id, record in records.items()},
+            num_candidates,
+            idempotency_key,
+            BULK,
+            {prompt_id: flow_key(api_key, record["topic"]) for prompt_id, record in records.items()}
+        )
+        self.queue.prune(JobConfig.MAX_FINISHED_JOBS)
+        return self.queue.get_job(job_id)
+
+    async def generate_image(self, prompt_id: str, prompt: str, num_candidates: Optional[int] = None,
+                             idempotency_key: Optional[str] = None, api_key: Optional[str] = None,
+                             is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Dict:
+        """
+        Queue the generation of one prompt's images as an interactive task and wait for it to finish.
+
+        Once a worker has started the task it keeps running if the caller
+        goes away, and a retry with the same idempotency key waits for, or
+        returns, the same result. A task still queued when its caller goes
+        away is withdrawn before anything is paid for. If the prompt's images
+        are being generated speculatively, or were and await review, the
+        caller gets that task instead of a new one.
+
+        Args:
+            api_key (Optional[str]): API key of the caller, which names its fairness flow
+            is_disconnected (Optional[Callable[[], Awaitable[bool]]]): Tells whether the caller went away
+
+        Returns:
+            Dict: The finished task, with its status, image_paths or error
+
+        Raises:
+            SchedulerOverloaded: If too many interactive tasks are queued already
+            RequestDropped: If the caller went away before the task was started
+        """
+        task_id = await self.queue.call(self._queue_image, prompt_id, prompt, num_candidates, idempotency_key,
+                                        api_key)
+        self._wake()
+        task = await self.wait_for_task(task_id, is_disconnected)
+        add_request_timings(task["timings"])
+        return task
+
+    def _queue_image(self, prompt_id: str, prompt: str, num_candidates: Optional[int],
+                     idempotency_key: Optional[str], api_key: Optional[str]) -> int:
+        """Adopt the prompt's speculative task or queue an interactive one, and return its ID"""
+        record = self.prompt_service.store.get(prompt_id)
+        flow = flow_key(api_key, record["topic"] if record else None)
+        unreviewed = record is not None and record["status"] == "generated"
+        task_id = self.queue.adopt(prompt_id, prompt, num_candidates, flow, idempotency_key, unreviewed)
+        if task_id is not None:
+            SPECULATIVE_IMAGES.inc(outcome="adopted")
+            return task_id
+        self._admit(INTERACTIVE, 1, SchedulerConfig.MAX_QUEUED_IMAGE_TASKS, idempotency_key)
+        job_id = self.queue.enqueue({prompt_id: prompt}, num_candidates, idempotency_key, INTERACTIVE,
+                                    {prompt_id: flow})
+        return self.queue.get_tasks(job_id)[0]["task_id"]
+
+    async def wait_for_task(self, task_id: int,
+                            is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Dict:
+        """
+        Wait until a task is completed or failed, by any worker.
+
+        Raises:
+            RequestDropped: If the caller went away while the task was still queued,
+                or another caller's withdrawal deleted it
+        """
+        while True:
+            # Local workers signal right away; tasks run elsewhere are polled
+            finished = self._finished.setdefault(task_id, asyncio.Event())
+            finished.clear()
+            task = await self.queue.call(self.queue.get_task, task_id)
+            if task is None:
+                self._finished.pop(task_id, None)
+                raise RequestDropped(f"Task {task_id} was withdrawn")
+            if task["status"] in ("completed", "failed"):
+                self._finished.pop(task_id, None)
+                return task
+            if task["status"] == "queued" and is_disconnected is not None and await is_disconnected():
+                if await self.queue.call(self.queue.withdraw, task["job_id"]):
+                    self._finished.pop(task_id, None)
+                    raise RequestDropped(f"Task {task_id} withdrawn: the client went away")
+            timer = asyncio.get_running_loop().call_later(self.poll_interval, finished.set)
+            try:
+                await finished.wait()
+            finally:
+                timer.cancel()
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        """Return a job by ID"""
+        return await self.queue.call(self.queue.get_job, job_id)
+
+    def _wake(self) -> None:
+        if self.worker is not None:
+            self.worker.wake()
+
+    def _notify(self, task_id: int) -> None:
+        finished = self._finished.get(task_id)
+        if finished is not None:
+            finished.set()
+
+    async def start(self) -> None:
+        """Start the in-process worker, resuming tasks left over from a previous run"""
+        self._wake()
+
+    async def shutdown(self) -> None:
+        """Stop the in-process worker; its unfinished tasks stay queued"""
+        if self.worker is not None:
+            await self.worker.stop()
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from src.config.constants import JobConfig, SchedulerConfig
+from src.utils.job_queue import JobQueue, LeaseLostError, TaskCheckpoint
+from src.utils.logger import logger
+from src.utils.metrics import IN_FLIGHT, STAGE_SECONDS, record_request_timings
+from src.utils.scheduler import INTERACTIVE, scheduling
+
+
+class JobWorker:
+    """
+    Pulls image generation tasks from the durable job queue and runs them.
+
+    Any number of workers, in this process or in others, can share one queue.
+    Each one renews the leases of its running tasks in the background, so a
+    task is only taken over by another worker if this one dies. The last
+    `reserved` slots only take interactive tasks, so a bulk backlog never
+    makes an interactive request wait for a free worker.
+    """
+
+    def __init__(self, queue: JobQueue, image_service, concurrency: int = JobConfig.WORKER_CONCURRENCY,
+                 max_per_job: int = JobConfig.MAX_CONCURRENCY,
+                 lease_seconds: float = JobConfig.LEASE_SECONDS,
+                 poll_interval: float = JobConfig.POLL_INTERVAL,
+                 on_finished: Optional[Callable[[int], None]] = None,
+                 reserved: int = SchedulerConfig.WORKER_RESERVED):
+        """
+        Initialize the worker.
+
+        Args:
+            queue (JobQueue): Queue to pull tasks from
+            image_service (ImageService): Service that generates the images
+            concurrency (int): Most tasks run at once
+            max_per_job (int): Most tasks of one job run at once
+            lease_seconds (float): Lease taken on each task, renewed while it runs
+            poll_interval (float): Seconds between queue polls while idle
+            on_finished (Optional[Callable[[int], None]]): Called with the ID of every finished task
+            reserved (int): Slots only interactive tasks may take, at most concurrency - 1
+        """
+        self.queue = queue
+        self.image_service = image_service
+        self.concurrency = concurrency
+        self.max_per_job = max_per_job
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.on_finished = on_finished
+        self.reserved = max(0, min(reserved, concurrency - 1))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start pulling tasks on the running event loop"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Look for new tasks now instead of at the next poll"""
+        self.start()
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop pulling tasks and hand the running ones back to the queue"""
+        tasks = list(self._running.values())
+        if self._loop_task is not None:
+            tasks.append(self._loop_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        released = await self.queue.call(self.queue.release, self.worker_id)
+        if released:
+            logger.info("Released running tasks", extra={"worker": self.worker_id, "tasks": released})
+
+    async def _run(self) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                self._wakeup.clear()
+                while len(self._running) < self.concurrency:
+                    priority = INTERACTIVE if len(self._running) >= self.concurrency - self.reserved else None
+                    task = await self.queue.call(self.queue.claim, self.worker_id, self.lease_seconds,
+                                                 self.max_per_job, priority)
+                    if task is None:
+                        break
+                    STAGE_SECONDS.observe(max(0.0, time.time() - task["enqueued_at"]), stage="queue_wait")
+                    execution = asyncio.create_task(self._execute(task))
+                    self._running[task["task_id"]] = execution
+                    execution.add_done_callback(lambda _, task_id=task["task_id"]: self._forget(task_id))
+                await self._sleep()
+        finally:
+            heartbeat.cancel()
+
+    async def _sleep(self) -> None:
+        """Wait for a wake-up or the next poll."""
+        # A timer instead of asyncio.wait_for, which can swallow a cancellation that races its timeout
+        timer = asyncio.get_running_loop().call_later(self.poll_interval, self._wakeup.set)
+        try:
+            await self._wakeup.wait()
+        finally:
+            timer.cancel()
+
+    def _forget(self, task_id: int) -> None:
+        self._running.pop(task_id, None)
+        # A slot is free again
+        self._wakeup.set()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if self._running:
+                await self.queue.call(self.queue.renew, self.worker_id, self.lease_seconds)
+
+    async def _execute(self, task: Dict) -> None:
+        """Run one task from its last checkpoint and record the outcome."""
+        checkpoint = TaskCheckpoint(task["stage"], task["checkpoint"], self.queue, task["task_id"],
+                                    self.worker_id, self.lease_seconds)
+        if task["stage"]:
+            logger.info("Resuming task", extra={
+                "job_id": task["job_id"], "prompt_id": task["prompt_id"],
+                "stage": task["stage"], "attempt": task["attempts"]
+            })
+        # The task's spans are stored with it, so whoever waits on it can report them
+        with IN_FLIGHT.track_in_progress(kind="job_tasks"), scheduling(task["priority"], task["flow"]), \
+                record_request_timings() as timings:
+            try:
+                image_paths = await self.image_service.generate_candidates(
+                    task["prompt_id"], task["prompt"], task["num_candidates"], checkpoint
+                )
+                job_finished = await self.queue.call(self.queue.complete, task["task_id"], self.worker_id,
+                                                     image_paths, timings)
+            except LeaseLostError:
+                logger.warning("Task taken over by another worker", extra={
+                    "job_id": task["job_id"], "prompt_id": task["prompt_id"]
+                })
+                return
+            except Exception as e:
+                logger.error("Task failed", extra={
+                    "job_id": task["job_id"], "prompt_id": task["prompt_id"], "error": str(e)
+                })
+                try:
+                    job_finished = await self.queue.call(self.queue.fail, task["task_id"], self.worker_id,
+                                                         str(e), type(e).__name__, timings)
+                except LeaseLostError:
+                    return
+
+        if self.on_finished:
+            self.on_finished(task["task_id"])
+        if job_finished:
+            job = await self.queue.call(self.queue.get_job, task["job_id"])
+            logger.info("Job finished", extra={
+                "job_id": job["job_id"], "status": job["status"], "completed": job["completed"], "total": job["total"]
+            })
+
+
+async def run_worker() -> None:
+    """Drain the job queue in this process until SIGINT or SIGTERM."""
+    from src.services.container import ServiceContainer
+
+    container = ServiceContainer()
+    if container.job_service.worker is None:
+        raise ValueError("IMAGE_JOB_WORKER_CONCURRENCY must be at least 1 to run a worker")
+    await container.start()
+    logger.info("Job worker started", extra={
+        "worker": container.job_service.worker.worker_id,
+        "concurrency": container.job_service.worker.concurrency
+    })
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await container.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,230 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.config.constants import ProcessingConfig, QualityConfig
+from src.utils.image_processing import (hamming_distances, hash_array,
+                                        process_image, score_image)
+from src.utils.image_store import ImageStore, LocalImageStore
+from src.utils.logger import logger
+from src.utils.metrics import IN_FLIGHT, span
+from src.utils.path_manager import PathManager
+from src.utils.prompt_store import PromptStore
+
+
+class ProcessingService:
+    """
+    Post-processes stored images in the background.
+
+    A worker process strips each image's metadata, writes a thumbnail and
+    WebP/AVIF variants into process/ and computes a perceptual hash. The
+    cleaned image replaces the original in the image store, the variants are
+    stored next to it, and the results are recorded on the prompt.
+
+    Before that, freshly downloaded images can be scored in the same workers
+    so that blank, blurry or near-duplicate ones never reach the store. The
+    perceptual hashes of the approved images are kept in memory for that:
+    read from the store once, updated by `record_approvals`, and read again
+    every HASH_REFRESH_SECONDS to see approvals made by other processes.
+    """
+
+    def __init__(self, store: PromptStore, path_manager: Optional[PathManager] = None,
+                 executor: Optional[ProcessPoolExecutor] = None, image_store: Optional[ImageStore] = None):
+        self.store = store
+        self.path_manager = path_manager or PathManager()
+        self.image_store = image_store or LocalImageStore(self.path_manager.image_store_dir)
+        self._executor = executor
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._approved_ids: List[str] = []
+        self._approved_hashes = np.zeros(0, dtype=np.uint64)
+        self._approved_loaded_at: Optional[float] = None
+        self._approved_lock = asyncio.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Process pool, started on first use"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=ProcessingConfig.WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def submit(self, prompt_id: str, image_keys: List[str]) -> None:
+        """
+        Post-process freshly stored images in the background.
+        
+        Args:
+            prompt_id (str): ID of the prompt the images belong to
+            image_keys (List[str]): Image store keys of the image and any further candidates
+        """
+        await asyncio.to_thread(self.store.update, prompt_id, processing="running")
+        
+        task = asyncio.create_task(self._process(prompt_id, image_keys))
+        self._tasks[prompt_id] = task
+        task.add_done_callback(lambda done: self._forget(prompt_id, done))
+
+    def _forget(self, prompt_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(prompt_id) is task:
+            del self._tasks[prompt_id]
+
+    async def wait(self, prompt_id: str, timeout: float = ProcessingConfig.WAIT_TIMEOUT) -> None:
+        """Wait until any in-flight processing of a prompt's image has finished, here or in a job worker process"""
+        task = self._tasks.get(prompt_id)
+        if task is not None:
+            await asyncio.gather(asyncio.shield(task), return_exceptions=True)
+            return
+        
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            record = await asyncio.to_thread(self.store.get, prompt_id)
+            if record is None or record.get("processing") != "running":
+                return
+            await asyncio.sleep(0.1)
+
+    async def score(self, prompt_id: str, image_paths: List[str]) -> List[Dict]:
+        """
+        Score downloaded images against the quality gate.
+        
+        The worker processes compute each image's sharpness, entropy and
+        perceptual hash; the hashes are then compared with those of every
+        approved image to find near-duplicates.
+        
+        Args:
+            prompt_id (str): ID of the prompt the images belong to
+            image_paths (List[str]): Local paths of the images
+            
+        Returns:
+            List[Dict]: Scores of each image, with whether it `passed` and the `reasons` it failed
+        """
+        loop = asyncio.get_running_loop()
+        with IN_FLIGHT.track_in_progress(kind="scoring"), span("quality_score"):
+            scores = await asyncio.gather(
+                *(loop.run_in_executor(self.executor, score_image, path) for path in image_paths)
+            )
+        await self._load_approved()
+        approved_ids, approved_hashes = self._approved_ids, self._approved_hashes
+        # An approved image is not a duplicate of itself
+        own = approved_ids.index(prompt_id) if prompt_id in approved_ids else None
+        
+        results = []
+        for score in scores:
+            reasons = []
+            if score["sharpness"] < QualityConfig.MIN_SHARPNESS:
+                reasons.append("blurry")
+            if score["entropy"] < QualityConfig.MIN_ENTROPY:
+                reasons.append("blank")
+            distances = hamming_distances(score["phash"], approved_hashes)
+            if own is not None:
+                distances[own] = 64
+            if distances.size and distances.min() <= QualityConfig.DUPLICATE_DISTANCE:
+                nearest = int(distances.argmin())
+                score = dict(score, near_duplicate_of=approved_ids[nearest], hamming_distance=int(distances[nearest]))
+                reasons.append("near_duplicate")
+            results.append(dict(score, passed=not reasons, reasons=reasons))
+        return results
+
+    async def _load_approved(self) -> None:
+        """Read the approved images' hashes from the store, if never read or not for HASH_REFRESH_SECONDS"""
+        async with self._approved_lock:
+            loaded_at = self._approved_loaded_at
+            if loaded_at is not None and time.monotonic() - loaded_at < QualityConfig.HASH_REFRESH_SECONDS:
+                return
+            started = time.monotonic()
+            approved = await asyncio.to_thread(self.store.find, status="approved")
+            hashes = {prompt_id: record["phash"] for prompt_id, record in approved.items() if record.get("phash")}
+            self._approved_ids = list(hashes)
+            self._approved_hashes = hash_array(list(hashes.values()))
+            self._approved_loaded_at = started
+
+    def record_approvals(self, decisions: Dict[str, Optional[str]]) -> None:
+        """
+        Update the approved images' hashes after approval decisions.
+
+        Args:
+            decisions (Dict[str, Optional[str]]): Perceptual hash of each newly
+                approved prompt's image, None for a rejected prompt
+        """
+        if self._approved_loaded_at is None:
+            return
+        keep = [position for position, prompt_id in enumerate(self._approved_ids) if prompt_id not in decisions]
+        if len(keep) < len(self._approved_ids):
+            self._approved_ids = [self._approved_ids[position] for position in keep]
+            self._approved_hashes = self._approved_hashes[keep]
+        added = {prompt_id: phash for prompt_id, phash in decisions.items() if phash}
+        if added:
+            self._approved_ids = self._approved_ids + list(added)
+            self._approved_hashes = np.concatenate([self._approved_hashes, hash_array(list(added.values()))])
+
+    async def _process_one(self, image_key: str) -> Dict:
+        # Images in a remote store are processed from a local copy
+        source_path = self.image_store.path(image_key)
+        if source_path is None:
+            source_path = os.path.join(self.path_manager.image_process_dir, os.path.basename(image_key))
+            await asyncio.to_thread(self.image_store.fetch, image_key, source_path)
+        
+        with IN_FLIGHT.track_in_progress(kind="processing"), span("process_image"):
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                partial(
+                    process_image,
+                    source_path,
+                    self.path_manager.image_process_dir,
+                    ProcessingConfig.THUMBNAIL_SIZE,
+                    ProcessingConfig.FORMATS,
+                    ProcessingConfig.WEBP_QUALITY,
+                    ProcessingConfig.AVIF_QUALITY
+                )
+            )
+        with span("image_store_put"):
+            return await asyncio.to_thread(self._store_result, image_key, result)
+
+    def _store_result(self, image_key: str, result: Dict) -> Dict:
+        """Move the processed files from process/ into the image store and return the result with their keys"""
+        self.image_store.put(result["image_path"], image_key)
+        variants = {}
+        for name, path in result["variants"].items():
+            variants[name] = self.image_store.key_for(os.path.basename(path))
+            self.image_store.put(path, variants[name])
+        return dict(result, image_path=image_key, variants=variants)
+
+    async def _process(self, prompt_id: str, image_keys: List[str]) -> None:
+        results = await asyncio.gather(
+            *(self._process_one(key) for key in image_keys), return_exceptions=True
+        )
+        for key, result in zip(image_keys, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing image {key} for prompt {prompt_id}: {str(result)}")
+        
+        primary = results[0]
+        if isinstance(primary, Exception):
+            fields = {"processing": "failed"}
+        else:
+            fields = dict(primary, processing="done")
+        if len(image_keys) > 1:
+            # Keep what was recorded on each candidate before processing, e.g. its quality scores
+            recorded = (await asyncio.to_thread(self.store.get, prompt_id) or {}).get("candidates") or []
+            recorded += [{}] * (len(image_keys) - len(recorded))
+            fields["candidates"] = [
+                dict(before, image_path=key) if isinstance(result, Exception) else dict(before, **result)
+                for before, key, result in zip(recorded, image_keys, results)
+            ]
+        await asyncio.to_thread(self.store.update, prompt_id, **fields)
+        processed = sum(not isinstance(result, Exception) for result in results)
+        logger.info("Processed images", extra={
+            "prompt_id": prompt_id, "processed": processed, "images": len(image_keys)
+        })
+
+    async def close(self) -> None:
+        """Cancel pending work and stop the worker processes"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
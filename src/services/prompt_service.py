@@ -1,56 +1,223 @@
+import asyncio
 import json
-import os
-from datetime import datetime
-from typing import Dict
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+from src.config.constants import (PromptCacheConfig, SpeculativeConfig,
+                                  StoreConfig)
+from src.services.similarity_service import SimilarityService
 from src.utils.agent import AzureOpenAIChat
+from src.utils.job_queue import JobQueue
+from src.utils.logger import logger
+from src.utils.metrics import (PROMPT_CACHE_LOOKUPS, PROMPTS_TOPPED_UP,
+                               SPECULATIVE_IMAGES, span)
 from src.utils.path_manager import PathManager
+from src.utils.prompt_cache import PromptCache
+from src.utils.prompt_store import PromptStore, create_prompt_store
+from src.utils.scheduler import flow_key
+from src.utils.singleflight import SingleFlight
 
 
 class PromptService:
-    def __init__(self):
-        self.path_manager = PathManager()
-        self.agent = AzureOpenAIChat()
+    def __init__(self, agent: Optional[AzureOpenAIChat] = None, store: Optional[PromptStore] = None,
+                 path_manager: Optional[PathManager] = None,
+                 similarity_service: Optional[SimilarityService] = None,
+                 prompt_cache: Optional[PromptCache] = None, top_up: bool = PromptCacheConfig.TOP_UP,
+                 job_queue: Optional[JobQueue] = None, daily_budget: int = SpeculativeConfig.DAILY_BUDGET,
+                 topic_budgets: Optional[Dict[str, int]] = None):
+        self.path_manager = path_manager or PathManager()
+        self.agent = agent or AzureOpenAIChat(path_manager=self.path_manager)
+        self.store = store or create_prompt_store(path_manager=self.path_manager)
+        self.similarity_service = similarity_service
+        self.prompt_cache = prompt_cache
+        self.top_up = top_up
+        # With a job queue, new prompts get their images generated speculatively
+        self.job_queue = job_queue
+        self.daily_budget = daily_budget
+        if topic_budgets is None:
+            topic_budgets = json.loads(SpeculativeConfig.TOPIC_BUDGETS)
+        self.topic_budgets = {PromptCache.normalize_topic(topic): budget for topic, budget in topic_budgets.items()}
+        self._flights = SingleFlight()
 
     def load_prompts(self) -> Dict:
-        """Load prompts from the JSON file"""
-        if not os.path.exists(self.path_manager.prompts_file):
-            return {}
-        with open(self.path_manager.prompts_file, 'r') as f:
-            return json.load(f)
+        """Load every prompt from the store"""
+        return self.store.all()
 
-    def save_prompts(self, prompts: Dict):
-        """Save prompts to the JSON file"""
-        with open(self.path_manager.prompts_file, 'w') as f:
-            json.dump(prompts, f, indent=4)
+    def get_prompt(self, prompt_id: str) -> Optional[Dict]:
+        """Load a single prompt from the store"""
+        return self.store.get(prompt_id)
+
+    def list_prompts(self, limit: int = StoreConfig.PAGE_SIZE, cursor: Optional[str] = None,
+                     fields: Optional[List[str]] = None, **filters) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Read one page of prompts.
+        
+        Args:
+            limit (int): Maximum number of prompts
+            cursor (Optional[str]): Cursor returned with the previous page
+            fields (Optional[List[str]]): Fields to return, None for all
+            **filters: topic, status, approved, created_from and created_to filters
+            
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The prompts, each with its prompt_id,
+                and the cursor of the next page, or None on the last page
+            
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        if cursor is not None and not cursor.isdigit():
+            raise ValueError(f"Invalid cursor: {cursor}")
+        # Read one extra record to tell whether another page follows
+        records = self.store.page(limit + 1, after_id=cursor, **filters)
+        prompt_ids = list(records)[:limit]
+        next_cursor = prompt_ids[-1] if len(records) > limit else None
+        
+        items = []
+        for prompt_id in prompt_ids:
+            record = records[prompt_id]
+            if fields is not None:
+                record = {field: record[field] for field in fields if field in record}
+            items.append({"prompt_id": prompt_id, **record})
+        return items, next_cursor
+
+    @staticmethod
+    def _new_record(prompt: str, topic: str, duplicate: Optional[Tuple[str, float]] = None) -> Dict:
+        record = {
+            "prompt": prompt,
+            "approved": False,
+            "image_path": None,
+            "status": "pending",
+            "created_at": datetime.now().isoformat(),
+            "topic": topic
+        }
+        if duplicate:
+            record["duplicate_of"], record["similarity"] = duplicate[0], round(duplicate[1], 4)
+        return record
 
     async def generate_prompts(self, topic: str, num_prompts: int = 10) -> Dict:
-        """Generate new prompts for a topic"""
+        """
+        Return prompts for a topic by ID.
+        
+        A batch generated for the same normalized topic and size within the
+        cache TTL is returned again, and concurrent identical requests share
+        one generation. With top-up enabled, a new batch starts with the
+        topic's unused pending prompts and only the rest is generated. With
+        speculative generation enabled, the images of newly generated prompts
+        are queued below bulk work, within the topic's daily budget.
+        
+        Args:
+            topic (str): The topic to generate prompts for
+            num_prompts (int): Number of prompts to generate
+            
+        Returns:
+            Dict: Prompt records by ID
+            
+        Raises:
+            ValueError: If the topic or number of prompts is invalid
+        """
+        if self.prompt_cache is None and not self.top_up:
+            return await self._generate_prompts(topic, num_prompts)
+        AzureOpenAIChat.validate_prompt_request(topic, num_prompts)
+        
+        key = PromptCache.key(topic, num_prompts)
+        if self.prompt_cache is not None:
+            prompt_ids = self.prompt_cache.get(key)
+            if prompt_ids is not None:
+                records = await asyncio.to_thread(self.store.get_many, prompt_ids)
+                if len(records) == len(prompt_ids):
+                    PROMPT_CACHE_LOOKUPS.inc(result="hit")
+                    return {prompt_id: records[prompt_id] for prompt_id in prompt_ids}
+            PROMPT_CACHE_LOOKUPS.inc(result="coalesced" if self._flights.in_flight(key) else "miss")
+        
+        return await self._flights.do(key, lambda: self._fill_batch(key, topic, num_prompts))
+
+    async def _fill_batch(self, key: Tuple[str, int], topic: str, num_prompts: int) -> Dict:
+        """Build a batch from unused prompts and new ones, and cache it"""
+        prompts = await asyncio.to_thread(self.store.find_unused, topic, num_prompts) if self.top_up else {}
+        if prompts:
+            PROMPTS_TOPPED_UP.inc(len(prompts))
+            logger.info("Topped up prompts", extra={"topic": topic, "reused": len(prompts), "requested": num_prompts})
+        if len(prompts) < num_prompts:
+            prompts.update(await self._generate_prompts(topic, num_prompts - len(prompts)))
+        if self.prompt_cache is not None:
+            self.prompt_cache.put(key, list(prompts))
+        return prompts
+
+    async def _generate_prompts(self, topic: str, num_prompts: int) -> Dict:
+        """Generate new prompts for a topic and return them by ID"""
         prompts = await self.agent.generate_prompts(topic, n=num_prompts)
-        prompts_dict = self.load_prompts()
         
-        # Get the next available ID
-        next_id = str(max([int(k) for k in prompts_dict.keys()] + [0]) + 1)
+        # Drop or flag near-duplicates of prompts we already have
+        duplicates = [None] * len(prompts)
+        if self.similarity_service:
+            with span("similarity_check"):
+                prompts, vectors, duplicates = await self.similarity_service.check_prompts(prompts)
+        
+        records = [self._new_record(prompt, topic, duplicate) for prompt, duplicate in zip(prompts, duplicates)]
+        
+        # Add new prompts to the store, which allocates their IDs
+        with span("store_write"):
+            added = await asyncio.to_thread(self.store.add_many, records)
+        if self.similarity_service:
+            await self.similarity_service.index_prompts(list(added), vectors)
+        if self.job_queue is not None:
+            await self._speculate(topic, added)
+        
+        return added
+
+    async def _speculate(self, topic: str, records: Dict[str, Dict]) -> None:
+        """Queue speculative image generation for new prompts, within the topic's budget for today"""
+        prompts = {
+            prompt_id: record["prompt"] for prompt_id, record in records.items() if not record.get("duplicate_of")
+        }
+        if not prompts:
+            return
+        normalized = PromptCache.normalize_topic(topic)
+        budget = self.topic_budgets.get(normalized, self.daily_budget)
+        queued = await self.job_queue.call(
+            self.job_queue.speculate, prompts, flow_key(topic=topic),
+            f"speculative:{date.today().isoformat()}:{normalized}", budget
+        )
+        SPECULATIVE_IMAGES.inc(len(queued), outcome="queued")
+        if len(queued) < len(prompts):
+            SPECULATIVE_IMAGES.inc(len(prompts) - len(queued), outcome="over_budget")
+            logger.info("Speculative generation budget spent",
+                        extra={"topic": topic, "queued": len(queued), "skipped": len(prompts) - len(queued)})
+
+    async def stream_prompts(self, topic: str, num_prompts: int = 10) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Generate prompts for a topic, storing and yielding each one as soon as it is complete.
         
-        # Add new prompts to the dictionary
-        for idx, prompt in enumerate(prompts, int(next_id)):
-            prompts_dict[str(idx)] = {
-                "prompt": prompt,
-                "approved": False,
-                "image_path": None,
-                "status": "pending",
-                "created_at": datetime.now().isoformat(),
-                "topic": topic
-            }
+        Every prompt is indexed before the next one is checked, so a repeat
+        within the same stream is flagged or rejected like a stored duplicate.
         
-        self.save_prompts(prompts_dict)
-        return prompts_dict
+        Args:
+            topic (str): The topic to generate prompts for
+            num_prompts (int): Number of prompts to generate
+            
+        Yields:
+            Tuple[str, Dict]: The new prompt's ID and record
+        """
+        async for prompt in self.agent.stream_prompts(topic, n=num_prompts):
+            duplicate = None
+            if self.similarity_service:
+                with span("similarity_check"):
+                    kept, vectors, duplicates = await self.similarity_service.check_prompts([prompt])
+                if not kept:
+                    continue
+                duplicate = duplicates[0]
+            
+            with span("store_write"):
+                added = await asyncio.to_thread(self.store.add_many, [self._new_record(prompt, topic, duplicate)])
+            if self.similarity_service:
+                await self.similarity_service.index_prompts(list(added), vectors)
+            
+            prompt_id, record = next(iter(added.items()))
+            yield prompt_id, record
 
     def update_prompt_status(self, prompt_id: str, status: str, image_path: str = None):
         """Update the status of a prompt"""
-        prompts_dict = self.load_prompts()
-        if prompt_id in prompts_dict:
-            prompts_dict[prompt_id]["status"] = status
-            if image_path:
-                prompts_dict[prompt_id]["image_path"] = image_path
-            self.save_prompts(prompts_dict) 
\ No newline at end of file
+        fields = {"status": status}
+        if image_path:
+            fields["image_path"] = image_path
+        self.store.update(prompt_id, **fields)
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config.constants import SimilarityConfig
+from src.utils.agent import AzureOpenAIChat
+from src.utils.image_store import ImageStore, LocalImageStore
+from src.utils.logger import logger
+from src.utils.path_manager import PathManager
+from src.utils.prompt_store import PromptStore
+from src.utils.vector_index import VectorIndex
+
+
+class SimilarityService:
+    """Embeds prompts and finds semantically similar prompts and images."""
+
+    def __init__(self, agent: AzureOpenAIChat, store: PromptStore,
+                 path_manager: Optional[PathManager] = None, index: Optional[VectorIndex] = None,
+                 image_store: Optional[ImageStore] = None):
+        self.agent = agent
+        self.store = store
+        self.path_manager = path_manager or PathManager()
+        self.index = index if index is not None else VectorIndex(self.path_manager.prompt_embeddings)
+        self.image_store = image_store or LocalImageStore(self.path_manager.image_store_dir)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches the embedding deployment accepts"""
+        batch_size = SimilarityConfig.EMBEDDING_BATCH_SIZE
+        batches = await asyncio.gather(*(
+            self.agent.embed_texts(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ))
+        return np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    async def check_prompts(self, prompts: List[str]) -> Tuple[List[str], np.ndarray, List[Optional[Tuple[str, float]]]]:
+        """
+        Compare freshly generated prompts with the store and with each other.
+        
+        Near-duplicates within the batch are always dropped. Near-duplicates of
+        stored prompts are dropped or kept depending on DUPLICATE_ACTION.
+        
+        Args:
+            prompts (List[str]): The generated prompts
+            
+        Returns:
+            Tuple: The prompts to keep, their embeddings, and for each kept
+                prompt the (prompt ID, similarity) of the stored prompt it
+                duplicates, or None
+        """
+        if not prompts:
+            return [], np.empty((0, 0), dtype=np.float32), []
+        
+        threshold = SimilarityConfig.DUPLICATE_THRESHOLD
+        vectors = VectorIndex.normalize(await self.embed(prompts))
+        matches = await asyncio.to_thread(self.index.search_many, vectors, 1)
+        
+        # Compare each prompt with the earlier ones of the same batch
+        batch_scores = np.triu(vectors @ vectors.T, k=1)
+        repeated = batch_scores.max(axis=0) >= threshold
+        
+        keep, duplicates = [], []
+        for i, match in enumerate(matches):
+            duplicate = match[0] if match and match[0][1] >= threshold else None
+            if repeated[i] or (duplicate and SimilarityConfig.DUPLICATE_ACTION == "reject"):
+                continue
+            keep.append(i)
+            duplicates.append(duplicate)
+        
+        dropped = len(prompts) - len(keep)
+        if dropped:
+            logger.info(f"Dropped {dropped} near-duplicate prompts out of {len(prompts)}")
+        return [prompts[i] for i in keep], vectors[keep], duplicates
+
+    async def index_prompts(self, prompt_ids: List[str], vectors: np.ndarray) -> None:
+        """Add embedded prompts to the index"""
+        if prompt_ids:
+            await asyncio.to_thread(self.index.add, prompt_ids, vectors)
+
+    async def find_reusable_image(self, prompt_id: str, prompt: str) -> Optional[Tuple[str, Dict, float]]:
+        """
+        Find a stored prompt similar enough to reuse its image.
+        
+        Args:
+            prompt_id (str): ID of the prompt an image is requested for
+            prompt (str): The prompt text
+            
+        Returns:
+            Optional[Tuple[str, Dict, float]]: (prompt ID, record, similarity) of
+                the best match with a stored image, or None
+        """
+        record = await asyncio.to_thread(self.store.get, prompt_id)
+        vector = self.index.get_vector(prompt_id) if record and record["prompt"] == prompt else None
+        if vector is None:
+            vector = (await self.embed([prompt]))[0]
+        
+        matches = await asyncio.to_thread(self.index.search, vector, SimilarityConfig.TOP_K, [prompt_id])
+        candidates = [(match_id, score) for match_id, score in matches
+                      if score >= SimilarityConfig.IMAGE_REUSE_THRESHOLD]
+        records = await asyncio.to_thread(self.store.get_many, [match_id for match_id, _ in candidates])
+        for match_id, score in candidates:
+            match = records.get(match_id)
+            if (match and match["image_path"] and match["status"] != "rejected"
+                    and await asyncio.to_thread(self.image_store.exists, match["image_path"])):
+                return match_id, match, score
+        return None
+
+    async def backfill(self) -> int:
+        """Embed and index stored prompts that are missing from the index"""
+        records = await asyncio.to_thread(self.store.all)
+        missing = {prompt_id: record["prompt"] for prompt_id, record in records.items()
+                   if prompt_id not in self.index}
+        if not missing:
+            return 0
+        
+        prompt_ids = list(missing)
+        vectors = await self.embed([missing[prompt_id] for prompt_id in prompt_ids])
+        await self.index_prompts(prompt_ids, vectors)
+        logger.info(f"Indexed {len(prompt_ids)} stored prompts for similarity search")
+        return len(prompt_ids)
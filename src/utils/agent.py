@@ -1,71 +1,167 @@
 import asyncio
+import json
 import os
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import (TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict,
+                    List, Optional, Tuple, Union)
 
-import aiohttp
-from openai import AzureOpenAI
-from PIL import Image
-from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureTextEmbedding
-from semantic_kernel.memory import VolatileMemoryStore
+import httpx
+import numpy as np
 
-from src.config.constants import AzureConfig, ImageConfig
+from src.config.constants import (AzureConfig, ConcurrencyConfig,
+                                  DownloadConfig, ImageConfig,
+                                  ResilienceConfig, SchedulerConfig)
+from src.utils.deployment_pool import (Deployment, DeploymentPool,
+                                       load_deployments)
+from src.utils.file_utils import link_or_copy
+from src.utils.image_cache import ImageCache
+from src.utils.image_header import has_image_trailer, parse_image_header
 from src.utils.logger import logger
+from src.utils.metrics import DOWNLOADED_BYTES, IMAGE_CACHE_LOOKUPS, span
 from src.utils.path_manager import PathManager
+from src.utils.resilience import estimate_tokens
+from src.utils.scheduler import (BULK, INTERACTIVE, SPECULATIVE,
+                                 FairScheduler)
+from src.utils.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI
+    from semantic_kernel import Kernel
+
+# Awaited with the URL of each requested image by save path, as soon as DALL-E returns them
+RequestedCallback = Callable[[Dict[str, str]], Awaitable[None]]
 
 
 class AzureOpenAIChat:
     """Azure OpenAI Chat agent for generating images and prompts."""
     
-    def __init__(self, max_retries: int = 3, timeout: int = 30):
+    def __init__(self, max_retries: int = ResilienceConfig.MAX_RETRIES, timeout: int = 30,
+                 max_concurrency: int = ConcurrencyConfig.MAX_IN_FLIGHT_REQUESTS,
+                 http_client: Optional[httpx.AsyncClient] = None,
+                 path_manager: Optional[PathManager] = None,
+                 image_cache: Optional[ImageCache] = None,
+                 deployments: Optional[Dict[str, List[Deployment]]] = None):
         """
         Initialize the Azure OpenAI Chat agent.
         
         Args:
             max_retries (int): Maximum number of retries for API calls
             timeout (int): Timeout in seconds for API calls
+            max_concurrency (int): Maximum number of API calls in flight at once, shared out
+                by the scheduler between interactive and bulk callers
+            http_client (Optional[httpx.AsyncClient]): Shared pooled HTTP client used for
+                API calls and image downloads
+            path_manager (Optional[PathManager]): Shared path manager
+            image_cache (Optional[ImageCache]): Cache of generated images, None disables caching
+            deployments (Optional[Dict[str, List[Deployment]]]): Deployments to balance the
+                chat, images and embeddings calls across, loaded from AzureConfig if omitted
         """
-        self._validate_config()
+        if deployments is None:
+            self._validate_config()
+            deployments = load_deployments()
         
-        self.api_key = AzureConfig.API_KEY
-        self.endpoint = AzureConfig.ENDPOINT
-        self.deployment = AzureConfig.GTP4_DEPLOYMENT
         self.api_version = "2024-02-15-preview"  # Updated API version for DALL-E 3
-        self.embedding_deployment = AzureConfig.EMBEDDING_DEPLOYMENT
-        self.dall_e_deployment = AzureConfig.DALL_E_DEPLOYMENT
-        
         self.max_retries = max_retries
         self.timeout = timeout
-        self.path_manager = PathManager()
+        self.max_concurrency = max_concurrency
+        self.scheduler = FairScheduler(
+            max_concurrency,
+            SchedulerConfig.INTERACTIVE_RESERVED,
+            {
+                INTERACTIVE: SchedulerConfig.MAX_QUEUED_INTERACTIVE,
+                BULK: SchedulerConfig.MAX_QUEUED_BULK,
+                SPECULATIVE: SchedulerConfig.MAX_QUEUED_BULK
+            },
+            json.loads(SchedulerConfig.FLOW_WEIGHTS)
+        )
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or httpx.AsyncClient()
+        self.path_manager = path_manager or PathManager()
+        self.image_cache = image_cache
+        self._image_flights = SingleFlight()
+        
+        self.resilience = self._initialize_resilience(deployments)
+        
+        # The primary deployments back the kernel and name the models in records
+        chat = self.resilience["chat"].primary
+        self.api_key = chat.api_key
+        self.endpoint = chat.endpoint
+        self.deployment = chat.deployment
+        self.embedding_deployment = self.resilience["embeddings"].primary.deployment
+        self.dall_e_deployment = self.resilience["images"].primary.deployment
+        
+        # The SDK clients and the kernel are built on first use to keep cold starts fast
+        self._clients: Dict[Tuple[str, str], "AsyncAzureOpenAI"] = {}
+        self._kernel: Optional["Kernel"] = None
+
+    def client(self, deployment: Deployment) -> "AsyncAzureOpenAI":
+        """Async Azure OpenAI client of a deployment's resource, created on first use"""
+        key = (deployment.endpoint, deployment.api_key)
+        if key not in self._clients:
+            self._clients[key] = self._initialize_client(*key)
+        return self._clients[key]
+
+    @property
+    def kernel(self) -> "Kernel":
+        """Semantic Kernel with the Azure services, created on first use"""
+        if self._kernel is None:
+            self._kernel = self._initialize_kernel()
+        return self._kernel
         
-        self.kernel = self._initialize_kernel()
-        self.memory = VolatileMemoryStore()
-        self.client = self._initialize_client()
+    def _initialize_client(self, endpoint: str, api_key: str) -> "AsyncAzureOpenAI":
+        """Initialize the async Azure OpenAI client of one resource"""
+        from openai import AsyncAzureOpenAI
         
-    def _initialize_client(self) -> AzureOpenAI:
-        """Initialize the Azure OpenAI client"""
-        return AzureOpenAI(
-            api_key=self.api_key,
+        return AsyncAzureOpenAI(
+            api_key=api_key,
             api_version=self.api_version,
-            azure_endpoint=self.endpoint,
-            timeout=self.timeout
+            azure_endpoint=endpoint,
+            timeout=self.timeout,
+            http_client=self.http_client,
+            # Retries are handled by the resilience policies
+            max_retries=0
         )
 
+    def _initialize_resilience(self, deployments: Dict[str, List[Deployment]]) -> Dict[str, DeploymentPool]:
+        """Create the pool that routes and fails over the calls of each kind"""
+        return {
+            kind: DeploymentPool(kind, deployments[kind], AzureConfig.ROUTING, self.max_retries)
+            for kind in ("chat", "images", "embeddings")
+        }
+
+    def resilience_stats(self) -> Dict[str, Dict]:
+        """Return the routing counters and the health, load and latency of each deployment"""
+        return {kind: pool.snapshot() for kind, pool in self.resilience.items()}
+
+    async def close(self) -> None:
+        """Close the underlying HTTP client."""
+        for client in self._clients.values():
+            await client.close()
+        if self._owns_http_client:
+            await self.http_client.aclose()
+
     def _validate_config(self) -> None:
         """Validate the configuration settings."""
         required_vars = [
             'API_KEY', 'ENDPOINT', 'GTP4_DEPLOYMENT', 'API_VERSION',
             'EMBEDDING_DEPLOYMENT', 'DALL_E_DEPLOYMENT'
         ]
+        # A deployment pool names its own endpoints and deployments and is checked when loaded
+        if AzureConfig.DEPLOYMENTS:
+            required_vars = []
         
         for var in required_vars:
             if not getattr(AzureConfig, var):
                 raise ValueError(f"Missing required configuration: {var}")
     
-    def _initialize_kernel(self) -> Kernel:
+    def _initialize_kernel(self) -> "Kernel":
         """Initialize the Semantic Kernel with Azure services."""
+        from semantic_kernel import Kernel
+        from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureTextEmbedding
+        
         kernel = Kernel()
         kernel.add_service(
             AzureChatCompletion(
@@ -75,11 +171,12 @@ class AzureOpenAIChat:
                 api_version=self.api_version
             )
         )
+        embeddings = self.resilience["embeddings"].primary
         kernel.add_service(
             AzureTextEmbedding(
-                deployment_name=self.embedding_deployment,
-                endpoint=self.endpoint,
-                api_key=self.api_key,
+                deployment_name=embeddings.deployment,
+                endpoint=embeddings.endpoint,
+                api_key=embeddings.api_key,
                 api_version=self.api_version
             )
         )
@@ -87,45 +184,94 @@ class AzureOpenAIChat:
 
     async def _download_image(self, url: str, save_path: Union[str, Path]) -> None:
         """
-        Download an image from a URL and save it to the specified path.
+        Stream an image from a URL to the specified path.
+        
+        The format and dimensions are checked from the header as soon as it
+        arrives, the body is written chunk by chunk to a temporary file next
+        to the destination, and the file is only renamed into place once the
+        whole image has been received and validated.
         
         Args:
             url (str): URL of the image to download
             save_path (Union[str, Path]): Path to save the image
+            
+        Raises:
+            ValueError: If the download fails or the image is invalid
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise ValueError(f"Failed to download image: {response.status}")
-                
-                with open(save_path, "wb") as f:
-                    f.write(await response.read())
+        with span("download"):
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(save_path)), suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    async with self.http_client.stream("GET", url, timeout=self.timeout) as response:
+                        if response.status_code != 200:
+                            raise ValueError(f"Failed to download image: {response.status_code}")
+                    
+                        header, image_info, received, tail = b"", None, 0, b""
+                        async for chunk in response.aiter_bytes(DownloadConfig.CHUNK_SIZE):
+                            received += len(chunk)
+                            if received > DownloadConfig.MAX_IMAGE_BYTES:
+                                raise ValueError(f"Image larger than {DownloadConfig.MAX_IMAGE_BYTES} bytes")
+                            if image_info is None:
+                                header += chunk
+                                image_info = self._validate_image_header(header)
+                            tail = (tail + chunk[-16:])[-16:]
+                            f.write(chunk)
+            
+                if image_info is None:
+                    raise ValueError("Invalid image file: incomplete header")
+                if not has_image_trailer(image_info[0], tail):
+                    raise ValueError("Invalid image file: truncated download")
+                os.replace(temp_path, save_path)
+                DOWNLOADED_BYTES.inc(received)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
     
-    def _validate_image(self, image_path: Union[str, Path]) -> None:
+    def _validate_image_header(self, header: bytes) -> Optional[Tuple[str, int, int]]:
         """
-        Validate the downloaded image.
+        Validate the format and size of an image from its leading bytes.
         
         Args:
-            image_path (Union[str, Path]): Path to the image file
+            header (bytes): The bytes received so far
+            
+        Returns:
+            Optional[Tuple[str, int, int]]: (format, width, height), or None if
+                more bytes are needed
         """
         try:
-            with Image.open(image_path) as img:
-                if img.format not in ['PNG', 'JPEG']:
-                    raise ValueError(f"Unsupported image format: {img.format}")
-                
-                width, height = img.size
-                if width < 256 or height < 256:
-                    raise ValueError(f"Image too small: {width}x{height}")
-        except Exception as e:
+            image_info = parse_image_header(header)
+        except ValueError as e:
             raise ValueError(f"Invalid image file: {str(e)}")
+        
+        if image_info is None:
+            if len(header) > DownloadConfig.MAX_HEADER_BYTES:
+                raise ValueError("Invalid image file: header not found")
+            return None
+        
+        image_format, width, height = image_info
+        if width < DownloadConfig.MIN_DIMENSION or height < DownloadConfig.MIN_DIMENSION:
+            raise ValueError(f"Invalid image file: Image too small: {width}x{height}")
+        return image_info
 
-    async def generate_image(self, prompt: str, save_path: Optional[Union[str, Path]] = None) -> str:
+    async def generate_image(self, prompt: str, save_path: Optional[Union[str, Path]] = None,
+                             size: str = ImageConfig.IMAGE_SIZE,
+                             quality: str = ImageConfig.IMAGE_QUALITY,
+                             style: str = ImageConfig.IMAGE_STYLE,
+                             image_urls: Optional[Dict[str, str]] = None,
+                             on_requested: Optional[RequestedCallback] = None) -> str:
         """
         Generate an image using DALL-E 3 and save it to the specified path.
         
         Args:
             prompt (str): The prompt to generate the image from
             save_path (Optional[Union[str, Path]]): Path to save the image
+            size (str): Image size, e.g. "1024x1024"
+            quality (str): Image quality, "standard" or "hd"
+            style (str): Image style, "natural" or "vivid"
+            image_urls (Optional[Dict[str, str]]): URLs of images already generated,
+                by save path; these are downloaded instead of requested again
+            on_requested (Optional[RequestedCallback]): Awaited with the URL by
+                save path as soon as DALL-E returns it, before the download
             
         Returns:
             str: Path to the saved image
@@ -137,50 +283,210 @@ class AzureOpenAIChat:
         if not prompt or len(prompt.strip()) < 10:
             raise ValueError("Prompt must be at least 10 characters long")
         
+        # Generate save path if not provided
+        if save_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"image_{timestamp}.png"
+            save_path = os.path.join(self.path_manager.image_ingest_dir, filename)
+        
+        async def requested(url: str) -> None:
+            if on_requested:
+                await on_requested({str(save_path): url})
+        
+        started = time.perf_counter()
         try:
-            logger.info(f"Generating image for prompt: {prompt}")
-            
-            for attempt in range(self.max_retries):
-                try:
-                    response = self.client.images.generate(
-                        model=self.dall_e_deployment,
-                        prompt=prompt,
-                        n=1,
-                        size=ImageConfig.IMAGE_SIZE,
-                        quality=ImageConfig.IMAGE_QUALITY,
-                        style=ImageConfig.IMAGE_STYLE
-                    )
-                    break
-                except Exception as e:
-                    if attempt == self.max_retries - 1:
-                        raise
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                    await asyncio.sleep(2 ** attempt)
-            
-            if not response.data:
-                raise ValueError("No image data received from API")
-            
-            image_url = response.data[0].url
-            if not image_url:
-                raise ValueError("No image URL in response")
-            
-            # Generate save path if not provided
-            if save_path is None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"image_{timestamp}.png"
-                save_path = os.path.join(self.path_manager.image_ingest_dir, filename)
-            
-            # Download and validate the image
-            await self._download_image(image_url, save_path)
-            self._validate_image(save_path)
-            
-            logger.info(f"Image generated and saved to: {save_path}")
+            resume_url = (image_urls or {}).get(str(save_path))
+            if resume_url:
+                await self._download_image(resume_url, save_path)
+            elif self.image_cache is None:
+                await self._generate_image_file(prompt, save_path, size, quality, style, requested)
+            else:
+                # Identical requests share one cached image and one in-flight generation
+                key = ImageCache.key(prompt, size, quality, style)
+                cached_path = await self._image_flights.do(
+                    key, lambda: self._generate_cached_image(key, prompt, size, quality, style, requested)
+                )
+                with span("cache_link"):
+                    await asyncio.to_thread(link_or_copy, cached_path, str(save_path))
+            
+            logger.info("Image generated", extra={
+                "save_path": str(save_path),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            })
             return str(save_path)
             
         except Exception as e:
             logger.error(f"Error generating image: {str(e)}")
             raise
 
+    async def _generate_cached_image(self, key: str, prompt: str, size: str, quality: str, style: str,
+                                     on_requested: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+        """
+        Return the cached image for a key, generating it into the cache on a miss.
+        
+        Returns:
+            str: Path of the cached image
+        """
+        cached_path = self.image_cache.get(key)
+        if cached_path:
+            IMAGE_CACHE_LOOKUPS.inc(result="hit")
+            logger.debug("Image cache hit", extra={"cache_key": key})
+            return cached_path
+        IMAGE_CACHE_LOOKUPS.inc(result="miss")
+        
+        staging_path = self.image_cache.staging_path()
+        try:
+            await self._generate_image_file(prompt, staging_path, size, quality, style, on_requested)
+        except BaseException:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            raise
+        return await asyncio.to_thread(self.image_cache.put, key, staging_path)
+
+    def discard_cached_image(self, prompt: str, size: str = ImageConfig.IMAGE_SIZE,
+                             quality: str = ImageConfig.IMAGE_QUALITY,
+                             style: str = ImageConfig.IMAGE_STYLE) -> None:
+        """Drop a prompt's cached image, so that the next request generates a new one"""
+        if self.image_cache is not None:
+            self.image_cache.discard(ImageCache.key(prompt, size, quality, style))
+
+    async def generate_images(self, prompt: str, save_paths: List[Union[str, Path]],
+                              size: str = ImageConfig.IMAGE_SIZE,
+                              quality: str = ImageConfig.IMAGE_QUALITY,
+                              style: str = ImageConfig.IMAGE_STYLE,
+                              image_urls: Optional[Dict[str, str]] = None,
+                              on_requested: Optional[RequestedCallback] = None) -> List[str]:
+        """
+        Generate several candidate images for one prompt.
+        
+        Candidates are requested `ImageConfig.MAX_IMAGES_PER_CALL` at a time in
+        parallel calls and every returned image is downloaded concurrently.
+        Multiple candidates bypass the image cache, which would return the
+        same image for each of them.
+        
+        Args:
+            prompt (str): The prompt to generate the images from
+            save_paths (List[Union[str, Path]]): One path per candidate
+            size (str): Image size, e.g. "1024x1024"
+            quality (str): Image quality, "standard" or "hd"
+            style (str): Image style, "natural" or "vivid"
+            image_urls (Optional[Dict[str, str]]): URLs of images already generated,
+                by save path; these are downloaded instead of requested again
+            on_requested (Optional[RequestedCallback]): Awaited with the URLs by
+                save path of each call as soon as DALL-E returns them
+            
+        Returns:
+            List[str]: Paths of the saved images in save_paths order, without
+                the candidates that failed
+            
+        Raises:
+            ValueError: If the prompt is invalid
+            Exception: The first error if every candidate failed
+        """
+        if len(save_paths) == 1:
+            return [await self.generate_image(prompt, save_paths[0], size, quality, style, image_urls, on_requested)]
+        if not prompt or len(prompt.strip()) < 10:
+            raise ValueError("Prompt must be at least 10 characters long")
+        
+        logger.debug("Generating candidate images", extra={"candidates": len(save_paths), "prompt_chars": len(prompt)})
+        image_urls = image_urls or {}
+        pending = [path for path in save_paths if str(path) not in image_urls]
+        per_call = max(1, ImageConfig.MAX_IMAGES_PER_CALL)
+        batches = [pending[i:i + per_call] for i in range(0, len(pending), per_call)]
+        
+        async def generate_batch(batch: List[Union[str, Path]]) -> Dict[str, Optional[BaseException]]:
+            try:
+                urls = await self._request_image_urls(prompt, len(batch), size, quality, style)
+            except Exception as e:
+                return {str(path): e for path in batch}
+            if on_requested:
+                await on_requested({str(path): url for path, url in zip(batch, urls)})
+            results = await asyncio.gather(
+                *(self._download_image(url, path) for url, path in zip(urls, batch)),
+                return_exceptions=True
+            )
+            outcome = {str(path): ValueError("No image URL in response") for path in batch[len(urls):]}
+            outcome.update((str(path), result) for path, result in zip(batch, results))
+            return outcome
+        
+        async def resume(path: Union[str, Path]) -> Dict[str, Optional[BaseException]]:
+            try:
+                await self._download_image(image_urls[str(path)], path)
+                return {str(path): None}
+            except Exception as e:
+                return {str(path): e}
+        
+        outcomes = {}
+        for outcome in await asyncio.gather(
+            *(generate_batch(batch) for batch in batches),
+            *(resume(path) for path in save_paths if str(path) in image_urls)
+        ):
+            outcomes.update(outcome)
+        
+        saved = [str(path) for path in save_paths if outcomes[str(path)] is None]
+        errors = [outcomes[str(path)] for path in save_paths if outcomes[str(path)] is not None]
+        
+        if not saved:
+            logger.error(f"Error generating images: {str(errors[0])}")
+            raise errors[0]
+        if errors:
+            logger.warning("Some candidate images failed", extra={"failed": len(errors), "candidates": len(save_paths)})
+        return saved
+
+    async def _request_image_urls(self, prompt: str, n: int, size: str, quality: str, style: str) -> List[str]:
+        """Call DALL-E for n images and return their download URLs."""
+        async def request(deployment: Deployment):
+            async with self.scheduler.slot():
+                return await self.client(deployment).images.generate(
+                    model=deployment.deployment,
+                    prompt=prompt,
+                    n=n,
+                    size=size,
+                    quality=quality,
+                    style=style
+                )
+        
+        with span("images_api"):
+            response = await self.resilience["images"].call(request)
+        
+        if not response.data:
+            raise ValueError("No image data received from API")
+        
+        image_urls = [item.url for item in response.data if item.url]
+        if not image_urls:
+            raise ValueError("No image URL in response")
+        return image_urls
+
+    async def _generate_image_file(self, prompt: str, save_path: Union[str, Path],
+                                   size: str, quality: str, style: str,
+                                   on_requested: Optional[Callable[[str], Awaitable[None]]] = None) -> None:
+        """Call DALL-E 3 and download the resulting image to save_path."""
+        logger.debug("Generating image", extra={"prompt_chars": len(prompt)})
+        image_urls = await self._request_image_urls(prompt, 1, size, quality, style)
+        if on_requested:
+            await on_requested(image_urls[0])
+        
+        # Download and validate the image
+        await self._download_image(image_urls[0], save_path)
+
+    @staticmethod
+    def validate_prompt_request(topic: str, n: int) -> None:
+        """Raise ValueError if prompts cannot be generated for the topic and count"""
+        if not topic or len(topic.strip()) < 3:
+            raise ValueError("Topic must be at least 3 characters long")
+        
+        if n < 1 or n > 20:
+            raise ValueError("Number of prompts must be between 1 and 20")
+
+    @staticmethod
+    def _prompt_instructions(topic: str, n: int) -> str:
+        return (
+            f"You are a creative prompt generator for DALL-E. Given the topic '{topic}', "
+            f"generate {n} unique, detailed, and imaginative prompts for image generation. "
+            f"Each prompt should be descriptive and specific. "
+            f"Return only the list of prompts, one per line, no numbering or extra text."
+        )
+
     async def generate_prompts(self, topic: str, n: int = 10) -> List[str]:
         """
         Generate a list of creative prompts for a given topic.
@@ -195,24 +501,15 @@ class AzureOpenAIChat:
         Raises:
             ValueError: If the topic is invalid or prompt generation fails
         """
-        if not topic or len(topic.strip()) < 3:
-            raise ValueError("Topic must be at least 3 characters long")
-        
-        if n < 1 or n > 20:
-            raise ValueError("Number of prompts must be between 1 and 20")
+        self.validate_prompt_request(topic, n)
         
         try:
-            system_prompt = (
-                f"You are a creative prompt generator for DALL-E. Given the topic '{topic}', "
-                f"generate {n} unique, detailed, and imaginative prompts for image generation. "
-                f"Each prompt should be descriptive and specific. "
-                f"Return only the list of prompts, one per line, no numbering or extra text."
-            )
+            system_prompt = self._prompt_instructions(topic, n)
             
-            for attempt in range(self.max_retries):
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.deployment,
+            async def request(deployment: Deployment):
+                async with self.scheduler.slot():
+                    return await self.client(deployment).chat.completions.create(
+                        model=deployment.deployment,
                         messages=[
                             {"role": "system", "content": system_prompt},
                         ],
@@ -220,12 +517,9 @@ class AzureOpenAIChat:
                         temperature=0.9,
                         timeout=self.timeout
                     )
-                    break
-                except Exception as e:
-                    if attempt == self.max_retries - 1:
-                        raise
-                    logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                    await asyncio.sleep(2 ** attempt)
+            
+            with span("chat_api"):
+                response = await self.resilience["chat"].call(request, tokens=estimate_tokens(system_prompt) + 500)
             
             prompts_text = response.choices[0].message.content.strip()
             prompts = [p.strip() for p in prompts_text.split("\n") if p.strip()]
@@ -237,4 +531,99 @@ class AzureOpenAIChat:
             
         except Exception as e:
             logger.error(f"Error generating prompts: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+
+    async def stream_prompts(self, topic: str, n: int = 10) -> AsyncIterator[str]:
+        """
+        Generate prompts for a topic, yielding each one as soon as its line is complete.
+        
+        The completion is requested with the streaming API; only opening the
+        stream is retried and counted against the concurrency limit, since a
+        partially consumed stream cannot be replayed.
+        
+        Args:
+            topic (str): The topic to generate prompts for
+            n (int): Number of prompts to generate
+            
+        Yields:
+            str: The next generated prompt
+            
+        Raises:
+            ValueError: If the topic is invalid
+        """
+        self.validate_prompt_request(topic, n)
+        system_prompt = self._prompt_instructions(topic, n)
+        
+        async def request(deployment: Deployment):
+            async with self.scheduler.slot():
+                return await self.client(deployment).chat.completions.create(
+                    model=deployment.deployment,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                    ],
+                    max_tokens=500,
+                    temperature=0.9,
+                    timeout=self.timeout,
+                    stream=True
+                )
+        
+        try:
+            with span("chat_api_stream_open"):
+                stream = await self.resilience["chat"].call(request, tokens=estimate_tokens(system_prompt) + 500)
+            yielded, buffer = 0, ""
+            try:
+                async for chunk in stream:
+                    # Azure sends content-filter chunks without choices
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    buffer += chunk.choices[0].delta.content
+                    *lines, buffer = buffer.split("\n")
+                    for line in lines:
+                        if line.strip() and yielded < n:
+                            yielded += 1
+                            yield line.strip()
+                if buffer.strip() and yielded < n:
+                    yielded += 1
+                    yield buffer.strip()
+            finally:
+                await stream.response.aclose()
+            
+            if yielded < n:
+                logger.warning(f"Generated only {yielded} prompts instead of {n}")
+                
+        except Exception as e:
+            logger.error(f"Error streaming prompts: {str(e)}")
+            raise
+
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with the embedding deployment.
+        
+        Args:
+            texts (List[str]): Texts to embed
+            
+        Returns:
+            np.ndarray: float32 matrix with one row per text
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        try:
+            async def request(deployment: Deployment):
+                async with self.scheduler.slot():
+                    return await self.client(deployment).embeddings.create(
+                        model=deployment.deployment,
+                        input=texts
+                    )
+            
+            with span("embeddings_api"):
+                response = await self.resilience["embeddings"].call(
+                    request, tokens=sum(estimate_tokens(text) for text in texts)
+                )
+            
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return np.array([item.embedding for item in ordered], dtype=np.float32)
+            
+        except Exception as e:
+            logger.error(f"Error embedding texts: {str(e)}")
+            raise
@@ -0,0 +1,330 @@
+import asyncio
+import json
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, TypeVar, Union
+
+from src.config.constants import AzureConfig, ResilienceConfig
+from src.utils.logger import logger
+from src.utils.metrics import API_CALL_SECONDS, API_RETRIES
+from src.utils.resilience import (FATAL, THROTTLED, CircuitOpenError,
+                                  ResiliencePolicy, classify_error,
+                                  retry_after_seconds)
+
+T = TypeVar("T")
+
+KINDS = ("chat", "images", "embeddings")
+
+LEAST_OUTSTANDING = "least_outstanding"
+REMAINING_QUOTA = "remaining_quota"
+
+# Weight of the newest call in a deployment's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+
+class Deployment:
+    """
+    One model deployment of a pool: where it lives, its share of the traffic,
+    its quota and circuit breaker, and how it is currently doing.
+    """
+
+    def __init__(self, kind: str, deployment: str, endpoint: str, api_key: str,
+                 name: Optional[str] = None, region: str = "", weight: float = 1.0,
+                 rpm: float = 0, tpm: float = 0):
+        """
+        Initialize the deployment.
+
+        Args:
+            kind (str): "chat", "images" or "embeddings"
+            deployment (str): Deployment name on the Azure OpenAI resource
+            endpoint (str): Endpoint of the resource
+            api_key (str): API key of the resource
+            name (Optional[str]): Unique name used in logs, stats and metrics,
+                defaults to "<region>/<deployment>"
+            region (str): Region of the resource, informational
+            weight (float): Relative share of the traffic the deployment takes
+            rpm (float): Requests per minute quota, 0 for unlimited
+            tpm (float): Tokens per minute quota, 0 for unlimited
+
+        Raises:
+            ValueError: If the kind or weight is invalid or a setting is missing
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown deployment kind: {kind}")
+        if not deployment or not endpoint or not api_key:
+            raise ValueError(f"Deployment {name or deployment} needs a deployment, endpoint and api_key")
+        if weight <= 0:
+            raise ValueError(f"Weight of deployment {name or deployment} must be positive")
+
+        self.kind = kind
+        self.deployment = deployment
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.region = region
+        self.name = name or (f"{region}/{deployment}" if region else deployment)
+        self.weight = float(weight)
+        # The pool fails over to another deployment instead of retrying this one
+        self.policy = ResiliencePolicy(self.name, rpm, tpm, max_retries=1)
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+
+    def accepting(self) -> bool:
+        """Return whether the circuit breaker lets a call through"""
+        return self.policy.breaker.allows_call()
+
+    def paused_for(self) -> float:
+        """Seconds left of the pause a 429 put the deployment in"""
+        return self.policy.requests.paused_for()
+
+    def remaining_quota(self) -> float:
+        """Fraction of the request and token budget usable without waiting"""
+        return min(self.policy.requests.remaining(), self.policy.tokens.remaining())
+
+    def health(self) -> str:
+        """Return healthy, throttled, half_open or open"""
+        if self.policy.breaker.state != "closed":
+            return self.policy.breaker.state
+        return "throttled" if self.paused_for() else "healthy"
+
+    def observe(self, seconds: float) -> None:
+        """Record the latency of a successful call"""
+        API_CALL_SECONDS.observe(seconds, deployment=self.name)
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def snapshot(self) -> Dict:
+        """Return the counters, load, health and latency of the deployment"""
+        return dict(
+            self.policy.snapshot(),
+            name=self.name,
+            deployment=self.deployment,
+            endpoint=self.endpoint,
+            region=self.region,
+            weight=self.weight,
+            health=self.health(),
+            outstanding=self.outstanding,
+            remaining_quota=round(self.remaining_quota(), 3),
+            latency_ms=round(self.latency * 1000, 1) if self.latency is not None else None,
+        )
+
+
+class DeploymentPool:
+    """
+    Routes the calls of one kind across several deployments.
+
+    Each call goes to the deployment with the fewest outstanding requests per
+    unit of weight, or with the most remaining quota, among those whose
+    circuit is closed and that are not paused by a 429. A deployment that
+    throttles or fails is skipped for the rest of the call, which fails over
+    to the next one at once; only when every deployment has been tried does
+    the call wait, for the shortest Retry-After or a jittered backoff, before
+    another round.
+    """
+
+    def __init__(self, kind: str, deployments: List[Deployment], strategy: str = LEAST_OUTSTANDING,
+                 max_retries: int = ResilienceConfig.MAX_RETRIES,
+                 backoff_base: float = ResilienceConfig.BACKOFF_BASE,
+                 backoff_max: float = ResilienceConfig.BACKOFF_MAX):
+        """
+        Initialize the pool.
+
+        Args:
+            kind (str): Kind of the deployments, used in logs
+            deployments (List[Deployment]): Deployments to route across, the first
+                one being the primary
+            strategy (str): LEAST_OUTSTANDING or REMAINING_QUOTA
+            max_retries (int): Maximum attempts per call; every deployment is
+                tried at least once regardless
+            backoff_base (float): Base delay in seconds of the exponential backoff
+            backoff_max (float): Upper bound in seconds of a single backoff
+
+        Raises:
+            ValueError: If there are no deployments or the strategy is unknown
+        """
+        if not deployments:
+            raise ValueError(f"No {kind} deployment configured")
+        if strategy not in (LEAST_OUTSTANDING, REMAINING_QUOTA):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.kind = kind
+        self.deployments = deployments
+        self.strategy = strategy
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"calls": 0, "failovers": 0}
+
+    @property
+    def primary(self) -> Deployment:
+        return self.deployments[0]
+
+    def snapshot(self) -> Dict:
+        """Return the routing counters and the state of every deployment"""
+        return dict(self.stats, strategy=self.strategy,
+                    deployments=[deployment.snapshot() for deployment in self.deployments])
+
+    def _rank(self, deployment: Deployment) -> tuple:
+        load = (deployment.outstanding + 1) / deployment.weight
+        if self.strategy == REMAINING_QUOTA:
+            return -deployment.remaining_quota(), load
+        return load, -deployment.remaining_quota()
+
+    def choose(self, exclude: Set[Deployment] = frozenset()) -> Optional[Deployment]:
+        """
+        Pick the deployment for the next attempt.
+
+        Args:
+            exclude (Set[Deployment]): Deployments already tried by the call
+
+        Returns:
+            Optional[Deployment]: The best deployment, or None if every other
+                deployment's circuit is open
+        """
+        candidates = [d for d in self.deployments if d not in exclude and d.accepting()]
+        ready = [d for d in candidates if not d.paused_for()]
+        if ready:
+            return min(ready, key=self._rank)
+        # Every candidate is paused by a 429: take the one that resumes first
+        return min(candidates, key=lambda d: d.paused_for(), default=None)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(self, fn: Callable[[Deployment], Awaitable[T]], tokens: float = 0) -> T:
+        """
+        Run an API call on the best deployment, failing over on throttling and errors.
+
+        Args:
+            fn (Callable[[Deployment], Awaitable[T]]): Makes one attempt of the call
+                against the given deployment
+            tokens (float): Estimated tokens the call consumes
+
+        Returns:
+            T: The call's result
+
+        Raises:
+            CircuitOpenError: If every deployment's circuit is open
+            Exception: A fatal error, or the last error once the attempts are exhausted
+        """
+        self.stats["calls"] += 1
+        tried: Set[Deployment] = set()
+        rounds = 0
+        error: Optional[Exception] = None
+        for attempt in range(max(self.max_retries, len(self.deployments))):
+            deployment = self.choose(tried)
+            if tried and (deployment is None or deployment.paused_for()):
+                # Every deployment failed or is held back by a 429: wait, then start another round
+                tried.clear()
+                deployment = self.choose()
+                if deployment is not None:
+                    paused = deployment.paused_for()
+                    # Spread the restart so callers held back by a 429 do not retry in lockstep
+                    await asyncio.sleep(paused + random.uniform(0, min(1.0, paused / 10)) if paused
+                                        else self._backoff(rounds))
+                    rounds += 1
+            if deployment is None:
+                if error is not None:
+                    raise error
+                raise CircuitOpenError(f"Circuit open on every {self.kind} deployment, try again later")
+
+            if tried and deployment not in tried:
+                self.stats["failovers"] += 1
+            tried.add(deployment)
+            deployment.outstanding += 1
+            started = time.perf_counter()
+            try:
+                result = await deployment.policy.call(lambda: fn(deployment), tokens)
+            except CircuitOpenError as e:
+                error = e
+                continue
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == FATAL:
+                    raise
+                error = e
+                if kind == THROTTLED:
+                    delay = retry_after_seconds(e)
+                    deployment.policy.requests.pause(delay if delay is not None else self._backoff(rounds))
+                API_RETRIES.inc(deployment=deployment.name, kind=kind)
+                logger.warning("Deployment call failed, failing over", extra={
+                    "deployment": deployment.name,
+                    "attempt": attempt + 1,
+                    "error_kind": kind,
+                    "error": str(e)
+                })
+                continue
+            finally:
+                deployment.outstanding -= 1
+
+            deployment.observe(time.perf_counter() - started)
+            return result
+        raise error
+
+
+def load_deployments(config: Union[str, List[Dict], None] = None) -> Dict[str, List[Deployment]]:
+    """
+    Build the deployments of each kind from the configuration.
+
+    The configuration is a JSON list with one object per deployment, e.g.
+    [{"kind": "images", "deployment": "dall-e-3", "endpoint": "https://eastus.example.com",
+    "region": "eastus", "weight": 2, "rpm": 6}]; "endpoint" and "api_key" default
+    to the single-deployment settings. Without a configuration, one deployment
+    of each kind is built from those settings and the ResilienceConfig quotas.
+
+    Args:
+        config (Union[str, List[Dict], None]): JSON text or parsed list, defaults
+            to AzureConfig.DEPLOYMENTS
+
+    Returns:
+        Dict[str, List[Deployment]]: Deployments by kind, in configuration order
+
+    Raises:
+        ValueError: If the configuration is malformed or a kind has no deployment
+    """
+    config = config if config is not None else AzureConfig.DEPLOYMENTS
+    if not config:
+        return {
+            "chat": [Deployment("chat", AzureConfig.GTP4_DEPLOYMENT, AzureConfig.ENDPOINT, AzureConfig.API_KEY,
+                                rpm=ResilienceConfig.GPT4_RPM, tpm=ResilienceConfig.GPT4_TPM)],
+            "images": [Deployment("images", AzureConfig.DALL_E_DEPLOYMENT, AzureConfig.ENDPOINT, AzureConfig.API_KEY,
+                                  rpm=ResilienceConfig.DALLE_RPM)],
+            "embeddings": [Deployment("embeddings", AzureConfig.EMBEDDING_DEPLOYMENT, AzureConfig.ENDPOINT,
+                                      AzureConfig.API_KEY, rpm=ResilienceConfig.EMBEDDING_RPM,
+                                      tpm=ResilienceConfig.EMBEDDING_TPM)],
+        }
+
+    if isinstance(config, str):
+        try:
+            config = json.loads(config)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid deployment configuration: {str(e)}")
+    if not isinstance(config, list):
+        raise ValueError("Deployment configuration must be a JSON list")
+
+    deployments: Dict[str, List[Deployment]] = {kind: [] for kind in KINDS}
+    for entry in config:
+        try:
+            deployment = Deployment(
+                kind=entry["kind"],
+                deployment=entry["deployment"],
+                endpoint=entry.get("endpoint", AzureConfig.ENDPOINT),
+                api_key=entry.get("api_key", AzureConfig.API_KEY),
+                name=entry.get("name"),
+                region=entry.get("region", ""),
+                weight=float(entry.get("weight", 1)),
+                rpm=float(entry.get("rpm", 0)),
+                tpm=float(entry.get("tpm", 0)),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid deployment {entry}: missing or malformed {str(e)}")
+        deployments[deployment.kind].append(deployment)
+
+    names = [deployment.name for pool in deployments.values() for deployment in pool]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Deployment names must be unique: {', '.join(duplicates)}")
+    for kind, pool in deployments.items():
+        if not pool:
+            raise ValueError(f"No {kind} deployment configured")
+    return deployments
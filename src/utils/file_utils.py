@@ -0,0 +1,63 @@
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """Hard-link a file to a destination, copying it across filesystems"""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def atomic_write(path: str, data: str) -> None:
+    """
+    Replace a file's contents so readers see either the old or the new file.
+
+    The data is written to a temporary file in the same directory, flushed to
+    disk and renamed over the destination.
+
+    Args:
+        path (str): File to write
+        data (str): New contents
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock shared by every process on this host.
+
+    The lock is taken on a `<path>.lock` sidecar file, which is never replaced,
+    so it stays valid while the file it guards is renamed over.
+
+    Args:
+        path (str): File the lock guards
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
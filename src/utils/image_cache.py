@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class ImageCache:
+    """
+    Content-addressed, size-bounded store of generated images.
+
+    Images are keyed by a hash of the normalized prompt and the generation
+    parameters, stored once under a sharded directory, and handed out as
+    hard links. The least recently used entries are evicted once the cache
+    grows past its byte limit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Initialize the cache, indexing images already on disk.
+
+        Args:
+            directory (str): Cache root directory
+            max_bytes (int): Total size above which old entries are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(prompt: str, size: str, quality: str, style: str) -> str:
+        """Hash a prompt and its generation parameters into a cache key"""
+        normalized = " ".join(prompt.split()).casefold()
+        payload = json.dumps([normalized, size, quality, style], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _scan(self) -> None:
+        """Rebuild the LRU order from the files' access times."""
+        entries = []
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                if filename.endswith(".png"):
+                    stat = os.stat(os.path.join(shard_dir, filename))
+                    entries.append((stat.st_atime, filename[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached image path for a key and mark it recently used"""
+        with self._lock:
+            if key in self._entries and os.path.exists(self._path(key)):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._path(key)
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self.misses += 1
+            return None
+
+    def staging_path(self) -> str:
+        """Return a fresh temporary path inside the cache for a new image"""
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        return path
+
+    def put(self, key: str, source_path: str) -> str:
+        """
+        Move an image into the cache under a key and evict old entries.
+
+        Args:
+            key (str): Cache key
+            source_path (str): Image to adopt, on the same filesystem as the cache
+
+        Returns:
+            str: Path of the cached image
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+        return path
+
+    def discard(self, key: str) -> None:
+        """Remove an entry, e.g. an image found unfit after it was cached"""
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,71 @@
+import struct
+from typing import Optional, Tuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TRAILER = b"IEND\xaeB`\x82"
+JPEG_SIGNATURE = b"\xff\xd8"
+JPEG_TRAILER = b"\xff\xd9"
+
+# JPEG start-of-frame markers that carry the image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def parse_image_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Read the format and dimensions from the leading bytes of a PNG or JPEG.
+
+    Args:
+        data (bytes): The first bytes of the file received so far
+
+    Returns:
+        Optional[Tuple[str, int, int]]: (format, width, height), or None if
+            more bytes are needed to decide
+
+    Raises:
+        ValueError: If the bytes are not a PNG or JPEG header
+    """
+    if len(data) < 8:
+        if PNG_SIGNATURE.startswith(data[:8]) or JPEG_SIGNATURE.startswith(data[:2]):
+            return None
+        raise ValueError("Unsupported image format")
+
+    if data.startswith(PNG_SIGNATURE):
+        if len(data) < 24:
+            return None
+        if data[12:16] != b"IHDR":
+            raise ValueError("Malformed PNG header")
+        width, height = struct.unpack(">II", data[16:24])
+        return "PNG", width, height
+
+    if data.startswith(JPEG_SIGNATURE):
+        return _parse_jpeg_header(data)
+
+    raise ValueError("Unsupported image format")
+
+
+def _parse_jpeg_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """Walk the JPEG segments up to the first start-of-frame marker."""
+    offset = 2
+    while True:
+        if offset + 4 > len(data):
+            return None
+        if data[offset] != 0xFF:
+            raise ValueError("Malformed JPEG header")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        segment_length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return "JPEG", width, height
+        offset += 2 + segment_length
+
+
+def has_image_trailer(image_format: str, tail: bytes) -> bool:
+    """Check that the last bytes of a file close the image, i.e. it is not truncated"""
+    if image_format == "PNG":
+        return tail.endswith(PNG_TRAILER)
+    return tail.rstrip(b"\x00").endswith(JPEG_TRAILER)
@@ -0,0 +1,168 @@
+"""
+CPU-bound image post-processing.
+
+Everything here runs inside worker processes. PIL is imported by the
+functions that need it so that the API process, which only reads
+`VARIANT_MEDIA_TYPES`, does not load it at startup.
+"""
+import os
+from typing import TYPE_CHECKING, Dict, List, Sequence, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Media types of the variants produced by `process_image`
+VARIANT_MEDIA_TYPES = {
+    "original": "image/png",
+    "thumbnail": "image/webp",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+
+def difference_hash(image: "Image.Image", hash_size: int = 8) -> str:
+    """
+    Compute a 64-bit difference hash (dHash) of an image.
+
+    Args:
+        image (Image.Image): Image to hash
+        hash_size (int): Width and height of the hash grid
+
+    Returns:
+        str: Hash as a 16-character hex string
+    """
+    from PIL import Image
+
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+    bits = np.packbits(pixels[:, :-1] > pixels[:, 1:])
+    return f"{int.from_bytes(bits.tobytes(), 'big'):0{hash_size * hash_size // 4}x}"
+
+
+def hash_array(hashes: Sequence[str]) -> np.ndarray:
+    """Pack 64-bit hashes given as hex strings into a uint64 array"""
+    return np.array([int(phash, 16) for phash in hashes], dtype=np.uint64)
+
+
+# Number of set bits of each byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(phash: str, hashes: Union[np.ndarray, Sequence[str]]) -> np.ndarray:
+    """
+    Count the bits in which a 64-bit hash differs from each of several others.
+
+    Args:
+        phash (str): Hash as a hex string
+        hashes (Union[np.ndarray, Sequence[str]]): Hashes to compare it with, as
+            a uint64 array (see `hash_array`) or hex strings
+
+    Returns:
+        np.ndarray: Distance to each hash, in order
+    """
+    if not isinstance(hashes, np.ndarray):
+        hashes = hash_array(hashes)
+    if not hashes.size:
+        return np.zeros(0, dtype=np.int64)
+    differences = hashes ^ np.uint64(int(phash, 16))
+    return _POPCOUNT[differences.view(np.uint8)].reshape(len(hashes), 8).sum(axis=1, dtype=np.int64)
+
+
+def image_quality(image: "Image.Image") -> Dict[str, float]:
+    """
+    Score the sharpness and information content of an image's luminance.
+
+    Sharpness is the variance of the Laplacian: blurry or near-blank images
+    have few edges and score close to 0. Entropy is the Shannon entropy of
+    the 256-bin histogram in bits, from 0 for a flat image up to 8; heavily
+    banded or near-blank images use few grey levels and score low.
+
+    Args:
+        image (Image.Image): Image to score
+
+    Returns:
+        Dict[str, float]: "sharpness" and "entropy"
+    """
+    luminance = np.asarray(image.convert("L"), dtype=np.float32)
+    laplacian = (luminance[:-2, 1:-1] + luminance[2:, 1:-1] + luminance[1:-1, :-2] + luminance[1:-1, 2:]
+                 - 4 * luminance[1:-1, 1:-1])
+    histogram = np.bincount(luminance.astype(np.uint8).ravel(), minlength=256) / luminance.size
+    histogram = histogram[histogram > 0]
+    return {
+        "sharpness": round(float(laplacian.var()) if laplacian.size else 0.0, 2),
+        "entropy": round(0.0 - float((histogram * np.log2(histogram)).sum()), 3),
+    }
+
+
+def score_image(path: str) -> Dict:
+    """
+    Decode an image and compute its quality scores and perceptual hash.
+
+    Args:
+        path (str): Image to score
+
+    Returns:
+        Dict: "sharpness", "entropy" and "phash"
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.load()
+        return dict(image_quality(image), phash=difference_hash(image))
+
+
+def process_image(source_path: str, output_dir: str, thumbnail_size: int,
+                  formats: List[str], webp_quality: int, avif_quality: int) -> Dict:
+    """
+    Strip metadata from an image and write its thumbnail and format variants.
+
+    Args:
+        source_path (str): Image to process
+        output_dir (str): Directory the processed files are written to
+        thumbnail_size (int): Longest side of the thumbnail in pixels
+        formats (List[str]): Full-size variants to produce, e.g. ["webp", "avif"]
+        webp_quality (int): WebP encoder quality
+        avif_quality (int): AVIF encoder quality
+
+    Returns:
+        Dict: Paths of the cleaned image and its variants, plus size and hash
+    """
+    from PIL import Image, features
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    with Image.open(source_path) as source:
+        source.load()
+        # Rebuild the image from raw pixels so no EXIF/text chunks survive
+        image = Image.frombytes(source.mode, source.size, source.tobytes())
+        if source.mode == "P":
+            image.putpalette(source.getpalette())
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    # Write through a temporary file: the source may be a hard link into the
+    # image cache, whose content must not be modified in place
+    image_path = os.path.join(output_dir, f"{stem}.png")
+    image.save(f"{image_path}.part", format="PNG")
+    os.replace(f"{image_path}.part", image_path)
+    variants = {}
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+    variants["thumbnail"] = os.path.join(output_dir, f"{stem}_thumb.webp")
+    thumbnail.save(variants["thumbnail"], format="WEBP", quality=webp_quality)
+
+    if "webp" in formats:
+        variants["webp"] = os.path.join(output_dir, f"{stem}.webp")
+        image.save(variants["webp"], format="WEBP", quality=webp_quality)
+    if "avif" in formats and features.check("avif"):
+        variants["avif"] = os.path.join(output_dir, f"{stem}.avif")
+        image.save(variants["avif"], format="AVIF", quality=avif_quality)
+
+    return {
+        "image_path": image_path,
+        "variants": variants,
+        "width": image.width,
+        "height": image.height,
+        "phash": difference_hash(image),
+    }
@@ -0,0 +1,317 @@
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, NamedTuple, Optional
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from src.config.constants import StorageConfig
+from src.utils.file_utils import link_or_copy
+from src.utils.path_manager import PathManager
+
+# Content types of stored files by extension
+MEDIA_TYPES = {
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+
+class StoredImage(NamedTuple):
+    """Size, entity tag and modification time of a stored image."""
+    size: int
+    etag: str
+    modified: float
+
+
+class ImageStore(ABC):
+    """
+    Storage backend for finished images, addressed by key.
+
+    Keys are relative, `/`-separated and sharded by a hash of the file name,
+    so no directory or prefix ever holds more than a small slice of the
+    images.
+    """
+
+    def key_for(self, filename: str) -> str:
+        """Return the sharded key a file of this name is stored under"""
+        digest = hashlib.md5(filename.encode("utf-8")).hexdigest()
+        shards = [digest[2 * level:2 * level + 2] for level in range(StorageConfig.SHARD_LEVELS)]
+        return "/".join(shards + [filename])
+
+    @abstractmethod
+    def put(self, local_path: str, key: str) -> None:
+        """Move a local file into the store under a key, replacing any existing image"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch(self, key: str, local_path: str) -> None:
+        """Copy a stored image to a local file"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredImage]:
+        """Return the size, ETag and modification time of an image, or None if it does not exist"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """Return whether an image is stored under a key"""
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Stream the bytes of an image.
+
+        Args:
+            key (str): Key of the image
+            start (int): Offset of the first byte
+            end (Optional[int]): Offset after the last byte, None for the end of the image
+
+        Returns:
+            Iterator[bytes]: Chunks of at most StorageConfig.CHUNK_SIZE bytes
+        """
+        raise NotImplementedError
+
+    def path(self, key: str) -> Optional[str]:
+        """Return the local path of an image, or None if the store is not on the local filesystem"""
+        return None
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an image, ignoring missing ones"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+
+
+class LocalImageStore(ImageStore):
+    """Image store in a sharded directory tree on the local filesystem."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        # Records written before the image store hold absolute paths
+        if os.path.isabs(key):
+            return key
+        parts = key.split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid image key: {key}")
+        return os.path.join(self.root, *parts)
+
+    def put(self, local_path: str, key: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(local_path, path)
+        except OSError:
+            # Across filesystems: copy next to the destination, then rename over it
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            os.close(fd)
+            shutil.copyfile(local_path, temp_path)
+            os.replace(temp_path, path)
+            os.remove(local_path)
+
+    def fetch(self, key: str, local_path: str) -> None:
+        link_or_copy(self.path(key), local_path)
+
+    def stat(self, key: str) -> Optional[StoredImage]:
+        try:
+            stat = os.stat(self.path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+        return StoredImage(stat.st_size, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', stat.st_mtime)
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = (end if end is not None else os.fstat(f.fileno()).st_size) - start
+            while remaining > 0:
+                chunk = f.read(min(StorageConfig.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def signature_v4(secret_key: str, region: str, method: str, path: str, query: str,
+                 headers: Dict[str, str], payload_hash: str) -> str:
+    """
+    Compute an AWS Signature Version 4 for an S3 request.
+
+    Args:
+        secret_key (str): Secret access key
+        region (str): Region of the bucket
+        method (str): HTTP method
+        path (str): URI-encoded request path
+        query (str): Canonical query string
+        headers (Dict[str, str]): Signed headers, including host and x-amz-date
+        payload_hash (str): Hex SHA-256 of the body, or UNSIGNED-PAYLOAD
+
+    Returns:
+        str: Hex signature
+    """
+    headers = {name.lower(): str(value).strip() for name, value in headers.items()}
+    names = sorted(headers)
+    canonical_request = "\n".join([
+        method, path, query,
+        "".join(f"{name}:{headers[name]}\n" for name in names),
+        ";".join(names),
+        payload_hash,
+    ])
+    amz_date = headers["x-amz-date"]
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+    ])
+    signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode("utf-8"), amz_date[:8]), region), "s3"),
+                        "aws4_request")
+    return hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class S3ImageStore(ImageStore):
+    """
+    Image store in a bucket of an S3-compatible service (AWS S3, MinIO, ...).
+
+    Requests use path-style addressing and Signature Version 4 with an
+    unsigned payload, so uploads stream from disk without being hashed first.
+    """
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = StorageConfig.S3_REGION, prefix: str = StorageConfig.S3_PREFIX,
+                 client: Optional[httpx.Client] = None):
+        """
+        Initialize the store.
+
+        Args:
+            endpoint (str): Base URL of the service, e.g. http://localhost:9000
+            bucket (str): Name of an existing bucket
+            access_key (str): Access key ID
+            secret_key (str): Secret access key
+            region (str): Region of the bucket
+            prefix (str): Prefix put in front of every key
+            client (Optional[httpx.Client]): HTTP client, created if omitted
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix.strip("/")
+        self._host = urlsplit(self.endpoint).netloc
+        self._client = client or httpx.Client(timeout=StorageConfig.S3_TIMEOUT)
+
+    def _path(self, key: str) -> str:
+        object_key = f"{self.prefix}/{key}" if self.prefix else key
+        return quote(f"/{self.bucket}/{object_key}", safe="/-_.~")
+
+    def _request(self, method: str, key: str, headers: Optional[Dict[str, str]] = None,
+                 stream: bool = False, **kwargs) -> httpx.Response:
+        path = self._path(key)
+        signed = dict(headers or {}, **{
+            "host": self._host,
+            "x-amz-date": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+            "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+        })
+        signature = signature_v4(self.secret_key, self.region, method, path, "", signed, "UNSIGNED-PAYLOAD")
+        scope = f"{signed['x-amz-date'][:8]}/{self.region}/s3/aws4_request"
+        signed["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(sorted(name.lower() for name in signed))}, Signature={signature}"
+        )
+        request = self._client.build_request(method, f"{self.endpoint}{path}", headers=signed, **kwargs)
+        return self._client.send(request, stream=stream)
+
+    def put(self, local_path: str, key: str) -> None:
+        media_type = MEDIA_TYPES.get(os.path.splitext(key)[1].lower(), "application/octet-stream")
+        # S3 needs the length up front; the body is streamed from disk in chunks
+        headers = {"content-type": media_type, "content-length": str(os.path.getsize(local_path))}
+        with open(local_path, "rb") as f:
+            response = self._request("PUT", key, headers,
+                                     content=iter(lambda: f.read(StorageConfig.CHUNK_SIZE), b""))
+        response.raise_for_status()
+        os.remove(local_path)
+
+    def fetch(self, key: str, local_path: str) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(local_path)), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.read(key):
+                    f.write(chunk)
+            os.replace(temp_path, local_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def stat(self, key: str) -> Optional[StoredImage]:
+        response = self._request("HEAD", key)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        modified = response.headers.get("last-modified")
+        return StoredImage(
+            int(response.headers["content-length"]),
+            response.headers["etag"],
+            parsedate_to_datetime(modified).timestamp() if modified else 0.0
+        )
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers["range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        response = self._request("GET", key, headers, stream=True)
+        try:
+            if response.status_code == 404:
+                raise FileNotFoundError(f"No image stored under {key}")
+            response.raise_for_status()
+            yield from response.iter_bytes(StorageConfig.CHUNK_SIZE)
+        finally:
+            response.close()
+
+    def delete(self, key: str) -> None:
+        response = self._request("DELETE", key)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_image_store(backend: str = StorageConfig.BACKEND,
+                       path_manager: Optional[PathManager] = None) -> ImageStore:
+    """
+    Create the configured image store.
+
+    Args:
+        backend (str): "local" or "s3"
+        path_manager (Optional[PathManager]): Shared path manager
+
+    Returns:
+        ImageStore: The image store
+    """
+    if backend == "local":
+        return LocalImageStore((path_manager or PathManager()).image_store_dir)
+    if backend == "s3":
+        return S3ImageStore(StorageConfig.S3_ENDPOINT, StorageConfig.S3_BUCKET,
+                            StorageConfig.S3_ACCESS_KEY, StorageConfig.S3_SECRET_KEY)
+    raise ValueError(f"Unknown image store backend: {backend}")
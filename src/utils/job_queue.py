@@ -0,0 +1,573 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from src.config.constants import ImageConfig, JobConfig, StoreConfig
+from src.utils.scheduler import BULK, INTERACTIVE, SPECULATIVE
+
+T = TypeVar("T")
+
+# Checkpointed stages of an image generation task, in order
+STAGES = ("requested", "downloaded", "validated", "scored", "recorded")
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker touches a task that another worker has taken over."""
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an idempotency key is sent again with a different request."""
+
+
+class JobQueue:
+    """
+    Durable queue of image generation jobs backed by SQLite in WAL mode.
+
+    A job has one task per prompt. Workers in any number of processes claim
+    tasks under a lease, which they renew while they work and with every
+    checkpoint. A task whose worker died is claimed again once its lease
+    expires and resumes from the last checkpointed stage, so images that were
+    already paid for are not requested again. Jobs submitted with an
+    idempotency key are only created once.
+
+    Interactive tasks are claimed before bulk ones and bulk tasks before
+    speculative ones. Among tasks of the same class the flow (API key or
+    topic) with the fewest running tasks goes first, so one large job cannot
+    hold every worker. Speculative jobs count against budgets, and a client
+    asking for a prompt's images adopts its speculative task.
+
+    The methods are synchronous and may wait up to the busy timeout for
+    another process's write lock. Coroutines go through `call`, which runs
+    them on the queue's own thread in the order they were made.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            idempotency_key TEXT UNIQUE,
+            request TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            job_id TEXT NOT NULL,
+            prompt_id TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            num_candidates INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT NOT NULL DEFAULT '',
+            checkpoint TEXT NOT NULL DEFAULT '{}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_expires REAL,
+            enqueued_at REAL NOT NULL,
+            image_paths TEXT,
+            error TEXT,
+            error_type TEXT,
+            priority TEXT NOT NULL DEFAULT 'bulk',
+            flow TEXT NOT NULL DEFAULT '',
+            timings TEXT
+        );
+        CREATE TABLE IF NOT EXISTS budgets (
+            key TEXT PRIMARY KEY,
+            used INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, id);
+        CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks (job_id, status);
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = StoreConfig.BUSY_TIMEOUT_MS,
+                 max_attempts: int = JobConfig.MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+
+    async def call(self, method: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a queue method off the event loop.
+
+        Calls run one at a time in the order they were made, and a call whose
+        caller is cancelled still runs, so a checkpoint made before a worker
+        releases its tasks is never lost or overtaken by the release.
+        """
+        future = asyncio.get_running_loop().run_in_executor(self._executor, partial(method, *args, **kwargs))
+        return await asyncio.shield(future)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block of statements as one write transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a database was created."""
+        with self.transaction() as conn:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(tasks)")}
+            if "priority" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN priority TEXT NOT NULL DEFAULT 'bulk'")
+            if "flow" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN flow TEXT NOT NULL DEFAULT ''")
+            if "timings" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN timings TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_flow ON tasks (flow, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_prompt ON tasks (prompt_id, priority)")
+
+    @staticmethod
+    def _to_task(row: sqlite3.Row) -> Dict:
+        return {
+            "task_id": row["id"],
+            "job_id": row["job_id"],
+            "prompt_id": row["prompt_id"],
+            "prompt": row["prompt"],
+            "num_candidates": row["num_candidates"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "checkpoint": json.loads(row["checkpoint"]),
+            "attempts": row["attempts"],
+            "enqueued_at": row["enqueued_at"],
+            "image_paths": json.loads(row["image_paths"]) if row["image_paths"] else None,
+            "error": row["error"],
+            "error_type": row["error_type"],
+            "priority": row["priority"],
+            "flow": row["flow"],
+            "timings": [tuple(timing) for timing in json.loads(row["timings"])] if row["timings"] else [],
+        }
+
+    def enqueue(self, prompts: Dict[str, str], num_candidates: Optional[int] = None,
+                idempotency_key: Optional[str] = None, priority: str = BULK,
+                flows: Optional[Dict[str, str]] = None) -> str:
+        """
+        Create a job with one task per prompt.
+
+        Args:
+            prompts (Dict[str, str]): Prompt text by prompt ID
+            num_candidates (Optional[int]): Candidate images per prompt
+            idempotency_key (Optional[str]): Key of the request; a job already
+                created with this key is returned instead of a new one
+            priority (str): Priority class of the tasks
+            flows (Optional[Dict[str, str]]): Fairness flow of each prompt's task
+
+        Returns:
+            str: ID of the job
+
+        Raises:
+            IdempotencyKeyReused: If the key was used for a different request
+        """
+        request = self._request(prompts, num_candidates)
+        with self.transaction() as conn:
+            if idempotency_key is not None:
+                row = conn.execute("SELECT job_id, request FROM jobs WHERE idempotency_key = ?",
+                                   (idempotency_key,)).fetchone()
+                if row is not None:
+                    if row["request"] != request:
+                        raise IdempotencyKeyReused(f"Idempotency key already used for job {row['job_id']}")
+                    return row["job_id"]
+
+            return self._insert_job(conn, prompts, num_candidates, idempotency_key, priority, flows or {})
+
+    def find_job(self, idempotency_key: str) -> Optional[str]:
+        """Return the ID of the job created with an idempotency key, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT job_id FROM jobs WHERE idempotency_key = ?",
+                                     (idempotency_key,)).fetchone()
+        return row["job_id"] if row else None
+
+    @staticmethod
+    def _request(prompts: Dict[str, str], num_candidates: Optional[int]) -> str:
+        """Fingerprint of a request, which a replay under the same idempotency key must match"""
+        return json.dumps({"prompt_ids": sorted(prompts), "num_candidates": num_candidates})
+
+    @classmethod
+    def _insert_job(cls, conn: sqlite3.Connection, prompts: Dict[str, str], num_candidates: Optional[int],
+                    idempotency_key: Optional[str], priority: str, flows: Dict[str, str]) -> str:
+        request = cls._request(prompts, num_candidates)
+        now = datetime.now().isoformat()
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (job_id, idempotency_key, request, created_at, finished_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, idempotency_key, request, now, None if prompts else now)
+        )
+        conn.executemany(
+            "INSERT INTO tasks (job_id, prompt_id, prompt, num_candidates, enqueued_at, priority, flow) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(job_id, prompt_id, prompt, num_candidates, time.time(), priority, flows.get(prompt_id, ""))
+             for prompt_id, prompt in prompts.items()]
+        )
+        return job_id
+
+    def speculate(self, prompts: Dict[str, str], flow: str, budget_key: str, budget: int) -> List[str]:
+        """
+        Queue a speculative job for each prompt, as many as a budget allows.
+
+        Args:
+            prompts (Dict[str, str]): Prompt text by prompt ID
+            flow (str): Fairness flow of the tasks
+            budget_key (str): Budget the jobs count against, e.g. a topic on one day
+            budget (int): Most jobs ever queued against the key
+
+        Returns:
+            List[str]: IDs of the prompts whose job was queued
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT used FROM budgets WHERE key = ?", (budget_key,)).fetchone()
+            queued = list(prompts)[:max(0, budget - (row["used"] if row else 0))]
+            for prompt_id in queued:
+                self._insert_job(conn, {prompt_id: prompts[prompt_id]}, None, None, SPECULATIVE, {prompt_id: flow})
+            if queued:
+                conn.execute(
+                    "INSERT INTO budgets (key, used, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET used = used + excluded.used, updated_at = excluded.updated_at",
+                    (budget_key, len(queued), time.time())
+                )
+        return queued
+
+    def adopt(self, prompt_id: str, prompt: str, num_candidates: Optional[int], flow: str,
+              idempotency_key: Optional[str] = None, unreviewed: bool = False) -> Optional[int]:
+        """
+        Hand a prompt's queued or running speculative task to a client asking for its images.
+
+        A completed task is only handed over while its images are unreviewed;
+        once they were approved or rejected the client needs new ones. The
+        task becomes interactive, so a queued one is claimed next and none
+        is adopted twice. Candidate counts are compared with None standing for
+        ImageConfig.NUM_CANDIDATES, as it does when the task runs. The job
+        takes the client's idempotency key and request, so that a retry finds
+        it.
+
+        Args:
+            prompt_id (str): ID of the prompt
+            prompt (str): Prompt text the client asks images for; a task for other text is not adopted
+            num_candidates (Optional[int]): Candidate images the client asks for
+            flow (str): Fairness flow of the client
+            idempotency_key (Optional[str]): Key of the client's request
+            unreviewed (bool): Whether the prompt's images await review, so a completed task may be adopted
+
+        Returns:
+            Optional[int]: ID of the adopted task, None if there is none to adopt
+        """
+        with self.transaction() as conn:
+            if idempotency_key is not None and conn.execute(
+                    "SELECT 1 FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone():
+                return None
+            row = conn.execute(
+                "SELECT id, job_id FROM tasks WHERE prompt_id = ? AND priority = ? AND prompt = ? "
+                "AND COALESCE(num_candidates, ?) = ? "
+                "AND (status IN ('queued', 'running') OR (? AND status = 'completed')) ORDER BY id DESC LIMIT 1",
+                (prompt_id, SPECULATIVE, prompt, ImageConfig.NUM_CANDIDATES,
+                 num_candidates or ImageConfig.NUM_CANDIDATES, unreviewed)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET priority = ?, flow = ? WHERE id = ?", (INTERACTIVE, flow, row["id"]))
+            if idempotency_key is not None:
+                conn.execute("UPDATE jobs SET idempotency_key = ?, request = ? WHERE job_id = ?",
+                             (idempotency_key, self._request({prompt_id: prompt}, num_candidates), row["job_id"]))
+            return row["id"]
+
+    def claim(self, worker: str, lease_seconds: float = JobConfig.LEASE_SECONDS,
+              max_per_job: int = JobConfig.MAX_CONCURRENCY, priority: Optional[str] = None) -> Optional[Dict]:
+        """
+        Lease the next runnable task to a worker.
+
+        Queued tasks and running tasks whose lease has expired are runnable,
+        as long as their job has fewer than `max_per_job` tasks running.
+        Tasks of the highest priority class go first, then those of the flow
+        with the fewest running tasks, then the oldest. Tasks abandoned
+        `max_attempts` times are failed instead.
+
+        Args:
+            worker (str): ID of the claiming worker
+            lease_seconds (float): Time the worker holds the task without renewing
+            max_per_job (int): Most tasks of one job running at once
+            priority (Optional[str]): Only claim tasks of this priority class
+
+        Returns:
+            Optional[Dict]: The claimed task, or None if nothing is runnable
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            abandoned = conn.execute(
+                "SELECT id, job_id FROM tasks WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall()
+            for row in abandoned:
+                conn.execute(
+                    "UPDATE tasks SET status = 'failed', worker = NULL, error = ?, error_type = ? WHERE id = ?",
+                    (f"Abandoned after {self.max_attempts} attempts", "LeaseExpired", row["id"])
+                )
+                self._finish_job(conn, row["job_id"])
+
+            row = conn.execute(
+                """
+                SELECT * FROM tasks AS t
+                WHERE (t.status = 'queued' OR (t.status = 'running' AND t.lease_expires < :now))
+                AND (:priority IS NULL OR t.priority = :priority)
+                AND (SELECT COUNT(*) FROM tasks AS r
+                     WHERE r.job_id = t.job_id AND r.status = 'running' AND r.lease_expires >= :now) < :max_per_job
+                ORDER BY CASE t.priority WHEN :interactive THEN 0 WHEN :bulk THEN 1 ELSE 2 END,
+                         (SELECT COUNT(*) FROM tasks AS f
+                          WHERE f.flow = t.flow AND f.status = 'running' AND f.lease_expires >= :now),
+                         t.id
+                LIMIT 1
+                """,
+                {"now": now, "max_per_job": max_per_job, "priority": priority, "interactive": INTERACTIVE, "bulk": BULK}
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker, now + lease_seconds, row["id"])
+            )
+        task = self._to_task(row)
+        task.update(status="running", attempts=task["attempts"] + 1)
+        return task
+
+    def checkpoint(self, task_id: int, worker: str, stage: str, data: Dict,
+                   lease_seconds: float = JobConfig.LEASE_SECONDS) -> None:
+        """
+        Record the stage a task reached and the data needed to resume it, renewing the lease.
+
+        Raises:
+            LeaseLostError: If the worker no longer holds the task
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET stage = ?, checkpoint = ?, lease_expires = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (stage, json.dumps(data), time.time() + lease_seconds, task_id, worker)
+            )
+            if cursor.rowcount == 0:
+                raise LeaseLostError(f"Task {task_id} is no longer leased to {worker}")
+
+    def renew(self, worker: str, lease_seconds: float = JobConfig.LEASE_SECONDS) -> int:
+        """Extend the lease of every task a worker is running and return how many there are"""
+        with self.transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, worker)
+            ).rowcount
+
+    def release(self, worker: str) -> int:
+        """Put a stopping worker's tasks back in the queue without counting the attempt"""
+        with self.transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = 'queued', worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE worker = ? AND status = 'running'",
+                (worker,)
+            ).rowcount
+
+    def complete(self, task_id: int, worker: str, image_paths: List[str],
+                 timings: Sequence[Tuple[str, float]] = ()) -> bool:
+        """
+        Mark a task completed with its image paths and the (stage, seconds) spans it took.
+
+        Returns:
+            bool: Whether this was the last unfinished task of its job
+
+        Raises:
+            LeaseLostError: If the worker no longer holds the task
+        """
+        return self._finish_task(task_id, worker, "completed", image_paths=json.dumps(image_paths),
+                                 timings=json.dumps(list(timings)))
+
+    def fail(self, task_id: int, worker: str, error: str, error_type: str,
+             timings: Sequence[Tuple[str, float]] = ()) -> bool:
+        """
+        Mark a task failed, with the (stage, seconds) spans it took.
+
+        Returns:
+            bool: Whether this was the last unfinished task of its job
+
+        Raises:
+            LeaseLostError: If the worker no longer holds the task
+        """
+        return self._finish_task(task_id, worker, "failed", error=error, error_type=error_type,
+                                 timings=json.dumps(list(timings)))
+
+    def _finish_task(self, task_id: int, worker: str, status: str, **columns) -> bool:
+        assignments = ", ".join(f"{column} = :{column}" for column in columns)
+        with self.transaction() as conn:
+            row = conn.execute("SELECT job_id FROM tasks WHERE id = ? AND worker = ? AND status = 'running'",
+                               (task_id, worker)).fetchone()
+            if row is None:
+                raise LeaseLostError(f"Task {task_id} is no longer leased to {worker}")
+            conn.execute(
+                f"UPDATE tasks SET status = :status, worker = NULL, lease_expires = NULL, {assignments} WHERE id = :id",
+                dict(columns, status=status, id=task_id)
+            )
+            return self._finish_job(conn, row["job_id"])
+
+    @staticmethod
+    def _finish_job(conn: sqlite3.Connection, job_id: str) -> bool:
+        """Set the finish time of a job once none of its tasks is left to run."""
+        return conn.execute(
+            "UPDATE jobs SET finished_at = ? WHERE job_id = ? AND finished_at IS NULL AND NOT EXISTS "
+            "(SELECT 1 FROM tasks WHERE job_id = ? AND status IN ('queued', 'running'))",
+            (datetime.now().isoformat(), job_id, job_id)
+        ).rowcount > 0
+
+    def get_task(self, task_id: int) -> Optional[Dict]:
+        """Return a task by ID"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._to_task(row) if row else None
+
+    def get_tasks(self, job_id: str) -> List[Dict]:
+        """Return the tasks of a job in submission order"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM tasks WHERE job_id = ? ORDER BY id", (job_id,)).fetchall()
+        return [self._to_task(row) for row in rows]
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Return a job with its progress and the outcome of each prompt.
+
+        Returns:
+            Optional[Dict]: The job, or None if it does not exist
+        """
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        tasks = self.get_tasks(job_id)
+        completed = sum(task["status"] == "completed" for task in tasks)
+        failed = sum(task["status"] == "failed" for task in tasks)
+
+        if job["finished_at"]:
+            status = "completed" if failed == 0 else "failed" if completed == 0 else "partial"
+        elif any(task["status"] != "queued" for task in tasks):
+            status = "running"
+        else:
+            status = "queued"
+
+        items = {}
+        for task in tasks:
+            item = {"status": task["status"], "stage": task["stage"] or None}
+            if task["image_paths"]:
+                item["image_path"] = task["image_paths"][0]
+            if task["error"]:
+                item["error"] = task["error"]
+            items[task["prompt_id"]] = item
+
+        return {
+            "job_id": job_id,
+            "status": status,
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "total": len(tasks),
+            "completed": completed,
+            "failed": failed,
+            "items": items,
+        }
+
+    def count(self, status: Optional[str] = None, priority: Optional[str] = None) -> int:
+        """Return the number of tasks, optionally only those with a status and/or priority class"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE (:status IS NULL OR status = :status) "
+                "AND (:priority IS NULL OR priority = :priority)",
+                {"status": status, "priority": priority}
+            ).fetchone()[0]
+
+    def withdraw(self, job_id: str) -> bool:
+        """
+        Delete a job nobody has started working on, e.g. because its client went away.
+
+        Returns:
+            bool: Whether the job was deleted; False if any of its tasks was ever claimed
+        """
+        with self.transaction() as conn:
+            started = conn.execute(
+                "SELECT 1 FROM tasks WHERE job_id = ? AND (status != 'queued' OR attempts > 0)", (job_id,)
+            ).fetchone()
+            if started is not None:
+                return False
+            conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            return conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def prune(self, keep: int = JobConfig.MAX_FINISHED_JOBS) -> int:
+        """Delete the oldest finished jobs beyond the history limit and return how many were deleted"""
+        with self.transaction() as conn:
+            stale = [row["job_id"] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?",
+                (keep,)
+            ).fetchall()]
+            for job_id in stale:
+                conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            # Budgets are per day; two days cover any time zone
+            conn.execute("DELETE FROM budgets WHERE updated_at < ?", (time.time() - 2 * 86400,))
+        return len(stale)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+class TaskCheckpoint:
+    """
+    Last stage a task reached and the data needed to resume it.
+
+    Without a queue the checkpoint only lives in memory, which lets the
+    generation pipeline run the same way outside of the job queue.
+    """
+
+    def __init__(self, stage: str = "", data: Optional[Dict] = None, queue: Optional[JobQueue] = None,
+                 task_id: Optional[int] = None, worker: Optional[str] = None,
+                 lease_seconds: float = JobConfig.LEASE_SECONDS):
+        self.stage = stage
+        self.data = dict(data or {})
+        self.queue = queue
+        self.task_id = task_id
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+
+    def reached(self, stage: str) -> bool:
+        """Whether the task already got to a stage"""
+        return bool(self.stage) and STAGES.index(self.stage) >= STAGES.index(stage)
+
+    async def save(self, stage: str, **data) -> None:
+        """Record that the task reached a stage, merging in the given data"""
+        self.stage = stage
+        self.data.update(data)
+        if self.queue is not None:
+            await self.queue.call(self.queue.checkpoint, self.task_id, self.worker, stage, dict(self.data),
+                                  self.lease_seconds)
+
+    async def reset(self) -> None:
+        """Start the task over from the beginning"""
+        self.stage = ""
+        self.data = {}
+        if self.queue is not None:
+            await self.queue.call(self.queue.checkpoint, self.task_id, self.worker, "", {}, self.lease_seconds)
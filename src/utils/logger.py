@@ -1,54 +1,228 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import random
 import sys
-from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional
 
 from pythonjsonlogger import jsonlogger
 
+from src.config.constants import LogConfig
 from src.utils.path_manager import PathManager
 
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     """Custom JSON formatter for logging."""
-    
+
     def add_fields(self, log_record, record, message_dict):
         super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
         log_record['level'] = record.levelname
         log_record['logger'] = record.name
 
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a random fraction of records at or below a level, e.g. high-volume debug lines."""
+
+    def __init__(self, rate: float, level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > self.level or random.random() < self.rate
+
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler that writes a batch of records with a single flush.
+
+    The file is rolled over once it exceeds `maxBytes` or once it is older
+    than `max_age` seconds, whichever comes first.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, backup_count: int = 0, max_age: float = 0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.max_age = max_age
+        self._opened_at = time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.max_age and self.stream is not None and time.time() - self._opened_at >= self.max_age:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        # The base class leaves the stream closed when opening is delayed
+        if self.stream is None:
+            self.stream = self._open()
+        self._opened_at = time.time()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.emit_batch([record])
+
+    def emit_batch(self, records: List[logging.LogRecord]) -> None:
+        """Write records in order, rolling over as needed, then flush once"""
+        if self.stream is None:
+            self.stream = self._open()
+            self._opened_at = time.time()
+        for record in records:
+            try:
+                if self.shouldRollover(record):
+                    self.doRollover()
+                self.stream.write(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        self.flush()
+
+
+class BatchingQueueListener:
+    """
+    Drains a log queue on a background thread and hands records to the
+    handlers in batches, so callers on the event loop never touch the disk.
+    """
+
+    _SENTINEL = None
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler],
+                 batch_size: int = LogConfig.BATCH_SIZE):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every record queued so far has been written"""
+        if self._thread is None:
+            return True
+        written = threading.Event()
+        self.queue.put_nowait(written)
+        return written.wait(timeout)
+
+    def stop(self) -> None:
+        """Write every queued record, then stop the thread and close the handlers"""
+        if self._thread is None:
+            return
+        self.queue.put_nowait(self._SENTINEL)
+        self._thread.join()
+        self._thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._write([record for record in batch if isinstance(record, logging.LogRecord)])
+            # Flush markers are released once the records queued before them are written
+            for marker in batch:
+                if isinstance(marker, threading.Event):
+                    marker.set()
+            if self._SENTINEL in batch:
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        for handler in self.handlers:
+            accepted = [record for record in records if record.levelno >= handler.level and handler.filter(record)]
+            if not accepted:
+                continue
+            if isinstance(handler, BatchedRotatingFileHandler):
+                with handler.lock:
+                    handler.emit_batch(accepted)
+            else:
+                for record in accepted:
+                    handler.handle(record)
+
+
+_listeners: Dict[str, BatchingQueueListener] = {}
+
+
 def setup_logger(name: str = 'app') -> logging.Logger:
     """
-    Set up a logger with both file and console handlers.
-    
+    Set up a logger whose file and console output is written off the calling thread.
+
+    Records go onto an in-memory queue; a background thread writes them in
+    batches to a rotating JSON log file and to stdout. Debug records are
+    sampled at LogConfig.DEBUG_SAMPLE_RATE. Fields passed with `extra=` are
+    written as structured JSON fields.
+
     Args:
         name (str): Name of the logger
-        
+
     Returns:
         logging.Logger: Configured logger instance
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
+    logger.setLevel(LogConfig.LEVEL)
+
     # Clear any existing handlers
+    shutdown_logging(name)
     logger.handlers = []
-    
+
     # Create formatters
     json_formatter = CustomJsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s')
     console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
+
     # File handler
     path_manager = PathManager()
     log_file = os.path.join(path_manager.log_dir, f'{name}.log')
-    file_handler = logging.FileHandler(log_file)
+    file_handler = BatchedRotatingFileHandler(
+        log_file,
+        max_bytes=LogConfig.MAX_BYTES,
+        backup_count=LogConfig.BACKUP_COUNT,
+        max_age=LogConfig.MAX_AGE_SECONDS
+    )
     file_handler.setFormatter(json_formatter)
-    logger.addHandler(file_handler)
-    
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-    
+
+    # Callers only enqueue; the listener thread does the I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LogConfig.DEBUG_SAMPLE_RATE))
+    logger.addHandler(queue_handler)
+
+    listener = BatchingQueueListener(log_queue, [file_handler, console_handler])
+    listener.start()
+    _listeners[name] = listener
+
     return logger
 
+
+def flush_logging(timeout: float = 5.0) -> None:
+    """Wait until every queued record has been written, keeping the loggers running"""
+    for listener in list(_listeners.values()):
+        listener.flush(timeout)
+
+
+def shutdown_logging(name: Optional[str] = None) -> None:
+    """
+    Flush queued records and stop the writer threads.
+
+    Args:
+        name (Optional[str]): Logger to stop, None stops all of them
+    """
+    for listener_name in [name] if name else list(_listeners):
+        listener = _listeners.pop(listener_name, None)
+        if listener is not None:
+            listener.stop()
+
+
+atexit.register(shutdown_logging)
+
 # Create default logger instance
-logger = setup_logger() 
\ No newline at end of file
+logger = setup_logger()
@@ -0,0 +1,315 @@
+"""
+Process-wide metrics rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept in memory and read by the
+`/metrics` endpoint. `span` times a stage into the stage histogram and, while
+a request is being timed, into that request's Server-Timing header.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. retries or bytes downloaded."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Sum of the counter over all label values"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. calls in flight, or one read at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        """Read the value from a function each time the metrics are rendered"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return function() if function else self._values.get(key, 0)
+
+    @contextmanager
+    def track_in_progress(self, **labels) -> Iterator[None]:
+        """Count the enclosed block as in flight while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        lines = []
+        for key in sorted(set(values) | set(functions)):
+            try:
+                value = functions[key]() if key in functions else values[key]
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. stage latencies in seconds."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts followed by the sum
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 1))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "imagegen_stage_seconds", "Time spent in each stage of prompt and image generation", ("stage",)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "imagegen_http_request_seconds", "Latency of API requests", ("method", "route", "status")
+)
+API_CALLS = REGISTRY.counter(
+    "imagegen_api_calls_total", "Azure OpenAI call attempts by outcome", ("deployment", "outcome")
+)
+API_RETRIES = REGISTRY.counter(
+    "imagegen_api_retries_total", "Azure OpenAI calls retried, by error kind", ("deployment", "kind")
+)
+API_IN_FLIGHT = REGISTRY.gauge(
+    "imagegen_api_in_flight", "Azure OpenAI calls currently in flight", ("deployment",)
+)
+API_CALL_SECONDS = REGISTRY.histogram(
+    "imagegen_api_call_seconds", "Latency of successful Azure OpenAI calls", ("deployment",)
+)
+SCHEDULER_REQUESTS = REGISTRY.counter(
+    "imagegen_scheduler_requests_total", "Azure OpenAI calls admitted, rejected or dropped by the scheduler",
+    ("priority", "outcome")
+)
+SCHEDULER_WAIT_SECONDS = REGISTRY.histogram(
+    "imagegen_scheduler_wait_seconds", "Time queued calls waited for a scheduler slot", ("priority",)
+)
+SPECULATIVE_IMAGES = REGISTRY.counter(
+    "imagegen_speculative_images_total", "Prompts queued, skipped over budget or adopted by speculative generation",
+    ("outcome",)
+)
+IMAGE_CACHE_LOOKUPS = REGISTRY.counter(
+    "imagegen_image_cache_lookups_total", "Image cache lookups by result", ("result",)
+)
+PROMPT_CACHE_LOOKUPS = REGISTRY.counter(
+    "imagegen_prompt_cache_lookups_total", "Prompt cache lookups by result", ("result",)
+)
+PROMPTS_TOPPED_UP = REGISTRY.counter(
+    "imagegen_prompts_topped_up_total", "Unused stored prompts handed out instead of generating new ones"
+)
+QUALITY_GATE = REGISTRY.counter(
+    "imagegen_quality_gate_images_total", "Generated images scored by the quality gate, by outcome", ("outcome",)
+)
+IMAGE_REGENERATIONS = REGISTRY.counter(
+    "imagegen_image_regenerations_total", "Image sets generated again because every candidate failed the quality gate"
+)
+DOWNLOADED_BYTES = REGISTRY.counter(
+    "imagegen_downloaded_bytes_total", "Bytes of generated images downloaded"
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "imagegen_in_flight", "Work currently in progress, by kind", ("kind",)
+)
+PROMPT_STORE_SIZE = REGISTRY.gauge(
+    "imagegen_prompt_store_size", "Number of prompts in the store"
+)
+JOB_TASKS = REGISTRY.gauge(
+    "imagegen_job_tasks", "Image generation tasks in the durable job queue, by status", ("status",)
+)
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a stage into the stage histogram and the current request's timings.
+
+    Args:
+        stage (str): Name of the stage, e.g. "images_api" or "download"
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+@contextmanager
+def record_request_timings() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the spans of the enclosed request as (stage, seconds) pairs"""
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def add_request_timings(timings: Iterable[Tuple[str, float]]) -> None:
+    """Add spans timed elsewhere, e.g. by a job worker, to the current request's timings"""
+    current = _request_timings.get()
+    if current is not None:
+        current.extend(timings)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Summarize request timings as a Server-Timing header value, summing repeated stages"""
+    durations: Dict[str, float] = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -3,16 +3,21 @@ from pathlib import Path
 
 from src.config.constants import DirectoryConfig
 
+# Source directories whose structure was already created in this process
+_prepared_dirs = set()
+
 
 class PathManager:
     """Manages all project paths and ensures directory structure"""
     
-    def __init__(self):
-        self.src_dir = DirectoryConfig.SRC
+    def __init__(self, src_dir: str = DirectoryConfig.SRC):
+        self.src_dir = src_dir
         self._ensure_directories()
 
     def _ensure_directories(self):
-        """Ensure all required directories exist"""
+        """Ensure all required directories exist, once per process and source directory"""
+        if self.src_dir in _prepared_dirs:
+            return
         directories = [
             self.src_dir,
             os.path.join(self.src_dir, DirectoryConfig.CONFIG),
@@ -25,11 +30,13 @@ class PathManager:
             os.path.join(self.src_dir, DirectoryConfig.SERVICES),
             self.image_ingest_dir,
             self.image_process_dir,
-            self.image_approved_dir
+            self.image_approved_dir,
+            self.image_cache_dir
         ]
         
         for directory in directories:
             os.makedirs(directory, exist_ok=True)
+        _prepared_dirs.add(self.src_dir)
 
     @property
     def image_ingest_dir(self) -> str:
@@ -43,10 +50,30 @@ class PathManager:
     def image_approved_dir(self) -> str:
         return os.path.join(self.src_dir, DirectoryConfig.IMAGES, DirectoryConfig.IMAGE_APPROVED)
 
+    @property
+    def image_cache_dir(self) -> str:
+        return os.path.join(self.src_dir, DirectoryConfig.IMAGES, DirectoryConfig.IMAGE_CACHE)
+
+    @property
+    def image_store_dir(self) -> str:
+        return os.path.join(self.src_dir, DirectoryConfig.IMAGES, DirectoryConfig.IMAGE_STORE)
+
     @property
     def prompts_file(self) -> str:
         return DirectoryConfig.PROMPTS_FILE
 
+    @property
+    def prompts_db(self) -> str:
+        return os.path.join(self.src_dir, DirectoryConfig.PROMPTS, DirectoryConfig.PROMPTS_DB)
+
+    @property
+    def jobs_db(self) -> str:
+        return os.path.join(self.src_dir, DirectoryConfig.PROMPTS, DirectoryConfig.JOBS_DB)
+
+    @property
+    def prompt_embeddings(self) -> str:
+        return os.path.join(self.src_dir, DirectoryConfig.PROMPTS, DirectoryConfig.PROMPT_EMBEDDINGS)
+
     @property
     def log_dir(self) -> str:
         return os.path.join(self.src_dir, DirectoryConfig.LOGS)
\ No newline at end of file
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+class PromptCache:
+    """
+    Recently generated prompt batches by normalized topic and batch size.
+
+    Only the prompt IDs are kept, so a hit re-reads the records from the
+    store and reflects any status change since. Entries expire after a TTL
+    and the least recently used ones are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float): Seconds a batch is handed out again
+            max_entries (int): Batches kept at most
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[str]]]" = OrderedDict()
+
+    @staticmethod
+    def normalize_topic(topic: str) -> str:
+        """Fold case and whitespace so that trivially different spellings share entries"""
+        return " ".join(topic.split()).casefold()
+
+    @classmethod
+    def key(cls, topic: str, num_prompts: int) -> Tuple[str, int]:
+        return cls.normalize_topic(topic), num_prompts
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[str, int]) -> Optional[List[str]]:
+        """Return the prompt IDs cached under a key, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, prompt_ids = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return list(prompt_ids)
+
+    def put(self, key: Tuple[str, int], prompt_ids: List[str]) -> None:
+        """Cache a batch of prompt IDs under a key"""
+        self._entries[key] = (time.monotonic() + self.ttl, list(prompt_ids))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
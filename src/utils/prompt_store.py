@@ -0,0 +1,584 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.config.constants import StoreConfig
+from src.utils.file_utils import atomic_write, file_lock
+from src.utils.path_manager import PathManager
+from src.utils.prompt_cache import PromptCache
+
+# Fields stored in their own columns; anything else lives in the `extra` JSON column
+CORE_FIELDS = ("prompt", "approved", "image_path", "status", "created_at", "topic")
+# Key of a record's version in the JSON file, hidden from readers
+VERSION_FIELD = "_version"
+
+# Outcomes of one record of a batch update
+UPDATED = "updated"
+NOT_FOUND = "not_found"
+CONFLICT = "conflict"
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a record changed after the version an update was based on."""
+
+
+class PromptStore(ABC):
+    """Storage backend for prompt records keyed by prompt ID."""
+
+    @abstractmethod
+    def get(self, prompt_id: str) -> Optional[Dict]:
+        """Return a single prompt record, or None if it does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_versioned(self, prompt_id: str) -> Optional[Tuple[Dict, int]]:
+        """Return a record with its version, which every update increments, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, prompt_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Return the records that exist among the given prompt IDs"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def all(self) -> Dict[str, Dict]:
+        """Return every prompt record"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find(self, topic: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Dict]:
+        """Return the records matching a topic and/or status"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_unused(self, topic: str, limit: int) -> Dict[str, Dict]:
+        """
+        Return the oldest pending records of a topic that never got an image.
+
+        Topics are compared normalized, and records flagged as duplicates
+        are left out.
+
+        Args:
+            topic (str): Topic of the records
+            limit (int): Maximum number of records
+
+        Returns:
+            Dict[str, Dict]: The records by ID
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def page(self, limit: int, after_id: Optional[str] = None, topic: Optional[str] = None,
+             status: Optional[str] = None, approved: Optional[bool] = None,
+             created_from: Optional[str] = None, created_to: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        Return one page of records in ID order.
+
+        Args:
+            limit (int): Maximum number of records
+            after_id (Optional[str]): Only return records with a higher ID (the page cursor)
+            topic (Optional[str]): Only return records of this topic
+            status (Optional[str]): Only return records with this status
+            approved (Optional[bool]): Only return approved or unapproved records
+            created_from (Optional[str]): Earliest ISO creation time, inclusive
+            created_to (Optional[str]): Latest ISO creation time, exclusive
+
+        Returns:
+            Dict[str, Dict]: The records by ID
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_versioned(self, prompt_ids: Iterable[str]) -> Dict[str, Tuple[Dict, int]]:
+        """Return the existing records among the IDs with their current versions"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_many(self, records: List[Dict]) -> Dict[str, Dict]:
+        """Insert new records, allocating their IDs, and return them by ID"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, prompt_id: str, expected_version: Optional[int] = None, **fields) -> bool:
+        """
+        Atomically update fields of one record.
+
+        Args:
+            prompt_id (str): ID of the record
+            expected_version (Optional[int]): Only update if the record is still at
+                this version, as returned by get_versioned (compare-and-swap)
+            **fields: Fields to set
+
+        Returns:
+            bool: False if the record does not exist
+
+        Raises:
+            ConcurrentUpdateError: If the record is no longer at expected_version
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_many(self, updates: Dict[str, Dict],
+                    expected_versions: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        """
+        Update several records in one transaction.
+
+        A record that does not exist or is no longer at its expected version
+        is left alone; the other records are still updated.
+
+        Args:
+            updates (Dict[str, Dict]): Fields to set by record ID
+            expected_versions (Optional[Dict[str, int]]): Versions the updates were
+                based on, by record ID; records without one are updated unconditionally
+
+        Returns:
+            Dict[str, str]: UPDATED, NOT_FOUND or CONFLICT by record ID
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        """Return the number of stored prompts"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+
+
+class JsonPromptStore(PromptStore):
+    """
+    Legacy store that keeps every prompt in a single JSON file.
+
+    Writes are serialized across threads and processes by a lock file and
+    replace the file atomically, so readers never see a partial file and
+    concurrent workers never lose each other's records or IDs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the store's write lock against other threads and processes."""
+        with self._lock, file_lock(self.path):
+            yield
+
+    def _read(self) -> Dict[str, Dict]:
+        """Return every record, including its version"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _load(self) -> Dict[str, Dict]:
+        return {
+            prompt_id: {k: v for k, v in record.items() if k != VERSION_FIELD}
+            for prompt_id, record in self._read().items()
+        }
+
+    def _save(self, prompts: Dict[str, Dict]) -> None:
+        atomic_write(self.path, json.dumps(prompts, indent=4))
+
+    def get(self, prompt_id: str) -> Optional[Dict]:
+        return self._load().get(prompt_id)
+
+    def get_versioned(self, prompt_id: str) -> Optional[Tuple[Dict, int]]:
+        record = self._read().get(prompt_id)
+        if record is None:
+            return None
+        version = record.pop(VERSION_FIELD, 0)
+        return record, version
+
+    def get_many(self, prompt_ids: Iterable[str]) -> Dict[str, Dict]:
+        prompts = self._load()
+        return {prompt_id: prompts[prompt_id] for prompt_id in prompt_ids if prompt_id in prompts}
+
+    def get_many_versioned(self, prompt_ids: Iterable[str]) -> Dict[str, Tuple[Dict, int]]:
+        prompts = self._read()
+        return {
+            prompt_id: (prompts[prompt_id], prompts[prompt_id].pop(VERSION_FIELD, 0))
+            for prompt_id in prompt_ids if prompt_id in prompts
+        }
+
+    def all(self) -> Dict[str, Dict]:
+        return self._load()
+
+    def find(self, topic: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Dict]:
+        return {
+            prompt_id: record for prompt_id, record in self._load().items()
+            if (topic is None or record["topic"] == topic)
+            and (status is None or record["status"] == status)
+        }
+
+    def find_unused(self, topic: str, limit: int) -> Dict[str, Dict]:
+        normalized = PromptCache.normalize_topic(topic)
+        matches = sorted(
+            (int(prompt_id), record) for prompt_id, record in self._load().items()
+            if record["status"] == "pending" and not record.get("image_path") and not record.get("duplicate_of")
+            and PromptCache.normalize_topic(record.get("topic") or "") == normalized
+        )
+        return {str(prompt_id): record for prompt_id, record in matches[:limit]}
+
+    def page(self, limit: int, after_id: Optional[str] = None, topic: Optional[str] = None,
+             status: Optional[str] = None, approved: Optional[bool] = None,
+             created_from: Optional[str] = None, created_to: Optional[str] = None) -> Dict[str, Dict]:
+        after = int(after_id) if after_id else 0
+        matches = sorted(
+            (int(prompt_id), record) for prompt_id, record in self._load().items()
+            if int(prompt_id) > after
+            and (topic is None or record["topic"] == topic)
+            and (status is None or record["status"] == status)
+            and (approved is None or bool(record["approved"]) == approved)
+            and (created_from is None or record["created_at"] >= created_from)
+            and (created_to is None or record["created_at"] < created_to)
+        )
+        return {str(prompt_id): record for prompt_id, record in matches[:limit]}
+
+    def add_many(self, records: List[Dict]) -> Dict[str, Dict]:
+        with self._locked():
+            prompts = self._read()
+            next_id = max([int(k) for k in prompts.keys()] + [0]) + 1
+            added = {str(idx): dict(record) for idx, record in enumerate(records, next_id)}
+            prompts.update(added)
+            self._save(prompts)
+        return added
+
+    @staticmethod
+    def _apply(prompts: Dict[str, Dict], prompt_id: str, expected_version: Optional[int], fields: Dict) -> str:
+        if prompt_id not in prompts:
+            return NOT_FOUND
+        record = prompts[prompt_id]
+        version = record.get(VERSION_FIELD, 0)
+        if expected_version is not None and version != expected_version:
+            return CONFLICT
+        record.update(fields, **{VERSION_FIELD: version + 1})
+        return UPDATED
+
+    def update(self, prompt_id: str, expected_version: Optional[int] = None, **fields) -> bool:
+        with self._locked():
+            prompts = self._read()
+            outcome = self._apply(prompts, prompt_id, expected_version, fields)
+            if outcome == UPDATED:
+                self._save(prompts)
+        if outcome == CONFLICT:
+            raise ConcurrentUpdateError(f"Prompt {prompt_id} changed since version {expected_version}")
+        return outcome == UPDATED
+
+    def update_many(self, updates: Dict[str, Dict],
+                    expected_versions: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        expected_versions = expected_versions or {}
+        with self._locked():
+            prompts = self._read()
+            outcomes = {
+                prompt_id: self._apply(prompts, prompt_id, expected_versions.get(prompt_id), fields)
+                for prompt_id, fields in updates.items()
+            }
+            if UPDATED in outcomes.values():
+                self._save(prompts)
+        return outcomes
+
+    def count(self) -> int:
+        return len(self._load())
+
+
+class SQLitePromptStore(PromptStore):
+    """
+    Prompt store backed by SQLite in WAL mode.
+
+    Lookups by ID use the primary key, `topic`, `status` and `created_at` are
+    indexed, pages are read by keyset on the ID, and
+    every write runs in its own transaction so single-record updates never
+    rewrite or race with the rest of the store.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY,
+            prompt TEXT NOT NULL,
+            approved INTEGER NOT NULL DEFAULT 0,
+            image_path TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            extra TEXT NOT NULL DEFAULT '{}',
+            version INTEGER NOT NULL DEFAULT 0,
+            topic_key TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_prompts_topic_status ON prompts (topic, status);
+        CREATE INDEX IF NOT EXISTS idx_prompts_status ON prompts (status);
+        CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts (created_at);
+        -- Keyset pages filtered on one column read it in ID order, without sorting
+        CREATE INDEX IF NOT EXISTS idx_prompts_topic_id ON prompts (topic, id);
+        CREATE INDEX IF NOT EXISTS idx_prompts_approved_id ON prompts (approved, id);
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = StoreConfig.BUSY_TIMEOUT_MS):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block of statements as one write transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        """Add columns introduced after a database was created."""
+        with self.transaction() as conn:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(prompts)")}
+            if "version" not in columns:
+                conn.execute("ALTER TABLE prompts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "topic_key" not in columns:
+                # Normalized topic, which SQL cannot compute, so top-ups can look a topic up by index
+                conn.execute("ALTER TABLE prompts ADD COLUMN topic_key TEXT NOT NULL DEFAULT ''")
+                conn.executemany(
+                    "UPDATE prompts SET topic_key = ? WHERE id = ?",
+                    [(PromptCache.normalize_topic(row["topic"]), row["id"])
+                     for row in conn.execute("SELECT id, topic FROM prompts").fetchall()]
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_prompts_topic_key ON prompts (topic_key, status, id)")
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict:
+        record = {
+            "prompt": row["prompt"],
+            "approved": bool(row["approved"]),
+            "image_path": row["image_path"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "topic": row["topic"],
+        }
+        record.update(json.loads(row["extra"]))
+        return record
+
+    @staticmethod
+    def _to_columns(record: Dict) -> Dict:
+        columns = {field: record.get(field) for field in CORE_FIELDS}
+        columns["approved"] = int(bool(columns["approved"]))
+        columns["extra"] = json.dumps({k: v for k, v in record.items() if k not in CORE_FIELDS})
+        columns["topic_key"] = PromptCache.normalize_topic(columns["topic"] or "")
+        return columns
+
+    def _select(self, where: str = "", params: tuple = (), limit: Optional[int] = None) -> Dict[str, Dict]:
+        query = f"SELECT * FROM prompts {where} ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params = params + (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {str(row["id"]): self._to_record(row) for row in rows}
+
+    def get(self, prompt_id: str) -> Optional[Dict]:
+        if not str(prompt_id).isdigit():
+            return None
+        return self._select("WHERE id = ?", (int(prompt_id),)).get(str(int(prompt_id)))
+
+    def get_versioned(self, prompt_id: str) -> Optional[Tuple[Dict, int]]:
+        if not str(prompt_id).isdigit():
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM prompts WHERE id = ?", (int(prompt_id),)).fetchone()
+        if row is None:
+            return None
+        return self._to_record(row), row["version"]
+
+    def get_many(self, prompt_ids: Iterable[str]) -> Dict[str, Dict]:
+        ids = [int(prompt_id) for prompt_id in prompt_ids if str(prompt_id).isdigit()]
+        if not ids:
+            return {}
+        placeholders = ", ".join("?" for _ in ids)
+        return self._select(f"WHERE id IN ({placeholders})", tuple(ids))
+
+    def get_many_versioned(self, prompt_ids: Iterable[str]) -> Dict[str, Tuple[Dict, int]]:
+        ids = [int(prompt_id) for prompt_id in prompt_ids if str(prompt_id).isdigit()]
+        if not ids:
+            return {}
+        placeholders = ", ".join("?" for _ in ids)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM prompts WHERE id IN ({placeholders})", ids).fetchall()
+        return {str(row["id"]): (self._to_record(row), row["version"]) for row in rows}
+
+    def all(self) -> Dict[str, Dict]:
+        return self._select()
+
+    @staticmethod
+    def _where(conditions: List[tuple]) -> tuple:
+        """Build a WHERE clause from (clause, value) pairs, skipping None values"""
+        conditions = [(clause, value) for clause, value in conditions if value is not None]
+        where = f"WHERE {' AND '.join(clause for clause, _ in conditions)}" if conditions else ""
+        return where, tuple(value for _, value in conditions)
+
+    def find(self, topic: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Dict]:
+        return self._select(*self._where([("topic = ?", topic), ("status = ?", status)]))
+
+    def find_unused(self, topic: str, limit: int) -> Dict[str, Dict]:
+        return self._select(
+            "WHERE topic_key = ? AND status = 'pending' AND (image_path IS NULL OR image_path = '') "
+            "AND json_extract(extra, '$.duplicate_of') IS NULL",
+            (PromptCache.normalize_topic(topic),),
+            limit
+        )
+
+    def page(self, limit: int, after_id: Optional[str] = None, topic: Optional[str] = None,
+             status: Optional[str] = None, approved: Optional[bool] = None,
+             created_from: Optional[str] = None, created_to: Optional[str] = None) -> Dict[str, Dict]:
+        where, params = self._where([
+            ("id > ?", int(after_id) if after_id else None),
+            ("topic = ?", topic),
+            ("status = ?", status),
+            ("approved = ?", None if approved is None else int(approved)),
+            ("created_at >= ?", created_from),
+            ("created_at < ?", created_to),
+        ])
+        return self._select(where, params, limit)
+
+    def add_many(self, records: List[Dict]) -> Dict[str, Dict]:
+        added = {}
+        with self.transaction() as conn:
+            for record in records:
+                columns = self._to_columns(record)
+                cursor = conn.execute(
+                    "INSERT INTO prompts (prompt, approved, image_path, status, created_at, topic, extra, topic_key) "
+                    "VALUES (:prompt, :approved, :image_path, :status, :created_at, :topic, :extra, :topic_key)",
+                    columns
+                )
+                added[str(cursor.lastrowid)] = dict(record)
+        return added
+
+    def import_records(self, prompts: Dict[str, Dict]) -> int:
+        """Insert records under their existing IDs, skipping IDs already present"""
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO prompts "
+                "(id, prompt, approved, image_path, status, created_at, topic, extra, topic_key) "
+                "VALUES (:id, :prompt, :approved, :image_path, :status, :created_at, :topic, :extra, :topic_key)",
+                [dict(self._to_columns(record), id=int(prompt_id)) for prompt_id, record in prompts.items()]
+            )
+            return conn.total_changes - before
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, prompt_id: str, expected_version: Optional[int], fields: Dict) -> str:
+        """Update one record inside the caller's transaction"""
+        if not str(prompt_id).isdigit():
+            return NOT_FOUND
+        core = {k: v for k, v in fields.items() if k in CORE_FIELDS}
+        extra = {k: v for k, v in fields.items() if k not in CORE_FIELDS}
+        if "approved" in core:
+            core["approved"] = int(bool(core["approved"]))
+        if "topic" in core:
+            core["topic_key"] = PromptCache.normalize_topic(core["topic"] or "")
+
+        row = conn.execute("SELECT extra, version FROM prompts WHERE id = ?", (int(prompt_id),)).fetchone()
+        if row is None:
+            return NOT_FOUND
+        if expected_version is not None and row["version"] != expected_version:
+            return CONFLICT
+        assignments = [f"{column} = :{column}" for column in core] + ["version = version + 1"]
+        params = dict(core, id=int(prompt_id))
+        if extra:
+            assignments.append("extra = :extra")
+            params["extra"] = json.dumps(dict(json.loads(row["extra"]), **extra))
+        conn.execute(f"UPDATE prompts SET {', '.join(assignments)} WHERE id = :id", params)
+        return UPDATED
+
+    def update(self, prompt_id: str, expected_version: Optional[int] = None, **fields) -> bool:
+        with self.transaction() as conn:
+            outcome = self._apply(conn, prompt_id, expected_version, fields)
+        if outcome == CONFLICT:
+            raise ConcurrentUpdateError(f"Prompt {prompt_id} changed since version {expected_version}")
+        return outcome == UPDATED
+
+    def update_many(self, updates: Dict[str, Dict],
+                    expected_versions: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        expected_versions = expected_versions or {}
+        with self.transaction() as conn:
+            return {
+                prompt_id: self._apply(conn, prompt_id, expected_versions.get(prompt_id), fields)
+                for prompt_id, fields in updates.items()
+            }
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_to_sqlite(json_path: str, store: SQLitePromptStore) -> int:
+    """
+    Import a legacy prompts.json file into a SQLite store.
+
+    Args:
+        json_path (str): Path to the JSON prompts file
+        store (SQLitePromptStore): Destination store
+
+    Returns:
+        int: Number of records imported
+    """
+    if not os.path.exists(json_path):
+        return 0
+    with open(json_path, 'r') as f:
+        return store.import_records(json.load(f))
+
+
+def create_prompt_store(backend: str = StoreConfig.BACKEND,
+                        path_manager: Optional[PathManager] = None) -> PromptStore:
+    """
+    Create the configured prompt store.
+
+    A new SQLite store is seeded from the legacy JSON file if one exists.
+
+    Args:
+        backend (str): "sqlite" or "json"
+        path_manager (Optional[PathManager]): Shared path manager
+
+    Returns:
+        PromptStore: The prompt store
+    """
+    path_manager = path_manager or PathManager()
+    if backend == "json":
+        return JsonPromptStore(path_manager.prompts_file)
+    if backend == "sqlite":
+        store = SQLitePromptStore(path_manager.prompts_db)
+        if store.count() == 0:
+            migrate_json_to_sqlite(path_manager.prompts_file, store)
+        return store
+    raise ValueError(f"Unknown prompt store backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a prompts.json file into the SQLite prompt store")
+    parser.add_argument("json_path", nargs="?", default=PathManager().prompts_file)
+    parser.add_argument("--db", default=PathManager().prompts_db)
+    args = parser.parse_args()
+
+    sqlite_store = SQLitePromptStore(args.db)
+    imported = migrate_json_to_sqlite(args.json_path, sqlite_store)
+    print(f"Imported {imported} prompts into {args.db} ({sqlite_store.count()} total)")
+    sqlite_store.close()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """Async token bucket limiting how often a resource may be called."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Initialize the token bucket.
+
+        Args:
+            rate_per_minute (float): Tokens added per minute, 0 disables limiting
+            capacity (float): Maximum burst size, defaults to one second's worth
+                of tokens (at least one)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for the given time, e.g. after a 429 with Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    def paused_for(self) -> float:
+        """Seconds left before a pause ends, 0 if not paused."""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def remaining(self) -> float:
+        """Fraction of the burst capacity that can be taken without waiting, 1 when unlimited."""
+        if self.paused_for():
+            return 0.0
+        if not self.enabled:
+            return 1.0
+        self._refill()
+        return self._tokens / self.capacity
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` tokens are available and take them."""
+        paused = self._paused_until - time.monotonic()
+        if paused > 0:
+            await asyncio.sleep(paused)
+        if not self.enabled:
+            return
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
@@ -0,0 +1,259 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from src.config.constants import ResilienceConfig
+from src.utils.logger import logger
+from src.utils.metrics import API_CALLS, API_IN_FLIGHT, API_RETRIES
+from src.utils.rate_limiter import AsyncTokenBucket
+
+T = TypeVar("T")
+
+THROTTLED = "throttled"
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+RETRYABLE_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the deployment's circuit is open."""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Decide whether a failed call may be retried.
+
+    Args:
+        error (Exception): The exception raised by the call
+
+    Returns:
+        str: THROTTLED for 429s, RETRYABLE for transient failures, FATAL otherwise
+    """
+    # Imported here so that loading this module does not pull in the SDK
+    import openai
+    
+    if isinstance(error, openai.RateLimitError):
+        return THROTTLED
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, httpx.TransportError)):
+        return RETRYABLE
+    if isinstance(error, openai.APIStatusError):
+        return RETRYABLE if error.status_code in RETRYABLE_STATUS_CODES else FATAL
+    return FATAL
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the server's requested wait from the Retry-After headers of an API error"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        if value.replace(".", "", 1).isdigit():
+            return float(value)
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the tokens of a text for TPM budgeting (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+class CircuitBreaker:
+    """
+    Fails fast after consecutive failures, then lets one trial call through.
+
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open once `reset_timeout` seconds have passed;
+    half-open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int = ResilienceConfig.BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = ResilienceConfig.BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not be attempted"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit open: deployment is failing, try again later")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                raise CircuitOpenError("Circuit half-open: waiting for trial call")
+            self._trial_in_flight = True
+
+    def allows_call(self) -> bool:
+        """Return whether before_call would let a call through, without changing state"""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        if self.state == "half_open":
+            return not self._trial_in_flight
+        return True
+
+    def abandon(self) -> None:
+        """Forget a call that ended without an outcome, e.g. when cancelled"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if it opened the circuit"""
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            opened = self.state != "open"
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            return opened
+        return False
+
+
+class ResiliencePolicy:
+    """
+    Rate limiting, retries and circuit breaking for one deployment.
+
+    Calls wait for request and token budget from token buckets sized to the
+    deployment's RPM/TPM quota, retry transient failures with full-jitter
+    exponential backoff, honor Retry-After on 429s by pausing the shared
+    buckets, and fail fast while the circuit breaker is open.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0,
+                 max_retries: int = ResilienceConfig.MAX_RETRIES,
+                 backoff_base: float = ResilienceConfig.BACKOFF_BASE,
+                 backoff_max: float = ResilienceConfig.BACKOFF_MAX,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Initialize the policy.
+
+        Args:
+            name (str): Deployment name, used in logs and stats
+            rpm (float): Requests per minute quota, 0 for unlimited
+            tpm (float): Tokens per minute quota, 0 for unlimited
+            max_retries (int): Maximum attempts per call
+            backoff_base (float): Base delay in seconds of the exponential backoff
+            backoff_max (float): Upper bound in seconds of a single backoff
+            breaker (Optional[CircuitBreaker]): Circuit breaker of the deployment
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = AsyncTokenBucket(rpm)
+        self.tokens = AsyncTokenBucket(tpm, capacity=tpm / 6 if tpm else None)
+        self.breaker = breaker or CircuitBreaker()
+        self.stats: Dict[str, float] = {
+            "calls": 0,
+            "successes": 0,
+            "retries": 0,
+            "throttled": 0,
+            "fatal_errors": 0,
+            "breaker_rejections": 0,
+            "breaker_opened": 0,
+            "throttle_wait_seconds": 0.0,
+        }
+
+    def snapshot(self) -> Dict:
+        """Return the counters and breaker state"""
+        return dict(self.stats, breaker_state=self.breaker.state)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], tokens: float = 0) -> T:
+        """
+        Run an API call under the policy.
+
+        Args:
+            fn (Callable[[], Awaitable[T]]): Makes one attempt of the call
+            tokens (float): Estimated tokens the call consumes
+
+        Returns:
+            T: The call's result
+
+        Raises:
+            CircuitOpenError: If the deployment's circuit is open
+            Exception: The last error once retries are exhausted, or a fatal error
+        """
+        self.stats["calls"] += 1
+        for attempt in range(self.max_retries):
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.stats["breaker_rejections"] += 1
+                API_CALLS.inc(deployment=self.name, outcome="breaker_rejected")
+                raise
+
+            waited = time.monotonic()
+            await self.requests.acquire()
+            if tokens:
+                await self.tokens.acquire(tokens)
+            self.stats["throttle_wait_seconds"] += time.monotonic() - waited
+
+            try:
+                with API_IN_FLIGHT.track_in_progress(deployment=self.name):
+                    result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                API_CALLS.inc(deployment=self.name, outcome=kind)
+                if kind == FATAL:
+                    # The deployment answered; the request itself was rejected
+                    self.breaker.record_success()
+                    self.stats["fatal_errors"] += 1
+                    raise
+                if kind == THROTTLED:
+                    self.stats["throttled"] += 1
+                    self.breaker.record_success()
+                elif self.breaker.record_failure():
+                    self.stats["breaker_opened"] += 1
+                    logger.error(f"Circuit opened for deployment {self.name}: {str(e)}")
+                if attempt == self.max_retries - 1 or self.breaker.state == "open":
+                    raise
+
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                elif kind == THROTTLED:
+                    # Hold back every caller of this deployment, not just this one,
+                    # and spread the restart so they do not retry in lockstep
+                    self.requests.pause(delay)
+                    delay += random.uniform(0, min(1.0, delay / 10))
+                self.stats["retries"] += 1
+                API_RETRIES.inc(deployment=self.name, kind=kind)
+                logger.warning("Retrying failed call", extra={
+                    "deployment": self.name,
+                    "attempt": attempt + 1,
+                    "error_kind": kind,
+                    "retry_in_s": round(delay, 2),
+                    "error": str(e)
+                })
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.stats["successes"] += 1
+            API_CALLS.inc(deployment=self.name, outcome="success")
+            return result
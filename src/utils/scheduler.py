@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import (AsyncIterator, Awaitable, Callable, Dict, Iterator, List,
+                    Optional, Tuple)
+
+from src.utils.metrics import SCHEDULER_REQUESTS, SCHEDULER_WAIT_SECONDS
+from src.utils.prompt_cache import PromptCache
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Images generated ahead of any request, on the off chance they are asked for
+SPECULATIVE = "speculative"
+# Priority classes in order of precedence
+PRIORITIES = (INTERACTIVE, BULK, SPECULATIVE)
+
+# Weight of the newest call in the moving average call duration
+DURATION_SMOOTHING = 0.2
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is turned away because too many are already queued."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RequestDropped(Exception):
+    """Raised when a queued request is dropped because its client went away or its deadline passed."""
+
+
+def flow_key(api_key: Optional[str] = None, topic: Optional[str] = None) -> str:
+    """
+    Name the fairness flow of a request: its API key if it sent one, else its topic.
+
+    Only a digest of the API key is kept, so flows can be logged and stored.
+    """
+    if api_key:
+        return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+    if topic:
+        return f"topic:{PromptCache.normalize_topic(topic)}"
+    return ""
+
+
+class Ticket:
+    """Who the Azure OpenAI calls of a request are made for, and how to tell it is no longer wanted."""
+
+    def __init__(self, priority: str = BULK, flow: str = "",
+                 is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                 deadline: Optional[float] = None):
+        """
+        Initialize the ticket.
+
+        Args:
+            priority (str): INTERACTIVE, BULK or SPECULATIVE
+            flow (str): Fairness flow, see `flow_key`
+            is_disconnected (Optional[Callable[[], Awaitable[bool]]]): Tells whether the client went away
+            deadline (Optional[float]): time.monotonic() after which the calls are no longer worth making
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.priority = priority
+        self.flow = flow
+        self.is_disconnected = is_disconnected
+        self.deadline = deadline
+
+    async def abandoned(self) -> bool:
+        """Whether the deadline passed or the client went away"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.is_disconnected is not None and await self.is_disconnected()
+
+
+# Calls made outside any `scheduling` block are background work
+_DEFAULT_TICKET = Ticket()
+_ticket: ContextVar[Ticket] = ContextVar("scheduler_ticket", default=_DEFAULT_TICKET)
+
+
+@contextmanager
+def scheduling(priority: str, flow: str = "", is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+               timeout: Optional[float] = None) -> Iterator[Ticket]:
+    """
+    Schedule the Azure OpenAI calls of the enclosed block, and of the tasks it starts, under one ticket.
+
+    Args:
+        priority (str): INTERACTIVE, BULK or SPECULATIVE
+        flow (str): Fairness flow, see `flow_key`
+        is_disconnected (Optional[Callable[[], Awaitable[bool]]]): Tells whether the client went away
+        timeout (Optional[float]): Seconds after which queued calls are dropped instead of made
+    """
+    ticket = Ticket(priority, flow, is_disconnected, time.monotonic() + timeout if timeout else None)
+    token = _ticket.set(ticket)
+    try:
+        yield ticket
+    finally:
+        _ticket.reset(token)
+
+
+def current_ticket() -> Ticket:
+    """Ticket of the calls made in the current context"""
+    return _ticket.get()
+
+
+class FairScheduler:
+    """
+    Admits Azure OpenAI calls by priority class, and within a class by
+    weighted fair queuing across flows.
+
+    At most `capacity` calls run at once, `reserved` of which only interactive
+    calls may take, so an interactive call never waits behind a backlog of
+    long bulk calls. Queued calls of a class always go before those of the
+    classes after it in PRIORITIES. Within a class, each call is stamped
+    with a virtual finish time one unit, divided by its flow's weight, after
+    the later of its flow's previous stamp and the class's virtual clock; the
+    smallest stamp goes next, so a flow with a deep backlog cannot starve the
+    others.
+
+    A call that would queue beyond its class's limit is rejected with
+    SchedulerOverloaded. A queued call whose client went away or whose
+    deadline passed is dropped with RequestDropped when its turn comes.
+    """
+
+    def __init__(self, capacity: int, reserved: int = 0, max_queued: Optional[Dict[str, int]] = None,
+                 weights: Optional[Dict[str, float]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            capacity (int): Most calls running at once
+            reserved (int): Slots only interactive calls may take, at most capacity - 1
+            max_queued (Optional[Dict[str, int]]): Most calls of each class waiting for a slot, 0 for unlimited
+            weights (Optional[Dict[str, float]]): Weight of each flow, 1 for flows not listed
+        """
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self.capacity = capacity
+        self.reserved = max(0, min(reserved, capacity - 1))
+        self.max_queued = max_queued or {}
+        self.weights = weights or {}
+        self.stats = {"admitted": 0, "rejected": 0, "dropped": 0}
+        self._running = 0
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._queues: Dict[str, List[Tuple[float, int, asyncio.Future]]] = {priority: [] for priority in PRIORITIES}
+        self._clock = {priority: 0.0 for priority in PRIORITIES}
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._sequence = itertools.count()
+        self._duration: Optional[float] = None
+
+    def _has_room(self, priority: str) -> bool:
+        limit = self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+        return self._running < limit
+
+    def queued(self, priority: str) -> int:
+        """Number of calls of a class waiting for a slot"""
+        return self._queued[priority]
+
+    def retry_after(self, priority: str) -> float:
+        """Rough seconds until the calls queued in a class have been admitted"""
+        slots = self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+        return max(1.0, round(self._queued[priority] / slots * (self._duration or 1.0), 1))
+
+    def _stamp(self, ticket: Ticket) -> float:
+        """Virtual finish time of a flow's next call"""
+        key = (ticket.priority, ticket.flow)
+        start = max(self._clock[ticket.priority], self._finish.get(key, 0.0))
+        self._finish[key] = start + 1.0 / self.weights.get(ticket.flow, 1.0)
+        return self._finish[key]
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the queued calls with the highest priority and smallest stamps"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._has_room(priority):
+                finish, _, waiter = heapq.heappop(queue)
+                self._clock[priority] = finish
+                if waiter.done():
+                    continue
+                self._queued[priority] -= 1
+                self._running += 1
+                waiter.set_result(None)
+            if not queue:
+                # Flows whose stamps are behind the clock start from the clock anyway
+                self._finish = {key: finish for key, finish in self._finish.items() if key[0] != priority}
+
+    async def acquire(self, ticket: Ticket) -> None:
+        """
+        Wait for a slot for a call.
+
+        Raises:
+            SchedulerOverloaded: If the call's class has too many calls queued already
+            RequestDropped: If the call waited and its client went away or its deadline passed meanwhile
+        """
+        priority = ticket.priority
+        if self._has_room(priority) and not any(self._queues[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1]):
+            self._running += 1
+            self.stats["admitted"] += 1
+            SCHEDULER_REQUESTS.inc(priority=priority, outcome="admitted")
+            return
+
+        limit = self.max_queued.get(priority, 0)
+        if limit and self._queued[priority] >= limit:
+            self.stats["rejected"] += 1
+            SCHEDULER_REQUESTS.inc(priority=priority, outcome="rejected")
+            raise SchedulerOverloaded(f"Too many {priority} requests queued", self.retry_after(priority))
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (self._stamp(ticket), next(self._sequence), waiter))
+        self._queued[priority] += 1
+        started = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._queued[priority] -= 1
+            raise
+        SCHEDULER_WAIT_SECONDS.observe(time.monotonic() - started, priority=priority)
+
+        if await ticket.abandoned():
+            self.release()
+            self.stats["dropped"] += 1
+            SCHEDULER_REQUESTS.inc(priority=priority, outcome="dropped")
+            raise RequestDropped("Request dropped: the client went away or its deadline passed")
+        self.stats["admitted"] += 1
+        SCHEDULER_REQUESTS.inc(priority=priority, outcome="admitted")
+
+    def release(self, duration: Optional[float] = None) -> None:
+        """Free a slot, recording how long the call held it"""
+        self._running -= 1
+        if duration is not None:
+            self._duration = duration if self._duration is None else (
+                DURATION_SMOOTHING * duration + (1 - DURATION_SMOOTHING) * self._duration
+            )
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, ticket: Optional[Ticket] = None) -> AsyncIterator[None]:
+        """Hold a slot for one call, made under the given ticket or the current context's"""
+        await self.acquire(ticket or current_ticket())
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self) -> Dict:
+        """Return the counters, running calls and queue depths"""
+        return dict(self.stats, running=self._running, queued=dict(self._queued))
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight await the same result. A caller being cancelled does not cancel
+    the shared work for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether work for the key is currently running"""
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn` unless a call for `key` is already in flight, and return its result.
+
+        Args:
+            key (Hashable): Identifies equivalent calls
+            fn (Callable[[], Awaitable[T]]): Starts the work when no call is in flight
+
+        Returns:
+            T: The result shared by every caller of the same flight
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
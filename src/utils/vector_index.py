@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.file_utils import atomic_write, file_lock
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over unit-normalized float32 vectors.
+
+    Vectors live in one contiguous NumPy matrix that grows by doubling, so a
+    search is a single matrix-vector product followed by an argpartition
+    top-k. When a path is given, vectors and IDs are appended to
+    `<path>.f32` and `<path>.ids` so the index survives restarts without
+    ever rewriting what is already on disk.
+    """
+
+    def __init__(self, path: Optional[str] = None, dimensions: Optional[int] = None):
+        """
+        Initialize the index, loading it from disk if a path is given.
+
+        Args:
+            path (Optional[str]): Path prefix of the on-disk index, None keeps it in memory
+            dimensions (Optional[int]): Vector size, inferred from the first add if omitted
+        """
+        self.path = path
+        self.dimensions = dimensions
+        self._ids: List[str] = []
+        self._positions = {}
+        self._vectors = np.empty((0, dimensions or 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+
+    @property
+    def _vectors_file(self) -> str:
+        return f"{self.path}.f32"
+
+    @property
+    def _ids_file(self) -> str:
+        return f"{self.path}.ids"
+
+    @property
+    def _meta_file(self) -> str:
+        return f"{self.path}.json"
+
+    def _load(self) -> None:
+        if not os.path.exists(self._meta_file):
+            return
+        with open(self._meta_file, 'r') as f:
+            self.dimensions = json.load(f)["dimensions"]
+        with open(self._ids_file, 'r') as f:
+            ids = f.read().splitlines()
+        vectors = np.fromfile(self._vectors_file, dtype=np.float32).reshape(-1, self.dimensions)
+        # A crash between the two appends can leave one file longer than the other
+        count = min(len(ids), len(vectors))
+        # Workers sharing the files may each have appended the same ID
+        first = {}
+        for position, item_id in enumerate(ids[:count]):
+            first.setdefault(item_id, position)
+        self._ids = list(first)
+        self._positions = {item_id: position for position, item_id in enumerate(self._ids)}
+        self._vectors = np.array(vectors[list(first.values())], dtype=np.float32)
+
+    def _append_to_disk(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        # Other processes append to the same files; their rows must not interleave with ours
+        with file_lock(self.path):
+            if not os.path.exists(self._meta_file):
+                atomic_write(self._meta_file, json.dumps({"dimensions": self.dimensions}))
+            with open(self._vectors_file, 'ab') as f:
+                vectors.tofile(f)
+            with open(self._ids_file, 'a') as f:
+                f.write("".join(f"{item_id}\n" for item_id in ids))
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """Scale vectors to unit length so that dot products are cosine similarities"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Add vectors under the given IDs, skipping IDs already indexed.
+
+        Args:
+            ids (Sequence[str]): Item IDs
+            vectors (np.ndarray): Matrix with one row per ID
+        """
+        vectors = self.normalize(vectors)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self._vectors = np.empty((0, self.dimensions), dtype=np.float32)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}")
+
+        with self._lock:
+            keep = [i for i, item_id in enumerate(ids) if item_id not in self._positions]
+            if not keep:
+                return
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+
+            size = len(self._ids)
+            if size + len(ids) > len(self._vectors):
+                grown = np.empty((max(2 * len(self._vectors), size + len(ids), 1024), self.dimensions), dtype=np.float32)
+                grown[:size] = self._vectors[:size]
+                self._vectors = grown
+            self._vectors[size:size + len(ids)] = vectors
+            for offset, item_id in enumerate(ids):
+                self._positions[item_id] = size + offset
+            self._ids.extend(ids)
+
+            if self.path:
+                self._append_to_disk(ids, vectors)
+
+    def get_vector(self, item_id: str) -> Optional[np.ndarray]:
+        """Return the stored unit vector of an item, or None if it is not indexed"""
+        position = self._positions.get(item_id)
+        return None if position is None else self._vectors[position].copy()
+
+    def search(self, vector: np.ndarray, k: int = 5, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """
+        Find the k most similar indexed items.
+
+        Args:
+            vector (np.ndarray): Query vector
+            k (int): Number of results
+            exclude (Iterable[str]): IDs to leave out of the results
+
+        Returns:
+            List[Tuple[str, float]]: (ID, cosine similarity) pairs, most similar first
+        """
+        return self.search_many(np.atleast_2d(vector), k, exclude)[0]
+
+    def search_many(self, vectors: np.ndarray, k: int = 5, exclude: Iterable[str] = ()) -> List[List[Tuple[str, float]]]:
+        """Run `search` for every row of a query matrix in one matrix product"""
+        queries = self.normalize(vectors)
+        with self._lock:
+            size = len(self._ids)
+            matrix = self._vectors[:size]
+            # The ID list is append-only, so positions below `size` stay valid
+            ids = self._ids
+        if size == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ matrix.T
+        excluded = [self._positions[item_id] for item_id in exclude if item_id in self._positions]
+        if excluded:
+            scores[:, excluded] = -np.inf
+
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                (ids[position], float(scores[row, position]))
+                for position in ordered if np.isfinite(scores[row, position])
+            ])
+        return results
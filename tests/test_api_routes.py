@@ -0,0 +1,456 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pytest
+from PIL import Image
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.stub_s3 import StubS3Server
+from benchmarks.stub_server import StubAzureOpenAIServer
+from src.config.constants import (APIConfig, MetricsConfig, QualityConfig,
+                                  SimilarityConfig, SpeculativeConfig)
+from src.routes.api_routes import router
+from src.routes.middleware import timing_middleware
+from src.services.container import ServiceContainer
+from src.utils.agent import AzureOpenAIChat
+from src.utils.deployment_pool import Deployment
+from src.utils.image_cache import ImageCache
+from src.utils.image_store import S3ImageStore
+from src.utils.path_manager import PathManager
+from src.utils.prompt_store import SQLitePromptStore
+
+
+class FakeAgent:
+    dall_e_deployment = "dall-e-3"
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.closed = False
+        self.images_generated = 0
+
+    async def generate_prompts(self, topic: str, n: int = 10):
+        return [f"{topic} prompt {i}" for i in range(n)]
+
+    async def stream_prompts(self, topic: str, n: int = 10):
+        for prompt in await self.generate_prompts(topic, n):
+            await asyncio.sleep(0)
+            yield prompt
+
+    async def embed_texts(self, texts):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1
+        return vectors
+
+    async def generate_image(self, prompt: str, save_path=None, **kwargs) -> str:
+        await asyncio.sleep(0)
+        self.images_generated += 1
+        Image.new("RGB", (64, 64), "navy").save(save_path, format="PNG")
+        return str(save_path)
+
+    async def generate_images(self, prompt: str, save_paths, **kwargs):
+        return [await self.generate_image(prompt, save_path) for save_path in save_paths]
+
+    def discard_cached_image(self, prompt: str, *args) -> None:
+        pass
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def container(tmp_path):
+    return ServiceContainer(
+        agent=FakeAgent(str(tmp_path)),
+        store=SQLitePromptStore(str(tmp_path / "prompts.db")),
+        path_manager=PathManager(str(tmp_path))
+    )
+
+
+def _app(container: ServiceContainer) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await container.start()
+        yield
+        await container.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router, prefix=APIConfig.API_PREFIX)
+    app.state.container = container
+    return app
+
+
+@pytest.fixture
+def client(container):
+    with TestClient(_app(container)) as client:
+        yield client
+
+
+def test_generate_then_approve_image(client, container):
+    response = client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 2})
+    assert response.status_code == 200
+    assert sorted(response.json()["prompts"]) == ["1", "2"]
+
+    response = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+    assert response.status_code == 200
+    assert container.store.get("1")["status"] == "generated"
+
+    response = client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": True})
+    assert response.status_code == 200
+    record = container.store.get("1")
+    assert record["status"] == "approved"
+    assert record["processing"] == "done"
+    # Images are stored under sharded keys and stay put on approval
+    assert record["image_path"].count("/") == 2
+    assert os.path.exists(container.image_store.path(record["image_path"]))
+    assert all(os.path.exists(container.image_store.path(key)) for key in record["variants"].values())
+    assert not os.listdir(container.path_manager.image_ingest_dir)
+    assert not os.listdir(container.path_manager.image_process_dir)
+
+    response = client.get("/api/v1/images/1", params={"variant": "thumbnail"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert client.get("/api/v1/images/1", params={"variant": "gif"}).status_code == 400
+
+
+def test_images_failing_the_quality_gate_are_generated_again(client, container, monkeypatch):
+    monkeypatch.setattr(QualityConfig, "MAX_REGENERATIONS", 1)
+    generate_image = container.agent.generate_image
+
+    async def blank_then_detailed(prompt, save_path=None, **kwargs):
+        await generate_image(prompt, save_path)
+        if container.agent.images_generated > 1:
+            Image.effect_noise((64, 64), 64).convert("RGB").save(save_path, format="PNG")
+        return str(save_path)
+
+    container.agent.generate_image = blank_then_detailed
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+    response = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+
+    assert response.status_code == 200
+    assert container.agent.images_generated == 2
+    quality = container.store.get("1")["quality"]
+    assert quality["passed"] and quality["sharpness"] > 1000
+    assert not os.listdir(container.path_manager.image_ingest_dir)
+
+
+def _cached_container(tmp_path, server: StubAzureOpenAIServer) -> ServiceContainer:
+    """A container whose real agent talks to the stub server through an image cache, with one pending prompt"""
+    path_manager = PathManager(str(tmp_path))
+    deployments = {"chat": "gpt-4", "images": "dall-e-3", "embeddings": "embedding"}
+    agent = AzureOpenAIChat(
+        path_manager=path_manager,
+        image_cache=ImageCache(path_manager.image_cache_dir, 10 ** 8),
+        deployments={kind: [Deployment(kind, deployment, server.endpoint, "stub-key")]
+                     for kind, deployment in deployments.items()}
+    )
+    container = ServiceContainer(agent=agent, store=SQLitePromptStore(str(tmp_path / "prompts.db")),
+                                 path_manager=path_manager)
+    container.store.add_many([{"prompt": "A lighthouse in a storm", "approved": False, "image_path": None,
+                               "status": "pending", "created_at": "2025-04-28T23:00:32", "topic": "sea"}])
+    return container
+
+
+def test_regeneration_does_not_get_the_rejected_image_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(QualityConfig, "MAX_REGENERATIONS", 2)
+    monkeypatch.setattr(SimilarityConfig, "ENABLED", False)
+
+    # The stub serves a smooth gradient, which the gate always rejects as blurry
+    with StubAzureOpenAIServer(latency=0, image_size="256x256") as server:
+        container = _cached_container(tmp_path, server)
+        with TestClient(_app(container)) as client:
+            response = client.post("/api/v1/generate-image",
+                                   json={"prompt_id": "1", "prompt": "A lighthouse in a storm"})
+            quality = container.store.get("1")["quality"]
+
+    assert response.status_code == 200
+    # Each regeneration was a new image call rather than a cache hit
+    assert server.requests == 3
+    assert quality["reasons"] == ["blurry"]
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_generating_a_rejected_prompt_again_does_not_get_the_cached_image(tmp_path, monkeypatch, batch):
+    monkeypatch.setattr(SimilarityConfig, "ENABLED", False)
+    request = {"prompt_id": "1", "prompt": "A lighthouse in a storm"}
+
+    with StubAzureOpenAIServer(latency=0, image_size="256x256") as server:
+        container = _cached_container(tmp_path, server)
+        with TestClient(_app(container)) as client:
+            assert client.post("/api/v1/generate-image", json=request).status_code == 200
+            if batch:
+                client.post("/api/v1/approve-images", json={"decisions": [{"prompt_id": "1", "approved": False}]})
+            else:
+                client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": False})
+            assert container.store.get("1")["status"] == "rejected"
+            assert client.post("/api/v1/generate-image", json=request).status_code == 200
+
+    assert server.requests == 2
+
+
+def test_images_are_served_with_etag_and_ranges(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+    client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+    with open(container.image_store.path(container.store.get("1")["image_path"]), "rb") as f:
+        content = f.read()
+
+    response = client.get("/api/v1/images/1")
+    assert response.status_code == 200 and response.content == content
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == "no-cache"
+    etag = response.headers["etag"]
+
+    assert client.get("/api/v1/images/1", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get("/api/v1/images/1", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206 and response.content == content[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+    response = client.get("/api/v1/images/1", headers={"Range": "bytes=-8"})
+    assert response.status_code == 206 and response.content == content[-8:]
+
+    # A stale If-Range gets the whole current image
+    response = client.get("/api/v1/images/1", headers={"Range": "bytes=0-3", "If-Range": '"stale"'})
+    assert response.status_code == 200 and response.content == content
+
+    response = client.get("/api/v1/images/1", headers={"Range": f"bytes={len(content)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+
+def test_images_are_processed_and_served_from_an_s3_store(tmp_path):
+    with StubS3Server() as s3:
+        container = ServiceContainer(
+            agent=FakeAgent(str(tmp_path)),
+            store=SQLitePromptStore(str(tmp_path / "prompts.db")),
+            path_manager=PathManager(str(tmp_path)),
+            image_store=S3ImageStore(s3.endpoint, s3.bucket, s3.access_key, s3.secret_key)
+        )
+        with TestClient(_app(container)) as client:
+            client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+            assert client.post("/api/v1/generate-image",
+                               json={"prompt_id": "1", "prompt": "ocean prompt 0"}).status_code == 200
+            assert client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": True}).status_code == 200
+
+            record = container.store.get("1")
+            content = s3.objects[record["image_path"]][0]
+            response = client.get("/api/v1/images/1", headers={"Range": "bytes=0-7"})
+            assert response.status_code == 206 and response.content == content[:8] == b"\x89PNG\r\n\x1a\n"
+            assert client.get("/api/v1/images/1", params={"variant": "thumbnail"}).status_code == 200
+
+        assert set(s3.objects) == {record["image_path"], *record["variants"].values()}
+        assert not os.listdir(container.path_manager.image_ingest_dir)
+        assert not os.listdir(container.path_manager.image_process_dir)
+
+
+def test_approve_picks_one_of_several_candidates(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+
+    response = client.post("/api/v1/generate-image",
+                           json={"prompt_id": "1", "prompt": "ocean prompt 0", "num_candidates": 3})
+    assert response.status_code == 200
+    candidates = response.json()["candidates"]
+    assert len(candidates) == 3 and response.json()["image_path"] == candidates[0]
+
+    response = client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": True, "candidate": 5})
+    assert response.status_code == 400
+    response = client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": True, "candidate": 2})
+    assert response.status_code == 200
+
+    record = container.store.get("1")
+    assert record["selected_candidate"] == 2
+    assert record["image_path"] == candidates[2]
+    assert record["variants"] == record["candidates"][2]["variants"]
+    assert record["phash"] == record["candidates"][2]["phash"]
+
+
+def test_approval_racing_another_update_is_refused(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+    client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+    get_versioned = container.store.get_versioned
+
+    def get_versioned_then_reject(prompt_id):
+        # Another worker rejects the prompt right after this request read it
+        versioned = get_versioned(prompt_id)
+        container.store.update(prompt_id, approved=False, status="rejected")
+        return versioned
+
+    container.store.get_versioned = get_versioned_then_reject
+    response = client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": True})
+    assert response.status_code == 409
+    assert container.store.get("1")["status"] == "rejected"
+
+
+def test_batch_approval_reports_every_decision(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 5})
+    for prompt_id in ("1", "2", "3", "4"):
+        client.post("/api/v1/generate-image", json={"prompt_id": prompt_id, "prompt": "ocean prompt"})
+    container.image_store.delete(container.store.get("3")["image_path"])
+
+    response = client.post("/api/v1/approve-images", json={"decisions": [
+        {"prompt_id": "1", "approved": True},
+        {"prompt_id": "2", "approved": False},
+        {"prompt_id": "3", "approved": True},
+        {"prompt_id": "4", "approved": True, "candidate": 7},
+        {"prompt_id": "99", "approved": True},
+        {"prompt_id": "1", "approved": False},
+        {"prompt_id": "5", "approved": False},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == [
+        "approved", "rejected", "missing_image", "invalid", "not_found", "duplicate", "rejected"
+    ]
+    assert (body["approved"], body["rejected"], body["failed"]) == (1, 2, 4)
+    assert [container.store.get(prompt_id)["status"] for prompt_id in ("1", "2", "3", "4", "5")] == [
+        "approved", "rejected", "generated", "generated", "rejected"
+    ]
+    assert client.post("/api/v1/approve-images", json={"decisions": []}).status_code == 422
+
+
+def test_batch_approval_skips_prompts_changed_meanwhile(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 2})
+    get_many_versioned = container.store.get_many_versioned
+
+    def read_then_reject(prompt_ids):
+        versioned = get_many_versioned(prompt_ids)
+        container.store.update("1", approved=False, status="rejected")
+        return versioned
+
+    container.store.get_many_versioned = read_then_reject
+    response = client.post("/api/v1/approve-images", json={"decisions": [
+        {"prompt_id": "1", "approved": True}, {"prompt_id": "2", "approved": True}
+    ]})
+
+    assert [result["status"] for result in response.json()["results"]] == ["conflict", "approved"]
+    assert container.store.get("1")["status"] == "rejected"
+    assert container.store.get("2")["status"] == "approved"
+
+
+def test_generate_image_is_idempotent_per_key(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 2})
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"}, headers=headers)
+    retry = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"}, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert container.agent.images_generated == 1
+
+    response = client.post("/api/v1/generate-image", json={"prompt_id": "2", "prompt": "ocean prompt 1"},
+                           headers=headers)
+    assert response.status_code == 409
+
+
+def test_generate_image_reports_the_worker_spans_in_server_timing(container, monkeypatch):
+    monkeypatch.setattr(MetricsConfig, "TIMING_HEADERS", True)
+    app = _app(container)
+    app.middleware("http")(timing_middleware)
+    with TestClient(app) as client:
+        client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+        response = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+    assert response.status_code == 200
+    # The pipeline runs in a job worker, not in the request's context
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert {"generate_image", "store_write", "total"} <= set(stages)
+
+
+def test_generate_image_adopts_the_speculative_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(SpeculativeConfig, "ENABLED", True)
+    container = ServiceContainer(
+        agent=FakeAgent(str(tmp_path)),
+        store=SQLitePromptStore(str(tmp_path / "prompts.db")),
+        path_manager=PathManager(str(tmp_path))
+    )
+    container.prompt_service.daily_budget = 1
+
+    with TestClient(_app(container)) as client:
+        client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 2})
+        # Only the first prompt fits in the topic's budget
+        assert container.job_queue.count() == 1
+
+        headers = {"Idempotency-Key": "first"}
+        first = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"},
+                            headers=headers)
+        retry = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"},
+                            headers=headers)
+        assert first.status_code == 200
+        assert retry.json() == first.json()
+        assert container.agent.images_generated == 1
+
+        # A speculative generation is only handed out once
+        client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+        client.post("/api/v1/generate-image", json={"prompt_id": "2", "prompt": "ocean prompt 1"})
+        assert container.agent.images_generated == 3
+
+
+def test_generate_image_does_not_adopt_a_reviewed_speculative_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(SpeculativeConfig, "ENABLED", True)
+    container = ServiceContainer(
+        agent=FakeAgent(str(tmp_path)),
+        store=SQLitePromptStore(str(tmp_path / "prompts.db")),
+        path_manager=PathManager(str(tmp_path))
+    )
+    container.prompt_service.daily_budget = 1
+
+    with TestClient(_app(container)) as client:
+        client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 1})
+        deadline = time.monotonic() + 5
+        while container.store.get("1")["status"] != "generated" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert container.agent.images_generated == 1
+
+        client.post("/api/v1/approve-image", json={"prompt_id": "1", "approved": False})
+        response = client.post("/api/v1/generate-image", json={"prompt_id": "1", "prompt": "ocean prompt 0"})
+        assert response.status_code == 200
+        assert container.agent.images_generated == 2
+
+
+def test_stream_prompts_persists_and_sends_each_prompt(client, container):
+    client.post("/api/v1/generate-prompts", json={"topic": "forest", "num_prompts": 2})
+
+    response = client.get("/api/v1/generate-prompts/stream",
+                          params={"topic": "ocean", "num_prompts": 3, "generate_images": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [event for event, _ in events] == ["prompt", "prompt", "prompt", "done"]
+    assert [data["prompt_id"] for _, data in events[:3]] == ["3", "4", "5"]
+    assert all(data["job_id"] for _, data in events[:3])
+    assert container.store.get("5")["prompt"] == "ocean prompt 2"
+
+
+def test_list_prompts_pages_filters_and_projects(client):
+    client.post("/api/v1/generate-prompts", json={"topic": "ocean", "num_prompts": 3})
+    client.post("/api/v1/generate-prompts", json={"topic": "forest", "num_prompts": 2})
+
+    page = client.get("/api/v1/prompts", params={"limit": 2, "fields": "prompt,status"}).json()
+    assert page["items"] == [
+        {"prompt_id": "1", "prompt": "ocean prompt 0", "status": "pending"},
+        {"prompt_id": "2", "prompt": "ocean prompt 1", "status": "pending"},
+    ]
+    page = client.get("/api/v1/prompts", params={"limit": 2, "cursor": page["next_cursor"]}).json()
+    assert [item["prompt_id"] for item in page["items"]] == ["3", "4"]
+    page = client.get("/api/v1/prompts", params={"limit": 2, "cursor": page["next_cursor"]}).json()
+    assert [item["prompt_id"] for item in page["items"]] == ["5"] and page["next_cursor"] is None
+
+    page = client.get("/api/v1/prompts", params={"topic": "forest", "approved": False}).json()
+    assert [item["prompt_id"] for item in page["items"]] == ["4", "5"]
+    assert client.get("/api/v1/prompts", params={"cursor": "abc"}).status_code == 400
+
+
+def test_services_share_one_agent_and_store(container):
+    assert container.image_service.agent is container.prompt_service.agent is container.agent
+    assert container.image_service.prompt_service is container.prompt_service
+    assert container.prompt_service.store is container.store
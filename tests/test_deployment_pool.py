@@ -0,0 +1,161 @@
+import asyncio
+import json
+import socket
+
+import httpx
+import openai
+import pytest
+
+from benchmarks.stub_server import StubAzureOpenAIServer
+from src.utils.agent import AzureOpenAIChat
+from src.utils.deployment_pool import (REMAINING_QUOTA, Deployment,
+                                       DeploymentPool, load_deployments)
+from src.utils.resilience import CircuitBreaker, CircuitOpenError
+
+
+def _deployment(name: str, kind: str = "embeddings", endpoint: str = "https://example.openai.azure.com",
+                **kwargs) -> Deployment:
+    return Deployment(kind, "embedding", endpoint, "stub-key", name=name, **kwargs)
+
+
+def _agent(embeddings):
+    return AzureOpenAIChat(max_retries=3, deployments={
+        "chat": [_deployment("chat", kind="chat")],
+        "images": [_deployment("images", kind="images")],
+        "embeddings": embeddings,
+    })
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_fails_over_from_a_throttled_deployment():
+    with StubAzureOpenAIServer(latency=0, throttle_rate=1.0, retry_after=30) as throttled, \
+            StubAzureOpenAIServer(latency=0) as healthy:
+        agent = _agent([
+            _deployment("eastus", endpoint=throttled.endpoint, weight=10),
+            _deployment("westus", endpoint=healthy.endpoint),
+        ])
+
+        async def run():
+            try:
+                return [await agent.embed_texts(["a red fox"]) for _ in range(3)]
+            finally:
+                await agent.close()
+
+        results = asyncio.run(run())
+
+    assert all(vectors.shape == (1, 64) for vectors in results)
+    # The 429 paused the preferred deployment; later calls went straight to the other one
+    assert throttled.requests == 1 and healthy.requests == 3
+    east, west = agent.resilience_stats()["embeddings"]["deployments"]
+    assert east["health"] == "throttled" and east["throttled"] == 1
+    assert west["health"] == "healthy" and west["successes"] == 3 and west["latency_ms"] is not None
+    assert agent.resilience["embeddings"].stats["failovers"] == 1
+
+
+def test_fails_over_from_an_unreachable_deployment_and_opens_its_circuit():
+    with StubAzureOpenAIServer(latency=0) as healthy:
+        down = _deployment("down", endpoint=f"http://127.0.0.1:{_closed_port()}", weight=10)
+        down.policy.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        agent = _agent([down, _deployment("up", endpoint=healthy.endpoint)])
+
+        async def run():
+            try:
+                for _ in range(4):
+                    await agent.embed_texts(["a red fox"])
+            finally:
+                await agent.close()
+
+        asyncio.run(run())
+
+    assert down.policy.stats["calls"] == 2 and down.health() == "open"
+    assert healthy.requests == 4
+
+
+def test_fatal_errors_are_not_failed_over():
+    pool = DeploymentPool("images", [_deployment("a"), _deployment("b")], backoff_base=0.001)
+    calls = []
+
+    async def reject(deployment):
+        calls.append(deployment.name)
+        request = httpx.Request("POST", "https://example.openai.azure.com")
+        raise openai.BadRequestError("content_policy_violation", response=httpx.Response(400, request=request),
+                                     body=None)
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(pool.call(reject))
+    assert calls == ["a"]
+
+
+def test_routes_by_outstanding_requests_per_weight():
+    heavy, light = _deployment("heavy", weight=3), _deployment("light")
+    pool = DeploymentPool("embeddings", [heavy, light])
+    routed = []
+
+    async def call(deployment):
+        routed.append(deployment.name)
+        await asyncio.sleep(0.05)
+
+    async def run():
+        await asyncio.gather(*(pool.call(call) for _ in range(8)))
+
+    asyncio.run(run())
+
+    assert routed.count("heavy") == 6 and routed.count("light") == 2
+
+
+def test_routes_by_remaining_quota():
+    busy, idle = _deployment("busy", rpm=120), _deployment("idle", rpm=120)
+    pool = DeploymentPool("embeddings", [busy, idle], strategy=REMAINING_QUOTA)
+    routed = []
+
+    async def call(deployment):
+        routed.append(deployment.name)
+
+    async def run():
+        await busy.policy.requests.acquire()
+        await pool.call(call)
+
+    asyncio.run(run())
+
+    assert routed == ["idle"]
+
+
+def test_rejects_calls_when_every_circuit_is_open():
+    deployments = [_deployment("a"), _deployment("b")]
+    for deployment in deployments:
+        deployment.policy.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        deployment.policy.breaker.record_failure()
+    pool = DeploymentPool("embeddings", deployments)
+
+    async def call(deployment):
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(pool.call(call))
+
+
+def test_loads_deployments_from_json():
+    deployments = load_deployments(json.dumps([
+        {"kind": "chat", "deployment": "gpt-4", "endpoint": "https://eastus.example.com", "api_key": "k1",
+         "region": "eastus", "tpm": 30000},
+        {"kind": "images", "deployment": "dall-e-3", "endpoint": "https://eastus.example.com", "api_key": "k1",
+         "region": "eastus", "weight": 2, "rpm": 6},
+        {"kind": "images", "deployment": "dall-e-3", "endpoint": "https://swedencentral.example.com",
+         "api_key": "k2", "region": "swedencentral", "rpm": 3},
+        {"kind": "embeddings", "deployment": "embedding", "endpoint": "https://eastus.example.com", "api_key": "k1"},
+    ]))
+
+    assert [d.name for d in deployments["images"]] == ["eastus/dall-e-3", "swedencentral/dall-e-3"]
+    assert deployments["images"][0].weight == 2
+    assert deployments["chat"][0].policy.tokens.enabled
+
+    with pytest.raises(ValueError, match="No embeddings deployment"):
+        load_deployments([{"kind": "chat", "deployment": "gpt-4", "endpoint": "https://x", "api_key": "k"},
+                          {"kind": "images", "deployment": "dall-e-3", "endpoint": "https://x", "api_key": "k"}])
+    with pytest.raises(ValueError, match="Unknown deployment kind"):
+        load_deployments([{"kind": "audio", "deployment": "whisper", "endpoint": "https://x", "api_key": "k"}])
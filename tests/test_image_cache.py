@@ -0,0 +1,52 @@
+import asyncio
+
+from src.utils.image_cache import ImageCache
+from src.utils.singleflight import SingleFlight
+
+
+def _stage(cache: ImageCache, size: int) -> str:
+    path = cache.staging_path()
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_key_normalizes_prompt_but_not_parameters():
+    key = ImageCache.key("A  red boat\n at dawn", "1024x1024", "standard", "natural")
+
+    assert key == ImageCache.key("a red boat at dawn ", "1024x1024", "standard", "natural")
+    assert key != ImageCache.key("a red boat at dawn", "1024x1024", "hd", "natural")
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+    for key in ("a" * 64, "b" * 64):
+        cache.put(key, _stage(cache, 100))
+
+    assert cache.get("a" * 64)
+    cache.put("c" * 64, _stage(cache, 100))
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) and cache.get("c" * 64)
+    assert cache.total_bytes == 200
+    assert len(ImageCache(str(tmp_path), max_bytes=250)) == 2
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(10)))
+        return results, await flights.do("key", work)
+
+    results, later = asyncio.run(run())
+
+    assert results == ["result"] * 10
+    assert later == "result"
+    assert len(calls) == 2
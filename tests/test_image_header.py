@@ -0,0 +1,36 @@
+import io
+
+import pytest
+from PIL import Image
+
+from src.utils.image_header import has_image_trailer, parse_image_header
+
+
+def _encode(image_format: str, size=(300, 200)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG"])
+def test_reads_dimensions_from_the_header(image_format):
+    data = _encode(image_format)
+
+    assert parse_image_header(data) == (image_format, 300, 200)
+    assert has_image_trailer(image_format, data[-16:])
+    assert not has_image_trailer(image_format, data[:-20][-16:])
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG"])
+def test_asks_for_more_bytes_until_the_header_is_complete(image_format):
+    data = _encode(image_format)
+
+    assert parse_image_header(data[:6]) is None
+    assert parse_image_header(data[:20]) is None
+
+
+def test_rejects_other_formats():
+    with pytest.raises(ValueError):
+        parse_image_header(b"GIF89a\x00\x00\x00\x00")
+    with pytest.raises(ValueError):
+        parse_image_header(b"<html>")
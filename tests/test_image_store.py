@@ -0,0 +1,112 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.stub_s3 import StubS3Server
+from src.routes.responses import StoredImageResponse
+from src.utils.image_store import ImageStore, LocalImageStore, S3ImageStore
+
+
+@pytest.fixture
+def s3():
+    with StubS3Server() as server:
+        yield server
+
+
+@pytest.fixture(params=["local", "s3"])
+def image_store(request, tmp_path):
+    if request.param == "local":
+        store = LocalImageStore(str(tmp_path / "store"))
+        yield store
+    else:
+        server = request.getfixturevalue("s3")
+        store = S3ImageStore(server.endpoint, server.bucket, server.access_key, server.secret_key)
+        yield store
+    store.close()
+
+
+def test_keys_are_sharded_by_file_name(tmp_path):
+    store = LocalImageStore(str(tmp_path))
+    keys = {store.key_for(f"image_{i}.png") for i in range(200)}
+
+    assert all(len(key.split("/")) == 3 and key.endswith(".png") for key in keys)
+    assert len({key.split("/")[0] for key in keys}) > 100
+    assert store.key_for("image_1.png") == store.key_for("image_1.png")
+    with pytest.raises(ValueError):
+        store.path("../outside.png")
+
+
+def test_put_stat_read_fetch_and_delete(image_store, tmp_path):
+    source = tmp_path / "image_1.png"
+    content = bytes(range(256)) * 2048
+    source.write_bytes(content)
+    key = image_store.key_for(source.name)
+
+    image_store.put(str(source), key)
+
+    assert not source.exists()
+    image = image_store.stat(key)
+    assert image.size == len(content) and image.etag.startswith('"')
+    assert b"".join(image_store.read(key)) == content
+    assert b"".join(image_store.read(key, 1000, 300000)) == content[1000:300000]
+    image_store.fetch(key, str(tmp_path / "copy.png"))
+    assert (tmp_path / "copy.png").read_bytes() == content
+
+    image_store.delete(key)
+    assert image_store.stat(key) is None and not image_store.exists(key)
+    image_store.delete(key)
+
+
+def test_local_store_keeps_serving_legacy_absolute_paths(tmp_path):
+    legacy = tmp_path / "approved" / "image_1.png"
+    legacy.parent.mkdir()
+    legacy.write_bytes(b"png")
+
+    store = LocalImageStore(str(tmp_path / "store"))
+    assert store.exists(str(legacy)) and store.path(str(legacy)) == str(legacy)
+
+
+def test_s3_store_signs_requests(s3, tmp_path):
+    source = tmp_path / "image_1.png"
+    source.write_bytes(b"png")
+    good = S3ImageStore(s3.endpoint, s3.bucket, s3.access_key, s3.secret_key, prefix="app")
+    bad = S3ImageStore(s3.endpoint, s3.bucket, s3.access_key, "wrong-secret")
+
+    good.put(str(source), "ab/cd/image_1.png")
+    assert list(s3.objects) == ["app/ab/cd/image_1.png"]
+    assert s3.objects["app/ab/cd/image_1.png"][1] == "image/png"
+    with pytest.raises(httpx.HTTPStatusError):
+        bad.stat("ab/cd/image_1.png")
+    assert good.path("ab/cd/image_1.png") is None
+    good.close()
+    bad.close()
+
+
+def test_response_hands_local_files_to_the_server(tmp_path):
+    store = LocalImageStore(str(tmp_path))
+    source = tmp_path / "image_1.png"
+    source.write_bytes(b"0123456789")
+    key = store.key_for(source.name)
+    store.put(str(source), key)
+    messages = []
+
+    async def send(message):
+        messages.append(dict(message, file=message["file"].name) if "file" in message else message)
+
+    response = StoredImageResponse(store, key, "image/png", 2, 6, 206, {"Content-Length": "4"})
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.zerocopysend": {}}}
+    asyncio.run(response(scope, None, send))
+
+    assert messages[0]["status"] == 206
+    assert messages[1] == {"type": "http.response.zerocopysend", "file": store.path(key),
+                           "offset": 2, "count": 4, "more_body": False}
+
+
+def test_incomplete_backend_fails_when_constructed():
+    class WriteOnlyStore(ImageStore):
+        def put(self, local_path, key):
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnlyStore()
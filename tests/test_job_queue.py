@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from src.services.image_service import ImageService
+from src.services.job_service import JobService
+from src.utils.job_queue import (IdempotencyKeyReused, JobQueue,
+                                 LeaseLostError, TaskCheckpoint)
+from src.utils.path_manager import PathManager
+from src.utils.prompt_store import SQLitePromptStore
+
+
+class FakeAgent:
+    """Agent whose image requests are counted, standing in for paid DALL-E calls."""
+
+    def __init__(self):
+        self.requests = 0
+        self.downloads = []
+
+    async def generate_images(self, prompt, save_paths, image_urls=None, on_requested=None, **kwargs):
+        for path in save_paths:
+            url = (image_urls or {}).get(path)
+            if url is None:
+                self.requests += 1
+                url = f"https://images.example/{self.requests}.png"
+                await on_requested({path: url})
+            self.downloads.append(url)
+            Image.new("RGB", (64, 64), "teal").save(path, format="PNG")
+        return list(save_paths)
+
+
+class FakePromptService:
+    def __init__(self, store):
+        self.store = store
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    store.add_many([{"prompt": "a lighthouse in a storm at night", "approved": False, "image_path": None,
+                     "status": "pending", "created_at": "2025-05-01T10:00:00", "topic": "sea"}])
+    yield store
+    store.close()
+
+
+def test_claims_respect_the_per_job_limit(queue):
+    job_id = queue.enqueue({"1": "one", "2": "two", "3": "three"})
+
+    first = queue.claim("worker-a", max_per_job=2)
+    second = queue.claim("worker-b", max_per_job=2)
+    assert [first["prompt_id"], second["prompt_id"]] == ["1", "2"]
+    assert queue.claim("worker-a", max_per_job=2) is None
+
+    assert not queue.complete(first["task_id"], "worker-a", ["/tmp/1.png"])
+    third = queue.claim("worker-a", max_per_job=2)
+    assert third["prompt_id"] == "3"
+    assert not queue.fail(third["task_id"], "worker-a", "content policy", "BadRequestError")
+    assert queue.complete(second["task_id"], "worker-b", ["/tmp/2.png"])
+
+    job = queue.get_job(job_id)
+    assert job["status"] == "partial" and job["finished_at"]
+    assert (job["completed"], job["failed"]) == (2, 1)
+    assert job["items"]["1"]["image_path"] == "/tmp/1.png"
+    assert job["items"]["3"]["error"] == "content policy"
+
+
+def test_idempotency_key_returns_the_original_job(queue):
+    job_id = queue.enqueue({"1": "one"}, idempotency_key="abc")
+
+    assert queue.enqueue({"1": "one"}, idempotency_key="abc") == job_id
+    assert queue.count() == 1
+    with pytest.raises(IdempotencyKeyReused):
+        queue.enqueue({"2": "two"}, idempotency_key="abc")
+
+
+def test_expired_lease_moves_the_task_to_another_worker(queue):
+    queue.enqueue({"1": "one"})
+    task = queue.claim("worker-a", lease_seconds=0.01)
+    time.sleep(0.02)
+
+    taken_over = queue.claim("worker-b")
+    assert taken_over["task_id"] == task["task_id"] and taken_over["attempts"] == 2
+    with pytest.raises(LeaseLostError):
+        queue.complete(task["task_id"], "worker-a", ["/tmp/1.png"])
+    with pytest.raises(LeaseLostError):
+        asyncio.run(TaskCheckpoint(queue=queue, task_id=task["task_id"], worker="worker-a").save("requested"))
+
+    # A task that keeps losing its worker is eventually given up
+    queue.release("worker-b")
+    queue.claim("worker-c", lease_seconds=0.01)
+    time.sleep(0.02)
+    assert queue.claim("worker-d") is None
+    failed = queue.get_task(task["task_id"])
+    assert failed["status"] == "failed" and failed["error_type"] == "LeaseExpired"
+
+
+def test_crashed_task_resumes_without_paying_again(tmp_path, queue, store):
+    agent = FakeAgent()
+    path_manager = PathManager(str(tmp_path))
+    images = ImageService(agent, FakePromptService(store), path_manager)
+    job_id = queue.enqueue({"1": "a lighthouse in a storm at night"}, num_candidates=2)
+
+    # A worker pays for the images, checkpoints their URLs and dies before downloading them
+    task = queue.claim("crashed-worker", lease_seconds=0.01)
+    save_paths = [str(tmp_path / "image_1_0.png"), str(tmp_path / "image_1_1.png")]
+    checkpoint = TaskCheckpoint(queue=queue, task_id=task["task_id"], worker="crashed-worker", lease_seconds=0.01)
+    asyncio.run(checkpoint.save(
+        "requested", save_paths=save_paths, urls={path: f"https://images.example/paid/{i}.png"
+                                                  for i, path in enumerate(save_paths)}
+    ))
+    time.sleep(0.02)
+
+    async def run():
+        service = JobService(images, FakePromptService(store), queue=queue, poll_interval=0.01)
+        await service.start()
+        finished = await service.wait_for_task(task["task_id"])
+        await service.shutdown()
+        return finished
+
+    finished = asyncio.run(run())
+
+    assert agent.requests == 0
+    assert agent.downloads == ["https://images.example/paid/0.png", "https://images.example/paid/1.png"]
+    image_keys = [images.image_store.key_for(os.path.basename(path)) for path in save_paths]
+    assert finished["status"] == "completed" and finished["stage"] == "recorded"
+    assert finished["image_paths"] == image_keys
+    assert all(images.image_store.exists(key) for key in image_keys)
+    assert queue.get_job(job_id)["status"] == "completed"
+    record = store.get("1")
+    assert record["status"] == "generated"
+    assert [candidate["image_path"] for candidate in record["candidates"]] == image_keys
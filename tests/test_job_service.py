@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from src.config.constants import SchedulerConfig
+from src.services.job_service import JobService
+from src.utils.job_queue import JobQueue
+from src.utils.prompt_store import SQLitePromptStore
+from src.utils.scheduler import SchedulerOverloaded
+
+
+class FakeImageService:
+    def __init__(self, delay: float = 0.05, fail_ids=()):
+        self.delay = delay
+        self.fail_ids = set(fail_ids)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def generate_candidates(self, prompt_id: str, prompt: str, num_candidates=None, checkpoint=None):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if prompt_id in self.fail_ids:
+                raise RuntimeError("content policy violation")
+            return [f"/tmp/image_{prompt_id}.png"]
+        finally:
+            self.in_flight -= 1
+
+
+class FakePromptService:
+    def __init__(self, store):
+        self.store = store
+
+
+PROMPTS = {
+    str(i): {"prompt": f"prompt {i}", "approved": False, "image_path": None,
+             "created_at": "2025-04-28T23:00:32", "topic": "ocean" if i <= 6 else "forest",
+             "status": "pending" if i != 2 else "generated"}
+    for i in range(1, 9)
+}
+
+
+@pytest.fixture
+def prompt_service(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    store.import_records(PROMPTS)
+    yield FakePromptService(store)
+    store.close()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    queue.close()
+
+
+async def _run_to_completion(service: JobService, **kwargs):
+    job = await service.submit(**kwargs)
+    while not job["finished_at"]:
+        await asyncio.sleep(0.01)
+        job = await service.get_job(job["job_id"])
+    await service.shutdown()
+    return job
+
+
+def test_topic_job_generates_pending_prompts_within_concurrency_limit(prompt_service, queue):
+    images = FakeImageService()
+    service = JobService(images, prompt_service, max_concurrency=2, queue=queue)
+
+    job = asyncio.run(_run_to_completion(service, topic="ocean"))
+
+    assert job["status"] == "completed"
+    assert sorted(job["items"]) == ["1", "3", "4", "5", "6"]
+    assert job["completed"] == 5
+    assert images.peak_in_flight == 2
+
+
+def test_partial_failures_are_reported_per_item(prompt_service, queue):
+    images = FakeImageService(fail_ids={"7"})
+    service = JobService(images, prompt_service, queue=queue)
+
+    job = asyncio.run(_run_to_completion(service, prompt_ids=["7", "8"]))
+
+    assert job["status"] == "partial"
+    assert job["items"]["7"]["status"] == "failed"
+    assert "content policy" in job["items"]["7"]["error"]
+    assert job["items"]["8"]["image_path"] == "/tmp/image_8.png"
+    assert asyncio.run(service.get_job(job["job_id"])) == job
+
+
+def test_rejects_unknown_prompts_and_ambiguous_requests(prompt_service, queue):
+    service = JobService(FakeImageService(), prompt_service, queue=queue)
+
+    with pytest.raises(KeyError):
+        asyncio.run(service.submit(prompt_ids=["1", "99"]))
+    with pytest.raises(ValueError):
+        asyncio.run(service.submit(prompt_ids=["1"], topic="ocean"))
+
+
+def test_replays_are_admitted_while_the_queue_is_full(prompt_service, queue, monkeypatch):
+    monkeypatch.setattr(SchedulerConfig, "MAX_QUEUED_BULK_TASKS", 2)
+    # No local worker: the tasks stay queued
+    service = JobService(FakeImageService(), prompt_service, queue=queue, worker_concurrency=0)
+
+    job = asyncio.run(service.submit(prompt_ids=["1", "3"], idempotency_key="batch"))
+    with pytest.raises(SchedulerOverloaded):
+        asyncio.run(service.submit(prompt_ids=["4"], idempotency_key="other"))
+
+    assert asyncio.run(service.submit(prompt_ids=["1", "3"], idempotency_key="batch"))["job_id"] == job["job_id"]
@@ -0,0 +1,61 @@
+import json
+import logging
+import queue
+
+from src.utils.logger import (BatchedRotatingFileHandler, BatchingQueueListener,
+                              CustomJsonFormatter, SamplingFilter)
+
+
+def _logger(name: str, log_queue) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def test_listener_writes_structured_records_and_flushes(tmp_path):
+    log_file = tmp_path / "app.log"
+    handler = BatchedRotatingFileHandler(str(log_file))
+    handler.setFormatter(CustomJsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(log_queue, [handler], batch_size=8)
+    listener.start()
+    logger = _logger("test-structured", log_queue)
+
+    for attempt in range(20):
+        logger.info("Retrying failed call", extra={"prompt_id": "7", "attempt": attempt})
+    assert listener.flush()
+
+    lines = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert len(lines) == 20
+    assert lines[3]["message"] == "Retrying failed call"
+    assert lines[3]["prompt_id"] == "7" and lines[3]["attempt"] == 3
+
+    logger.warning("last words")
+    listener.stop()
+    assert "last words" in log_file.read_text().splitlines()[-1]
+
+
+def test_handler_rotates_by_size_and_age(tmp_path):
+    log_file = tmp_path / "app.log"
+    handler = BatchedRotatingFileHandler(str(log_file), max_bytes=200, backup_count=3, max_age=3600)
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "x" * 80, None, None)
+
+    handler.emit_batch([record] * 5)
+    assert (tmp_path / "app.log.1").exists()
+
+    handler._opened_at -= 7200
+    handler.emit_batch([record])
+    assert log_file.read_text() == "x" * 80 + "\n"
+    handler.close()
+
+
+def test_sampling_keeps_a_fraction_of_debug_records():
+    sampler = SamplingFilter(rate=0.0)
+    debug = logging.LogRecord("app", logging.DEBUG, __file__, 1, "noisy", None, None)
+    info = logging.LogRecord("app", logging.INFO, __file__, 1, "kept", None, None)
+
+    assert not sampler.filter(debug)
+    assert sampler.filter(info)
+    assert SamplingFilter(rate=1.0).filter(debug)
@@ -0,0 +1,66 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.config.constants import MetricsConfig
+from src.routes.api_routes import metrics_router
+from src.routes.middleware import timing_middleware
+from src.utils.metrics import (MetricsRegistry, record_request_timings,
+                               server_timing_header, span)
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    retries = registry.counter("retries_total", "Retries", ("deployment",))
+    size = registry.gauge("store_size", "Prompts")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    retries.inc(deployment='dall-e "3"')
+    retries.inc(2, deployment='dall-e "3"')
+    size.set_function(lambda: 42)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE retries_total counter" in text
+    assert 'retries_total{deployment="dall-e \\"3\\""} 3' in text
+    assert "store_size 42" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert latency.count() == 3
+
+
+def test_spans_are_collected_per_request():
+    with record_request_timings() as timings:
+        with span("download"):
+            pass
+        with span("download"):
+            pass
+    with span("outside"):
+        pass
+
+    assert [stage for stage, _ in timings] == ["download", "download"]
+    header = server_timing_header(timings, 0.25)
+    assert header.startswith("download;dur=") and header.endswith("total;dur=250.0")
+
+
+def test_metrics_endpoint_and_timing_header(monkeypatch):
+    monkeypatch.setattr(MetricsConfig, "TIMING_HEADERS", True)
+    app = FastAPI()
+    app.include_router(metrics_router)
+    app.middleware("http")(timing_middleware)
+
+    @app.get("/work")
+    async def work():
+        with span("store_write"):
+            return {"ok": True}
+
+    client = TestClient(app)
+    assert "store_write;dur=" in client.get("/work").headers["server-timing"]
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'imagegen_http_request_seconds_count{method="GET",route="/work",status="200"} 1' in response.text
+    assert 'imagegen_stage_seconds_bucket{stage="store_write",le="+Inf"}' in response.text
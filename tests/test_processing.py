@@ -0,0 +1,116 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, PngImagePlugin
+
+from src.services.processing_service import ProcessingService
+from src.utils.image_processing import (difference_hash, hamming_distances,
+                                       image_quality, process_image)
+from src.utils.image_store import LocalImageStore
+from src.utils.path_manager import PathManager
+from src.utils.prompt_store import SQLitePromptStore
+
+
+def _write_png(path: str, color: str = "teal") -> None:
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Software", "generator")
+    Image.new("RGB", (512, 256), color).save(path, format="PNG", pnginfo=info)
+
+
+def test_process_image_strips_metadata_and_writes_variants(tmp_path):
+    source = str(tmp_path / "image_1.png")
+    _write_png(source)
+    os.link(source, str(tmp_path / "cached.png"))
+
+    result = process_image(source, str(tmp_path), 128, ["webp"], 80, 60)
+
+    with Image.open(result["image_path"]) as image:
+        assert "Software" not in image.info
+    with Image.open(result["variants"]["thumbnail"]) as thumbnail:
+        assert thumbnail.size == (128, 64)
+    assert os.path.exists(result["variants"]["webp"])
+    assert (result["width"], result["height"]) == (512, 256)
+    # The hard-linked copy keeps its original bytes
+    with Image.open(str(tmp_path / "cached.png")) as cached:
+        assert cached.info["Software"] == "generator"
+
+
+def test_difference_hash_is_stable_under_resizing():
+    gradient = Image.linear_gradient("L").rotate(-90).convert("RGB")
+
+    assert difference_hash(gradient) == difference_hash(gradient.resize((64, 64)))
+    assert difference_hash(gradient) != difference_hash(gradient.transpose(Image.FLIP_LEFT_RIGHT))
+
+
+def test_service_stores_the_processed_image_and_its_variants(tmp_path):
+    path_manager = PathManager(str(tmp_path))
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    image_store = LocalImageStore(path_manager.image_store_dir)
+    prompt_id = next(iter(store.add_many([{
+        "prompt": "p", "approved": False, "image_path": None,
+        "status": "generated", "created_at": "now", "topic": "t"
+    }])))
+    key = image_store.key_for("image_1.png")
+    source = os.path.join(path_manager.image_ingest_dir, "image_1.png")
+    _write_png(source)
+    image_store.put(source, key)
+
+    async def run():
+        service = ProcessingService(store, path_manager, executor=ThreadPoolExecutor(1), image_store=image_store)
+        await service.submit(prompt_id, [key])
+        await service.wait(prompt_id)
+        await service.close()
+
+    asyncio.run(run())
+
+    record = store.get(prompt_id)
+    assert record["processing"] == "done"
+    assert record["image_path"] == key
+    assert set(record["variants"]) >= {"thumbnail", "webp"}
+    assert all(image_store.exists(variant) for variant in record["variants"].values())
+    with Image.open(image_store.path(key)) as image:
+        assert "Software" not in image.info
+    assert not os.listdir(path_manager.image_process_dir)
+
+
+def test_quality_scores_separate_blank_from_detailed_images():
+    blank = image_quality(Image.new("RGB", (256, 256), "navy"))
+    banded = image_quality(Image.linear_gradient("L").quantize(4).convert("RGB"))
+    detailed = image_quality(Image.effect_noise((256, 256), 64).convert("RGB"))
+
+    assert blank == {"sharpness": 0.0, "entropy": 0.0}
+    assert banded["entropy"] <= 2.0
+    assert detailed["sharpness"] > 1000 and detailed["entropy"] > 7
+    assert list(hamming_distances("00000000000000ff", ["00000000000000ff", "0000000000000000", "f" * 16])) == [0, 8, 56]
+
+
+def test_score_flags_blank_images_and_near_duplicates_of_approved_ones(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    noise = Image.effect_noise((256, 256), 64).convert("RGB")
+    noise.save(str(tmp_path / "noise.png"))
+    noise.resize((300, 300)).save(str(tmp_path / "resized.png"))
+    Image.new("RGB", (256, 256), "navy").save(str(tmp_path / "blank.png"))
+    approved_id = next(iter(store.add_many([{
+        "prompt": "p", "approved": True, "image_path": "ab/cd/image_1.png", "status": "approved",
+        "created_at": "now", "topic": "t", "phash": difference_hash(noise)
+    }])))
+
+    async def run():
+        service = ProcessingService(store, PathManager(str(tmp_path)), executor=ThreadPoolExecutor(2))
+        scores = await service.score("2", [str(tmp_path / name) for name in ("resized.png", "blank.png")])
+        own = await service.score(approved_id, [str(tmp_path / "noise.png")])
+        # Decisions update the hashes read from the store; the store is not read again
+        store.update(approved_id, approved=False, status="rejected")
+        service.record_approvals({approved_id: None, "3": difference_hash(noise)})
+        elsewhere = await service.score("2", [str(tmp_path / "resized.png")])
+        await service.close()
+        return scores, own, elsewhere
+
+    (resized, blank), (own,), (elsewhere,) = asyncio.run(run())
+
+    assert resized["near_duplicate_of"] == approved_id and resized["reasons"] == ["near_duplicate"]
+    assert blank["reasons"] == ["blurry", "blank"] and not blank["passed"]
+    # An approved image is not a duplicate of itself
+    assert own["passed"] and own["reasons"] == []
+    assert elsewhere["near_duplicate_of"] == "3"
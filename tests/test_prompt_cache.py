@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services.prompt_service import PromptService
+from src.utils.path_manager import PathManager
+from src.utils.prompt_cache import PromptCache
+from src.utils.prompt_store import SQLitePromptStore
+
+
+class FakeAgent:
+    def __init__(self):
+        self.calls = []
+
+    async def generate_prompts(self, topic: str, n: int = 10):
+        self.calls.append(n)
+        await asyncio.sleep(0.01)
+        return [f"{topic} prompt {len(self.calls)}.{i}" for i in range(n)]
+
+
+def _record(prompt, topic, image_path=None, status="pending"):
+    return {"prompt": prompt, "approved": False, "image_path": image_path, "status": status,
+            "created_at": "2025-04-28T23:00:32", "topic": topic}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    yield store
+    store.close()
+
+
+def _service(store, tmp_path, ttl=60.0, top_up=False):
+    return PromptService(FakeAgent(), store, PathManager(str(tmp_path)),
+                         prompt_cache=PromptCache(ttl, max_entries=16), top_up=top_up)
+
+
+def test_repeated_topics_return_the_cached_batch(store, tmp_path):
+    service = _service(store, tmp_path)
+
+    first = asyncio.run(service.generate_prompts("Ocean  Waves", 3))
+    store.update(next(iter(first)), status="generated")
+    again = asyncio.run(service.generate_prompts(" ocean waves", 3))
+    other_size = asyncio.run(service.generate_prompts("ocean waves", 2))
+
+    assert list(again) == list(first)
+    assert again[next(iter(first))]["status"] == "generated"
+    assert set(other_size).isdisjoint(first)
+    assert service.agent.calls == [3, 2]
+
+
+def test_expired_batches_are_generated_again(store, tmp_path):
+    service = _service(store, tmp_path, ttl=0.05)
+
+    first = asyncio.run(service.generate_prompts("ocean", 2))
+    time.sleep(0.06)
+    second = asyncio.run(service.generate_prompts("ocean", 2))
+
+    assert set(first).isdisjoint(second)
+    assert service.agent.calls == [2, 2]
+
+
+def test_concurrent_identical_requests_share_one_generation(store, tmp_path):
+    service = _service(store, tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(service.generate_prompts("ocean", 4) for _ in range(5)))
+
+    batches = asyncio.run(run())
+
+    assert service.agent.calls == [4]
+    assert all(list(batch) == list(batches[0]) for batch in batches)
+    assert store.count() == 4
+
+
+def test_top_up_hands_out_unused_prompts_before_generating(store, tmp_path):
+    unused = store.add_many([_record("calm sea", "Ocean"), _record("stormy sea", "ocean ")])
+    store.add_many([
+        _record("sea with image", "ocean", image_path="ab/cd/image_1.png", status="generated"),
+        _record("forest", "forest"),
+    ])
+    service = _service(store, tmp_path, top_up=True)
+
+    batch = asyncio.run(service.generate_prompts("ocean", 5))
+
+    assert list(batch)[:2] == list(unused)
+    assert len(batch) == 5
+    assert service.agent.calls == [3]
+
+
+def test_invalid_requests_are_rejected_before_the_cache(store, tmp_path):
+    store.add_many([_record(f"sea {i}", "ocean") for i in range(30)])
+    service = _service(store, tmp_path, top_up=True)
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.generate_prompts("ocean", 25))
+    assert service.agent.calls == []
+
+
+def test_cache_drops_the_least_recently_used_batches():
+    cache = PromptCache(ttl=60, max_entries=2)
+    cache.put(PromptCache.key("ocean", 1), ["1"])
+    cache.put(PromptCache.key("forest", 1), ["2"])
+    cache.get(PromptCache.key("OCEAN", 1))
+    cache.put(PromptCache.key("desert", 1), ["3"])
+
+    assert cache.get(PromptCache.key("ocean", 1)) == ["1"]
+    assert cache.get(PromptCache.key("forest", 1)) is None
+    assert len(cache) == 2
@@ -0,0 +1,210 @@
+import json
+import multiprocessing
+
+import pytest
+
+from src.utils.prompt_store import (CONFLICT, NOT_FOUND, UPDATED,
+                                    ConcurrentUpdateError, JsonPromptStore,
+                                    PromptStore, SQLitePromptStore,
+                                    migrate_json_to_sqlite)
+
+
+def _record(prompt: str, topic: str = "ocean", status: str = "pending") -> dict:
+    return {
+        "prompt": prompt,
+        "approved": False,
+        "image_path": None,
+        "status": status,
+        "created_at": "2025-04-28T23:00:32.619977",
+        "topic": topic
+    }
+
+
+def _open(backend: str, directory) -> PromptStore:
+    if backend == "sqlite":
+        return SQLitePromptStore(str(directory / "prompts.db"))
+    return JsonPromptStore(str(directory / "prompts.json"))
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path):
+    store = _open(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+def _hammer(backend: str, directory, worker: int, rounds: int) -> list:
+    """Add prompts and increment a shared counter from another process."""
+    store = _open(backend, directory)
+    ids = []
+    for i in range(rounds):
+        ids.extend(store.add_many([_record(f"{worker}-{i}")]))
+        while True:
+            record, version = store.get_versioned("1")
+            try:
+                store.update("1", expected_version=version, hits=record.get("hits", 0) + 1)
+                break
+            except ConcurrentUpdateError:
+                continue
+        store.update(ids[-1], status="generated")
+    store.close()
+    return ids
+
+
+def test_add_many_allocates_sequential_ids(store):
+    first = store.add_many([_record("a"), _record("b")])
+    second = store.add_many([_record("c")])
+
+    assert list(first) == ["1", "2"]
+    assert list(second) == ["3"]
+    assert store.count() == 3
+    assert store.get("2")["prompt"] == "b"
+    assert store.get("42") is None
+
+
+def test_update_changes_only_the_given_fields(store):
+    store.add_many([_record("a"), _record("b")])
+
+    assert store.update("1", status="generated", image_path="/tmp/a.png")
+    assert not store.update("99", status="generated")
+
+    assert store.get("1") == dict(_record("a"), status="generated", image_path="/tmp/a.png")
+    assert store.get("2") == _record("b")
+
+
+def test_update_with_a_stale_version_is_rejected(store):
+    store.add_many([_record("a")])
+    record, version = store.get_versioned("1")
+    assert record == _record("a")
+
+    assert store.update("1", expected_version=version, status="approved")
+    with pytest.raises(ConcurrentUpdateError):
+        store.update("1", expected_version=version, status="rejected")
+
+    assert store.get_versioned("1") == (dict(_record("a"), status="approved"), version + 1)
+    assert store.get_versioned("9") is None
+
+
+def test_update_many_applies_what_it_can_in_one_go(store):
+    store.add_many([_record("a"), _record("b"), _record("c")])
+    versions = {prompt_id: version for prompt_id, (_, version) in store.get_many_versioned(["1", "2", "9"]).items()}
+    assert sorted(versions) == ["1", "2"]
+    store.update("2", status="generated")
+
+    outcomes = store.update_many(
+        {"1": {"status": "approved", "approved": True}, "2": {"status": "rejected"}, "9": {"status": "approved"},
+         "3": {"status": "rejected"}},
+        expected_versions=versions
+    )
+
+    assert outcomes == {"1": UPDATED, "2": CONFLICT, "9": NOT_FOUND, "3": UPDATED}
+    assert store.get("1")["approved"] is True and store.get("1")["status"] == "approved"
+    assert store.get("2")["status"] == "generated"
+    assert store.get("3")["status"] == "rejected"
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "json"])
+def test_writers_in_many_processes_lose_nothing(backend, tmp_path):
+    store = _open(backend, tmp_path)
+    store.add_many([_record("counter")])
+    workers, rounds = 4, 15
+
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        batches = pool.starmap(_hammer, [(backend, tmp_path, worker, rounds) for worker in range(workers)])
+
+    ids = [prompt_id for batch in batches for prompt_id in batch]
+    assert len(set(ids)) == len(ids) == workers * rounds
+    assert store.count() == workers * rounds + 1
+    assert store.get("1")["hits"] == workers * rounds
+    assert all(record["status"] == "generated" for record in store.get_many(ids).values())
+    store.close()
+
+
+def test_find_filters_on_topic_and_status(store):
+    store.add_many([_record("a"), _record("b", status="approved"), _record("c", topic="forest")])
+
+    assert list(store.find(topic="ocean", status="pending")) == ["1"]
+    assert list(store.find(status="approved")) == ["2"]
+    assert list(store.find(topic="forest")) == ["3"]
+    assert sorted(store.get_many(["3", "1", "7"])) == ["1", "3"]
+
+
+def test_sqlite_keeps_extra_fields(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    store.add_many([dict(_record("a"), duplicate_of="7")])
+    store.update("1", score=0.5)
+
+    assert store.get("1")["duplicate_of"] == "7"
+    assert store.get("1")["score"] == 0.5
+
+
+def test_migration_imports_legacy_json_once(tmp_path):
+    legacy = {"3": _record("a"), "8": dict(_record("b"), approved=True, status="approved")}
+    json_path = tmp_path / "prompts.json"
+    json_path.write_text(json.dumps(legacy))
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+
+    assert migrate_json_to_sqlite(str(json_path), store) == 2
+    assert migrate_json_to_sqlite(str(json_path), store) == 0
+    assert store.all() == legacy
+    assert list(store.add_many([_record("c")])) == ["9"]
+
+
+def test_page_filters_and_follows_the_cursor(store):
+    records = [_record(str(i), topic="ocean" if i % 2 else "forest") for i in range(1, 8)]
+    for day, record in enumerate(records, 1):
+        record["created_at"] = f"2025-05-0{day}T12:00:00"
+    store.add_many(records)
+    store.update("3", approved=True, status="approved")
+
+    assert list(store.page(2)) == ["1", "2"]
+    assert list(store.page(2, after_id="2")) == ["3", "4"]
+    assert list(store.page(10, topic="ocean", after_id="1")) == ["3", "5", "7"]
+    assert list(store.page(10, approved=True)) == ["3"]
+    assert list(store.page(10, status="pending", topic="ocean")) == ["1", "5", "7"]
+    assert list(store.page(10, created_from="2025-05-03", created_to="2025-05-05")) == ["3", "4"]
+
+
+
+@pytest.mark.parametrize("where", ["topic = ?", "status = ?", "approved = ?"])
+def test_keyset_pages_read_an_index_in_id_order(tmp_path, where):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    plan = " ".join(row[3] for row in store._conn.execute(
+        f"EXPLAIN QUERY PLAN SELECT * FROM prompts WHERE {where} AND id > ? ORDER BY id LIMIT ?", ("x", 1, 10)
+    ))
+    store.close()
+
+    assert "USING INDEX" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_incomplete_backend_fails_when_constructed():
+    class ReadOnlyStore(PromptStore):
+        def get(self, prompt_id):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
+
+
+def test_find_unused_reads_only_the_topic_and_the_limit(store):
+    store.add_many([_record("a", topic="Ocean  Waves"), _record("b", topic="forest"),
+                    dict(_record("c", topic="ocean waves"), duplicate_of="1"),
+                    dict(_record("d", topic="ocean waves"), image_path="ab/cd/image_1.png"),
+                    _record("e", topic=" OCEAN waves"), _record("f", topic="ocean waves")])
+    store.update("2", topic="ocean waves")
+
+    assert list(store.find_unused("ocean waves", 3)) == ["1", "2", "5"]
+
+
+def test_sqlite_migration_fills_in_normalized_topics(tmp_path):
+    path = str(tmp_path / "prompts.db")
+    store = SQLitePromptStore(path)
+    store.add_many([_record("a", topic="Ocean Waves")])
+    # As created before topics were normalized
+    store._conn.execute("DROP INDEX idx_prompts_topic_key")
+    store._conn.execute("ALTER TABLE prompts DROP COLUMN topic_key")
+    store.close()
+
+    store = SQLitePromptStore(path)
+    assert list(store.find_unused("ocean waves", 10)) == ["1"]
+    store.close()
@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from src.utils.resilience import (FATAL, RETRYABLE, THROTTLED, CircuitBreaker,
+                                  CircuitOpenError, ResiliencePolicy,
+                                  classify_error, retry_after_seconds)
+
+
+def _api_error(error_class, status_code: int, headers=None, code=None):
+    request = httpx.Request("POST", "https://example.openai.azure.com/openai/deployments/dall-e-3/images/generations")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class("error", response=response, body={"code": code} if code else None)
+
+
+class FlakyCall:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_classifies_errors():
+    assert classify_error(_api_error(openai.RateLimitError, 429)) == THROTTLED
+    assert classify_error(_api_error(openai.InternalServerError, 503)) == RETRYABLE
+    assert classify_error(openai.APITimeoutError(request=httpx.Request("GET", "https://x"))) == RETRYABLE
+    assert classify_error(_api_error(openai.BadRequestError, 400, code="content_policy_violation")) == FATAL
+    assert classify_error(ValueError("bad prompt")) == FATAL
+
+
+def test_reads_retry_after_headers():
+    assert retry_after_seconds(_api_error(openai.RateLimitError, 429, {"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(_api_error(openai.RateLimitError, 429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(_api_error(openai.RateLimitError, 429)) is None
+
+
+def test_retries_throttled_calls_after_retry_after():
+    policy = ResiliencePolicy("dall-e-3", max_retries=3, backoff_base=0.001)
+    call = FlakyCall([_api_error(openai.RateLimitError, 429, {"retry-after-ms": "50"})])
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await policy.call(call)
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(run())
+
+    assert result == "ok"
+    assert call.calls == 2
+    assert elapsed >= 0.05
+    assert policy.stats["throttled"] == 1
+    assert policy.stats["retries"] == 1
+
+
+def test_does_not_retry_fatal_errors():
+    policy = ResiliencePolicy("dall-e-3", max_retries=3, backoff_base=0.001)
+    call = FlakyCall([_api_error(openai.BadRequestError, 400, code="content_policy_violation")])
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(policy.call(call))
+    assert call.calls == 1
+    assert policy.stats["fatal_errors"] == 1
+
+
+def test_circuit_opens_and_fails_fast():
+    policy = ResiliencePolicy("dall-e-3", max_retries=5, backoff_base=0.001,
+                              breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    call = FlakyCall([_api_error(openai.InternalServerError, 500) for _ in range(5)])
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(policy.call(call))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.call(call))
+
+    assert call.calls == 2
+    assert policy.snapshot()["breaker_state"] == "open"
+    assert policy.stats["breaker_rejections"] == 1
+
+
+def test_half_open_circuit_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == "closed"
@@ -0,0 +1,169 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.config.constants import ImageConfig
+from src.services.job_service import JobService
+from src.utils.job_queue import JobQueue
+from src.utils.prompt_store import SQLitePromptStore
+from src.utils.scheduler import (BULK, INTERACTIVE, SPECULATIVE,
+                                 FairScheduler, RequestDropped,
+                                 SchedulerOverloaded, Ticket, flow_key,
+                                 scheduling)
+
+
+async def _hold(scheduler: FairScheduler, ticket: Ticket, order: list, name: str, seconds: float = 0.02):
+    async with scheduler.slot(ticket):
+        order.append(name)
+        await asyncio.sleep(seconds)
+
+
+def test_interactive_calls_skip_the_bulk_backlog():
+    scheduler = FairScheduler(capacity=3, reserved=1)
+    order = []
+
+    async def run():
+        bulk = [asyncio.create_task(_hold(scheduler, Ticket(BULK, "topic:ocean"), order, f"bulk{i}", 0.05))
+                for i in range(6)]
+        await asyncio.sleep(0.01)
+        # Bulk calls only get 2 of the 3 slots, so an interactive call starts at once
+        assert scheduler.snapshot()["running"] == 2
+        await _hold(scheduler, Ticket(INTERACTIVE, "topic:forest"), order, "interactive")
+        await asyncio.gather(*bulk)
+
+    asyncio.run(run())
+
+    assert order.index("interactive") == 2
+
+
+def test_flows_share_a_class_by_weight():
+    scheduler = FairScheduler(capacity=1, weights={"topic:forest": 2})
+    order = []
+
+    async def run():
+        async with scheduler.slot(Ticket(BULK)):
+            calls = [_hold(scheduler, Ticket(BULK, "topic:ocean"), order, "ocean", 0) for _ in range(4)]
+            calls += [_hold(scheduler, Ticket(BULK, "topic:forest"), order, "forest", 0) for _ in range(4)]
+            tasks = [asyncio.create_task(call) for call in calls]
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    # The forest flow, weighing twice as much, gets two turns for each of ocean's
+    assert order == ["forest", "ocean", "forest", "forest", "ocean", "forest", "ocean", "ocean"]
+
+
+def test_calls_beyond_the_queue_limit_are_rejected():
+    scheduler = FairScheduler(capacity=1, max_queued={BULK: 2})
+
+    async def run():
+        async with scheduler.slot(Ticket(BULK)):
+            queued = [asyncio.create_task(scheduler.acquire(Ticket(BULK))) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(SchedulerOverloaded) as rejected:
+                await scheduler.acquire(Ticket(BULK))
+            # Interactive calls have their own queue
+            interactive = asyncio.create_task(scheduler.acquire(Ticket(INTERACTIVE)))
+            await asyncio.sleep(0)
+        await interactive
+        for task in queued:
+            task.cancel()
+        return rejected.value
+
+    rejected = asyncio.run(run())
+
+    assert rejected.retry_after >= 1
+    assert scheduler.stats["rejected"] == 1
+
+
+def test_calls_of_departed_clients_are_dropped_when_their_turn_comes():
+    scheduler = FairScheduler(capacity=1)
+    order = []
+
+    async def gone() -> bool:
+        return True
+
+    async def run():
+        async with scheduler.slot(Ticket(INTERACTIVE)):
+            with scheduling(INTERACTIVE, "key:a", is_disconnected=gone):
+                dropped = asyncio.create_task(_hold(scheduler, None, order, "gone"))
+            kept = asyncio.create_task(_hold(scheduler, Ticket(INTERACTIVE, "key:b"), order, "kept"))
+            await asyncio.sleep(0)
+        with pytest.raises(RequestDropped):
+            await dropped
+        await kept
+
+    asyncio.run(run())
+
+    assert order == ["kept"]
+    assert scheduler.snapshot() == {"admitted": 2, "rejected": 0, "dropped": 1, "running": 0,
+                                    "queued": {INTERACTIVE: 0, BULK: 0, SPECULATIVE: 0}}
+
+
+def test_queue_claims_interactive_tasks_first_then_the_least_served_flow(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    ocean = flow_key(topic="Ocean")
+    queue.enqueue({str(i): f"ocean {i}" for i in range(4)}, flows={str(i): ocean for i in range(4)})
+    queue.enqueue({"f1": "forest 1", "f2": "forest 2"}, flows={"f1": "topic:forest", "f2": "topic:forest"})
+    queue.enqueue({"i1": "interactive"}, priority=INTERACTIVE, flows={"i1": ocean})
+
+    claimed = [queue.claim("w", max_per_job=10)["prompt_id"] for _ in range(5)]
+
+    assert claimed == ["i1", "f1", "0", "f2", "1"]
+    assert queue.claim("w", priority=INTERACTIVE) is None
+    assert queue.count("queued", BULK) == 2
+    queue.close()
+
+
+def test_waiting_client_that_leaves_withdraws_its_queued_task(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    store.import_records({"1": {"prompt": "p", "approved": False, "image_path": None, "status": "pending",
+                                "created_at": "2025-04-28T23:00:32", "topic": "ocean"}})
+    # No local worker: the task stays queued
+    service = JobService(None, SimpleNamespace(store=store), queue=queue, worker_concurrency=0, poll_interval=0.01)
+    checks = []
+
+    async def gone() -> bool:
+        checks.append(True)
+        return len(checks) > 1
+
+    with pytest.raises(RequestDropped):
+        asyncio.run(service.generate_image("1", "p", idempotency_key="k", is_disconnected=gone))
+
+    assert queue.count() == 0
+    # The idempotency key is free again for a retry
+    job_id = queue.enqueue({"1": "p"}, idempotency_key="k")
+    assert queue.get_job(job_id)["status"] == "queued"
+    queue.close()
+    store.close()
+
+
+def test_speculative_jobs_stay_within_budget_and_are_adopted_once(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    prompts = {"1": "calm sea", "2": "stormy sea", "3": "tide pools"}
+
+    assert queue.speculate(prompts, "topic:ocean", "speculative:ocean", 2) == ["1", "2"]
+    assert queue.speculate({"4": "reef"}, "topic:ocean", "speculative:ocean", 2) == []
+    queue.enqueue({"5": "bulk"})
+    assert queue.claim("w")["prompt_id"] == "5"
+
+    # Images for other text are not what the client asks for
+    assert queue.adopt("1", "calm lake", None, "key:a") is None
+    assert queue.adopt("1", "calm sea", ImageConfig.NUM_CANDIDATES + 1, "key:a") is None
+    # An explicit candidate count equal to the default matches a speculative task, which uses the default
+    task_id = queue.adopt("1", "calm sea", ImageConfig.NUM_CANDIDATES, "key:a", idempotency_key="k")
+    task = queue.claim("w", priority=INTERACTIVE)
+    assert (task["task_id"], task["flow"]) == (task_id, "key:a")
+    assert queue.adopt("1", "calm sea", None, "key:b") is None
+    # A retry with the client's key finds the adopted job
+    assert queue.enqueue({"1": "calm sea"}, ImageConfig.NUM_CANDIDATES, idempotency_key="k") == task["job_id"]
+    task = queue.claim("w")
+    assert task["priority"] == SPECULATIVE
+    queue.complete(task["task_id"], "w", ["/tmp/2.png"])
+    # A completed task is only adopted while its images await review
+    assert queue.adopt("2", "stormy sea", None, "key:a") is None
+    assert queue.adopt("2", "stormy sea", None, "key:a", unreviewed=True) == task["task_id"]
+    queue.close()
@@ -0,0 +1,101 @@
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+
+from src.config.constants import SimilarityConfig
+from src.services.similarity_service import SimilarityService
+from src.utils.prompt_store import SQLitePromptStore
+from src.utils.vector_index import VectorIndex
+
+
+def _embed(texts, dimensions=256):
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, zlib.crc32(word.encode()) % dimensions] += 1
+    return vectors
+
+
+class FakeAgent:
+    def __init__(self):
+        self.embedded = 0
+
+    async def embed_texts(self, texts):
+        self.embedded += len(texts)
+        return _embed(texts)
+
+
+def _record(prompt, image_path=None, status="pending"):
+    return {"prompt": prompt, "approved": False, "image_path": image_path, "status": status,
+            "created_at": "2025-04-28T23:00:32", "topic": "ocean"}
+
+
+@pytest.fixture
+def service(tmp_path):
+    store = SQLitePromptStore(str(tmp_path / "prompts.db"))
+    yield SimilarityService(FakeAgent(), store, index=VectorIndex(str(tmp_path / "embeddings")))
+    store.close()
+
+
+def test_vector_index_top_k_and_persistence(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+    index = VectorIndex(str(tmp_path / "index"))
+    index.add([str(i) for i in range(2000)], vectors[:2000])
+    index.add([str(i) for i in range(2000, 3000)], vectors[2000:])
+
+    results = index.search(vectors[1234], k=3)
+    assert results[0][0] == "1234"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert [item_id for item_id, _ in index.search(vectors[1234], k=3, exclude=["1234"])][0] != "1234"
+
+    reloaded = VectorIndex(str(tmp_path / "index"))
+    assert len(reloaded) == 3000
+    assert reloaded.search(vectors[2999], k=1)[0][0] == "2999"
+
+
+def test_check_prompts_flags_store_duplicates_and_drops_batch_repeats(service, monkeypatch):
+    monkeypatch.setattr(SimilarityConfig, "DUPLICATE_ACTION", "flag")
+    added = service.store.add_many([_record("a red fishing boat at dawn near the harbor")])
+    asyncio.run(service.backfill())
+
+    prompts = [
+        "a red fishing boat at dawn near the harbor",
+        "divers collecting plastic from a coral reef",
+        "divers collecting plastic from a coral reef",
+    ]
+    kept, vectors, duplicates = asyncio.run(service.check_prompts(prompts))
+
+    assert kept == prompts[:2]
+    assert vectors.shape[0] == 2
+    assert duplicates[0][0] == list(added)[0]
+    assert duplicates[1] is None
+
+
+def test_check_prompts_can_reject_store_duplicates(service, monkeypatch):
+    monkeypatch.setattr(SimilarityConfig, "DUPLICATE_ACTION", "reject")
+    service.store.add_many([_record("a red fishing boat at dawn near the harbor")])
+    asyncio.run(service.backfill())
+
+    kept, _, _ = asyncio.run(service.check_prompts(["a red fishing boat at dawn near the harbor"]))
+
+    assert kept == []
+
+
+def test_find_reusable_image_returns_existing_image(service, tmp_path):
+    image_path = tmp_path / "image_1.png"
+    image_path.write_bytes(b"png")
+    service.store.add_many([
+        _record("a lighthouse in a storm at night", image_path=str(image_path), status="generated"),
+        _record("a lighthouse in a storm at night"),
+        _record("a quiet forest path in autumn"),
+    ])
+    asyncio.run(service.backfill())
+    embedded = service.agent.embedded
+
+    match = asyncio.run(service.find_reusable_image("2", "a lighthouse in a storm at night"))
+    assert match[0] == "1"
+    assert service.agent.embedded == embedded
+    assert asyncio.run(service.find_reusable_image("3", "a quiet forest path in autumn")) is None